@@ -0,0 +1,253 @@
+# Bytecode.py
+
+import sys
+from array import array
+from time import perf_counter
+from types import MappingProxyType
+
+from ExpressionParser import ExpressionParser
+from exceptions import (
+    BudgetExceededException,
+    CalculatorException,
+    InvalidTokenException,
+    MissingOperandException,
+    UndefinedVariableException,
+)
+
+# Opcodes below FIRST_OPERATOR are instructions of the machine itself, the
+# following ones are assigned to the operators of the table, in table order.
+LOAD_CONST = 0  # push consts[arg]
+LOAD_NAME = 1  # push variables[names[arg]]
+CONST_CONST_BINOP = 2  # push consts[arg1] <op arg3> consts[arg2]
+CONST_BINOP = 3  # replace top with top <op arg2> consts[arg1]
+FAIL = 4  # raise the exception described by errors[arg]
+FIRST_OPERATOR = 8
+
+NO_VARIABLES = MappingProxyType({})
+
+
+class Program:
+    """
+    A compact parsed expression.
+
+    Instructions are one byte each in ``opcodes``; the instructions that take
+    arguments read them in order from ``args``. Numbers live once each in the
+    ``consts`` pool and the stack depth is known before running.
+    """
+    __slots__ = ('opcodes', 'args', 'consts', 'names', 'errors', 'max_depth', 'symbols')
+
+    def __init__(self, opcodes, args, consts, names, errors, max_depth, symbols):
+        self.opcodes = opcodes
+        self.args = args
+        self.consts = consts
+        self.names = names
+        self.errors = errors
+        self.max_depth = max_depth
+        # Operator symbols by opcode, shared by every program of a machine
+        self.symbols = symbols
+
+    def __sizeof__(self):
+        return object.__sizeof__(self) + sys.getsizeof(self.opcodes) + sys.getsizeof(self.args) + \
+            sys.getsizeof(self.consts) + sys.getsizeof(self.names) + sys.getsizeof(self.errors)
+
+    def to_postfix(self):
+        """
+        Rebuild the postfix program.
+
+        A FAIL instruction ends the listing with the token that caused it.
+
+        :return: list
+        """
+        postfix = []
+        ai = 0
+        args = self.args
+        consts = self.consts
+        symbols = self.symbols
+        for opcode in self.opcodes:
+            if opcode >= FIRST_OPERATOR:
+                postfix.append(symbols[opcode - FIRST_OPERATOR])
+            elif opcode == LOAD_CONST:
+                postfix.append(consts[args[ai]])
+                ai += 1
+            elif opcode == CONST_BINOP:
+                postfix.extend((consts[args[ai]], symbols[args[ai + 1] - FIRST_OPERATOR]))
+                ai += 2
+            elif opcode == CONST_CONST_BINOP:
+                postfix.extend((consts[args[ai]], consts[args[ai + 1]], symbols[args[ai + 2] - FIRST_OPERATOR]))
+                ai += 3
+            elif opcode == LOAD_NAME:
+                postfix.append(self.names[args[ai]])
+                ai += 1
+            else:
+                token = self.errors[args[ai]][2]
+                if token is not None:
+                    postfix.append(token)
+                break
+        return postfix
+
+
+class BytecodeMachine:
+    def __init__(self, operators, exact=False):
+        """
+        Initialize the machine with the operator table of a parser.
+
+        :param operators: dict
+            Maps operator symbols to Operator instances.
+        :param exact: bool
+            Keep constants in a list, which holds Python ints as they are,
+            instead of a packed array of doubles.
+        """
+        self.operators = operators
+        self.exact = exact
+        self.symbols = tuple(operators)
+        self.opcodes = {symbol: FIRST_OPERATOR + i for i, symbol in enumerate(self.symbols)}
+        # Dispatch table indexed by opcode
+        self.handlers = [None] * FIRST_OPERATOR + [operators[symbol].evaluate for symbol in self.symbols]
+        self.arities = [0] * FIRST_OPERATOR + [operators[symbol].arity for symbol in self.symbols]
+
+    def assemble(self, postfix):
+        """
+        Translate a postfix program into bytecode.
+
+        Two constants followed by a binary operator, and a constant followed by a
+        binary operator, are fused into single superinstructions. Errors that the
+        postfix interpreter would raise at a given token become FAIL instructions
+        at the same place.
+
+        :param postfix: list
+            The postfix tokenized expression.
+        :return: Program
+        """
+        opcodes = array('B')
+        args = array('I')
+        consts = [] if self.exact else array('d')
+        const_index = {}
+        names = []
+        errors = []
+        depth = 0
+
+        def fail(exception_class, exception_args, token=None):
+            # The failing token is kept so that disassembling reproduces the error
+            errors.append((exception_class, exception_args, token))
+            opcodes.append(FAIL)
+            args.append(len(errors) - 1)
+
+        for token in postfix:
+            if isinstance(token, (int, float)):
+                key = token.hex() if isinstance(token, float) else token
+                if key not in const_index:
+                    const_index[key] = len(consts)
+                    consts.append(token)
+                opcodes.append(LOAD_CONST)
+                args.append(const_index[key])
+                depth += 1
+            elif isinstance(token, str) and token in self.operators:
+                arity = self.operators[token].arity
+                if depth < arity:
+                    fail(MissingOperandException, (self.operators[token].symbol,), token)
+                    break
+                if arity not in (1, 2):
+                    fail(CalculatorException, (f"Unsupported operator arity: {arity}",), token)
+                    break
+                opcodes.append(self.opcodes[token])
+                depth -= arity - 1
+                if arity == 2:
+                    self._fuse_binary(opcodes, args)
+            elif ExpressionParser.is_variable(token):
+                if token not in names:
+                    names.append(token)
+                opcodes.append(LOAD_NAME)
+                args.append(names.index(token))
+                depth += 1
+            else:
+                fail(InvalidTokenException, (token,), token)
+                break
+        else:
+            if depth != 1:
+                fail(CalculatorException, ("Invalid expression structure.",))
+
+        return Program(opcodes, args, consts, tuple(names), tuple(errors), self._max_depth(opcodes), self.symbols)
+
+    def _max_depth(self, opcodes):
+        # Fused instructions push fewer values, so the depth is measured after fusing
+        depth = max_depth = 0
+        for opcode in opcodes:
+            arity = self.arities[opcode]
+            if arity:
+                depth -= arity - 1
+            elif opcode in (LOAD_CONST, LOAD_NAME, CONST_CONST_BINOP):
+                depth += 1
+                max_depth = max(max_depth, depth)
+        return max_depth
+
+    @staticmethod
+    def _fuse_binary(opcodes, args):
+        # Peephole pass over the instructions that were just emitted
+        if len(opcodes) >= 3 and opcodes[-2] == LOAD_CONST and opcodes[-3] == LOAD_CONST:
+            operator = opcodes.pop()
+            del opcodes[-2:]
+            args.append(operator)
+            opcodes.append(CONST_CONST_BINOP)
+        elif len(opcodes) >= 2 and opcodes[-2] == LOAD_CONST:
+            operator = opcodes.pop()
+            opcodes[-1] = CONST_BINOP
+            args.append(operator)
+
+    def execute(self, program, variables=NO_VARIABLES, timeout=None):
+        """
+        Run a program on a preallocated stack.
+
+        Under a timeout, the deadline is checked before every instruction. A
+        single operator call is not interrupted: the check bounds the time
+        spent past the deadline by the cost of one operator.
+
+        :param program: Program
+        :param variables: dict, optional
+            Values of the variables used by the program.
+        :param timeout: float, optional
+            Seconds after which the evaluation is abandoned.
+        :return: float
+            The result of the calculation.
+        :raises BudgetExceededException: once the deadline has passed.
+        """
+        handlers = self.handlers
+        arities = self.arities
+        args = program.args
+        consts = program.consts
+        stack = [0.0] * program.max_depth
+        sp = 0
+        ai = 0
+        deadline = None if timeout is None else perf_counter() + timeout
+
+        for opcode in program.opcodes:
+            if deadline is not None and perf_counter() > deadline:
+                raise BudgetExceededException('deadline', perf_counter() - deadline + timeout, timeout)
+            arity = arities[opcode]
+            if arity == 2:
+                sp -= 1
+                stack[sp - 1] = handlers[opcode](stack[sp - 1], stack[sp])
+            elif arity == 1:
+                stack[sp - 1] = handlers[opcode](stack[sp - 1])
+            elif opcode == LOAD_CONST:
+                stack[sp] = consts[args[ai]]
+                sp += 1
+                ai += 1
+            elif opcode == CONST_BINOP:
+                stack[sp - 1] = handlers[args[ai + 1]](stack[sp - 1], consts[args[ai]])
+                ai += 2
+            elif opcode == CONST_CONST_BINOP:
+                stack[sp] = handlers[args[ai + 2]](consts[args[ai]], consts[args[ai + 1]])
+                sp += 1
+                ai += 3
+            elif opcode == LOAD_NAME:
+                name = program.names[args[ai]]
+                if name not in variables:
+                    raise UndefinedVariableException(name)
+                stack[sp] = variables[name]
+                sp += 1
+                ai += 1
+            else:
+                exception_class, exception_args, _ = program.errors[args[ai]]
+                raise exception_class(*exception_args)
+
+        return stack[0]
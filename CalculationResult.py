@@ -0,0 +1,58 @@
+# CalculationResult.py
+
+from exceptions import CalculatorException, UNEXPECTED_ERROR_CODE
+
+
+class CalculationResult:
+    """
+    The outcome of evaluating one expression: either a value or an error.
+
+    The error message is only rendered when ``message`` is read.
+    """
+    __slots__ = ('expression', 'value', 'error')
+
+    def __init__(self, expression, value=None, error=None):
+        self.expression = expression
+        self.value = value
+        self.error = error
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    @property
+    def code(self):
+        """
+        0 on success, the code of the calculator exception otherwise, and
+        UNEXPECTED_ERROR_CODE for any other exception.
+        """
+        if self.error is None:
+            return 0
+        return getattr(self.error, 'code', UNEXPECTED_ERROR_CODE)
+
+    @property
+    def position(self):
+        """
+        Index in the expression where the error was detected, when known.
+        """
+        return getattr(self.error, 'index', None)
+
+    @property
+    def error_class(self):
+        return type(self.error) if self.error is not None else None
+
+    @property
+    def expected(self):
+        """
+        Whether the error is a calculator exception rather than an unexpected one.
+        """
+        return isinstance(self.error, CalculatorException)
+
+    @property
+    def message(self):
+        return str(self.error) if self.error is not None else None
+
+    def __repr__(self):
+        if self.error is None:
+            return f"CalculationResult({self.expression!r}, value={self.value!r})"
+        return f"CalculationResult({self.expression!r}, error={type(self.error).__name__}, code={self.code})"
@@ -1,57 +1,582 @@
 # calculator.py
 
+import sys
+from contextlib import contextmanager
+from functools import partial
+from time import perf_counter_ns
+
+from Bytecode import BytecodeMachine
+from CalculationResult import CalculationResult
+from ExpressionCache import ExpressionCache
 from ExpressionParser import ExpressionParser
+from PostfixCompiler import PostfixCompiler, CompiledExpression, OPERATOR_TEMPLATES, UNCHECKED_TEMPLATES
 from exceptions import (
+    BudgetExceededException,
     CalculatorException,
     InvalidTokenException,
     MissingOperandException,
-    FactorialNegativeNumberException,
+    UndefinedVariableException,
 )
 
 
+_MISSING = object()
+
+
 class Calculator:
-    def __init__(self):
+    def __init__(self, cache_size=4096, cache_bytes=8 * 1024 * 1024, compile_threshold=2, optimize=False,
+                 exact=False, memo=None, bounds=None, store=None, budget=None, engine='shunting-yard'):
         """
-        Initialize the calculator with an expression parser.
+        Initialize the calculator with an expression parser and its caches.
+
+        :param cache_size: int
+            Maximum number of entries in each cache (0 disables caching).
+        :param cache_bytes: int
+            Approximate memory budget of each cache.
+        :param compile_threshold: int
+            Number of evaluations of a cached program after which it is compiled
+            into a native Python function (0 disables compilation).
+        :param optimize: bool
+            Evaluate expressions through an optimized tree: constant subtrees are
+            folded and chains of '+', '*', '$' and '&' are evaluated in one call
+            (sums with math.fsum). Optimized programs are not compiled.
+        :param exact: bool
+            Keep integer literals and integer results as exact Python ints, with no
+            float range limit; non-integer results fall back to floats.
+        :param memo: SubexpressionMemo, optional
+            Evaluate through a memo of subexpression values, which may be shared
+            with other calculators so that each distinct subterm is computed once.
+        :param bounds: dict, optional
+            Maps variable names to (low, high) intervals assumed by the range
+            analysis of compiled programs; calls with values outside them take
+            the checked path.
+        :param store: ProgramStore, optional
+            On-disk store of parsed programs, shared across processes and runs:
+            programs missing from the cache are looked up there before parsing.
+        :param budget: Budget, optional
+            Limits on the static estimate of an expression, checked before it is
+            evaluated, and on its evaluation time. Expressions under a deadline
+            are run by the bytecode machine, which checks it between operators.
+        :param engine: str
+            The parser engine: 'shunting-yard', or 'pratt' for precedence
+            climbing, which builds the same programs faster.
         """
-        self.parser = ExpressionParser()
+        self.exact = exact
+        self.memo = memo
+        if engine == 'pratt':
+            from PrattParser import PrattParser
+            self.parser = PrattParser(exact)
+        elif engine == 'shunting-yard':
+            self.parser = ExpressionParser(exact)
+        else:
+            raise ValueError(f"Unknown parser engine: {engine}")
+        self.machine = BytecodeMachine(self.parser.operators, exact)
+        # The inline templates implement the float semantics only
+        self.compiler = PostfixCompiler(self.parser.operators, {} if exact else OPERATOR_TEMPLATES)
+        self.unchecked_compiler = PostfixCompiler(self.parser.operators, UNCHECKED_TEMPLATES)
+        self.bounds = bounds
+        self.store = store
+        self.budget = budget
+        self.compile_threshold = compile_threshold
+        self.optimize = optimize
+        # Normalized expression -> compiled expression
+        self.program_cache = ExpressionCache(cache_size, cache_bytes)
+        # Normalized expression -> final result
+        self.result_cache = ExpressionCache(cache_size, cache_bytes)
+        # Profiler receiving the measurements, None when profiling is off
+        self.profiler = None
+        self._profiled_machine = None
 
-    def calculate(self, expression):
+    def calculate(self, expression, **variables):
         """
-        Evaluate the given mathematical expression.
+        Evaluate the given mathematical expression, printing any error.
 
         :param expression: str
             The mathematical expression to evaluate.
+        :param variables: float
+            Values of the variables used by the expression.
         :return: float
-            The result of the calculation.
+            The result of the calculation, None on error.
+        """
+        result = self.evaluate(expression, **variables)
+        if result.ok:
+            return result.value
+        if result.expected:
+            print(f"Error: {result.message}")
+        else:
+            print(f"Unexpected error: {result.message}")
+        return None
+
+    def evaluate(self, expression, **variables):
+        """
+        Evaluate the given expression without raising or printing.
+
+        :param expression: str
+            The mathematical expression to evaluate.
+        :param variables: float
+            Values of the variables used by the expression.
+        :return: CalculationResult
+            The value, or the error with its code and position.
         """
         try:
-            # Step 1: Parse the expression into postfix notation
-            postfix = self.parser.parse_expression(expression)
+            return CalculationResult(expression, self.compute(expression, **variables))
+        except Exception as e:
+            return CalculationResult(expression, error=e)
 
-            # Step 2: Evaluate the postfix expression
-            result = self.evaluate_postfix(postfix)
+    def compute(self, expression, **variables):
+        """
+        Evaluate the given expression without handling errors.
 
+        :param expression: str
+            The mathematical expression to evaluate.
+        :param variables: float
+            Values of the variables used by the expression.
+        :return: float
+            The result of the calculation.
+        :raises CalculatorException: if the expression is invalid.
+        """
+        if self.profiler is not None:
+            return self._profiled_compute(expression, variables)
+        key = ExpressionCache.normalize(expression)
+
+        # Only expressions without variables are stored in the result cache
+        result = self.result_cache.get(key, _MISSING)
+        if result is not _MISSING:
             return result
-        except FactorialNegativeNumberException as e:
-            # Handle specific exception for negative factorials
-            print(f"Error: {e}")
-            return None
-        except CalculatorException as e:
-            # Handle general calculator exceptions
-            print(f"Error: {e}")
+
+        program = self.get_program(expression, key)
+
+        # Step 2: Evaluate the program
+        result = self.run_program(program, variables)
+        if not program.variables:
+            self.result_cache.put(key, result)
+        return result
+
+    def get_program(self, expression, key=None):
+        """
+        Return the cached program of an expression, parsing it on a miss.
+
+        :param expression: str
+            The mathematical expression.
+        :param key: str, optional
+            The normalized expression, when already computed.
+        :return: CompiledExpression
+        """
+        if key is None:
+            key = ExpressionCache.normalize(expression)
+        program = self.program_cache.get(key)
+        if program is None:
+            # Step 1: Parse the expression and assemble it into bytecode
+            postfix = self.parse(expression, key)
+            program = self.make_program(postfix, self.machine.assemble(postfix))
+            self.program_cache.put(key, program)
+        return program
+
+    def parse(self, expression, key):
+        """
+        Parse an expression into postfix, through the program store if any.
+
+        :param expression: str
+            The mathematical expression.
+        :param key: str
+            The normalized expression.
+        :return: list
+            The postfix tokenized expression.
+        """
+        if self.store is None:
+            return self.parser.parse_expression(expression)
+        store_key = self.store.key(key, self.exact)
+        postfix = self.store.get(store_key)
+        if postfix is None:
+            # Invalid expressions raise here and are never stored
+            postfix = self.parser.parse_expression(expression)
+            self.store.put(store_key, postfix)
+        return postfix
+
+    def warm(self, lines):
+        """
+        Load the programs of a corpus into the cache ahead of evaluation.
+
+        With a store, programs parsed in an earlier run are loaded from it and
+        the others are parsed and added to it. Invalid expressions are skipped.
+
+        :param lines: iterable of str
+            The expressions, e.g. an open corpus file.
+        :return: int
+            Number of programs loaded.
+        """
+        count = 0
+        for line in lines:
+            expression = line.strip()
+            if not expression:
+                continue
+            try:
+                self.get_program(expression)
+            except CalculatorException:
+                continue
+            count += 1
+        if self.store is not None:
+            self.store.flush()
+        return count
+
+    def make_program(self, postfix, code):
+        """
+        Wrap the bytecode of a postfix program, with its tree when optimizing.
+
+        Building the tree folds its constant subtrees, which evaluates them:
+        under a budget, only admitted programs get a tree, and the others are
+        rejected when run. Programs under a deadline are run by the bytecode
+        machine and get no tree.
+
+        :param postfix: list
+            The postfix tokenized expression.
+        :param code: Program
+            Its bytecode.
+        :return: CompiledExpression
+        """
+        program = CompiledExpression(code)
+        if self.optimize and self.budget is not None:
+            if self.budget.deadline is not None:
+                return program
+            try:
+                self.admit(program)
+            except BudgetExceededException:
+                return program
+        program.tree = self.build_tree(postfix)
+        return program
+
+    def build_tree(self, postfix):
+        """
+        Build the optimized tree of a postfix program when optimizing.
+
+        :param postfix: list
+            The postfix tokenized expression.
+        :return: ExpressionTree or None
+            None when not optimizing or when the program is malformed, in which
+            case the bytecode reports the error.
+        """
+        if not self.optimize:
             return None
-        except Exception as e:
-            # Handle unexpected errors
-            print(f"Unexpected error: {e}")
+        # Only imported by calculators that optimize, which keeps startup short
+        from ExpressionTree import ExpressionTree
+
+        try:
+            return ExpressionTree.build(postfix, self.parser.operators).optimize()
+        except CalculatorException:
             return None
 
-    def evaluate_postfix(self, postfix):
+    def run_program(self, program, variables=None):
+        """
+        Evaluate a compiled expression, compiling it once it becomes hot.
+
+        :param program: CompiledExpression
+            The program to evaluate.
+        :param variables: dict, optional
+            Values of the variables used by the program.
+        :return: float
+            The result of the calculation.
+        """
+        if variables is None:
+            variables = {}
+        if self.budget is not None:
+            self.admit(program)
+            if self.budget.deadline is not None:
+                return self.machine.execute(program.code, variables, self.budget.deadline)
+        if self.memo is not None:
+            return self.memo.evaluate(program.postfix, self.parser.operators, variables)
+        if program.tree is not None:
+            try:
+                return program.tree.evaluate(variables)
+            except Exception:
+                # Operands of n-ary nodes are all evaluated before they are combined,
+                # so the tree may meet another error first: the bytecode, which keeps
+                # the original order, raises the expected one
+                return self.machine.execute(program.code, variables)
+        function = program.function
+        if function is None:
+            program.uses += 1
+            if not self.compile_threshold or program.uses < self.compile_threshold:
+                return self.machine.execute(program.code, variables)
+            function = program.function = self.compile_program(program)
+        return function(variables)
+
+    def admit(self, program):
+        """
+        Check the static estimate of a program against the budget.
+
+        A malformed program is charged for the operands evaluated before its
+        first error; when admitted, the bytecode reports the error as it does
+        without a budget.
+
+        :param program: CompiledExpression
+        :return: Estimate
+        :raises BudgetExceededException: if the estimate exceeds a limit.
+        """
+        from CostAnalysis import estimate
+
+        if program.estimate is None:
+            program.estimate = estimate(program.postfix, self.parser.operators, self.exact, strict=False)
+        self.budget.check(program.estimate)
+        return program.estimate
+
+    def explain(self, expression, out=None):
+        """
+        Print the static estimate of every subexpression of an expression.
+
+        :param expression: str
+            The mathematical expression.
+        :param out: file-like object, optional
+            Receives the table, standard output by default.
+        :return: list of tuple
+            (text, Estimate) for every subexpression, the whole one last.
+        """
+        from CostAnalysis import explain
+
+        subtrees = explain(self.parser.parse_expression(expression), self.parser.operators, self.exact)
+        out = out if out is not None else sys.stdout
+        out.write(f"{'cost':>10} {'bits':>10} {'tokens':>6} {'depth':>5} {'stack':>5}  subexpression\n")
+        for text, estimate in subtrees:
+            out.write(f"{estimate.cost:>10.4g} {estimate.bits:>10.4g} {estimate.tokens:>6} {estimate.depth:>5} "
+                      f"{estimate.stack_depth:>5}  {text}\n")
+        return subtrees
+
+    def compile_program(self, program):
+        """
+        Compile a program, without per-operator checks when it is proven safe.
+
+        Range analysis bounds every value of the program from its literals and
+        the bounds of its variables. When no operator can raise inside those
+        bounds, the program runs as plain IEEE arithmetic, letting inf and NaN
+        propagate: a call only checks its bounded variables and its final
+        value. When either check fails, the checked bytecode evaluates the
+        program again, which raises at the offending subterm exactly the
+        exception it always raises.
+
+        :param program: CompiledExpression
+        :return: callable
+            A function taking an optional dict of variable values.
+        """
+        from RangeAnalysis import analyze
+
+        postfix = program.postfix
+        if self.exact or analyze(postfix, self.parser.operators, self.bounds) is None:
+            return self.compiler.compile(postfix)
+
+        bounds = {name: self.bounds[name] for name in program.variables if name in (self.bounds or {})}
+        return self.unchecked_compiler.compile(postfix, bounds, partial(self.machine.execute, program.code))
+
+    def evaluate_stream(self, source, chunk_size=1 << 16, **variables):
+        """
+        Evaluate one expression read incrementally from a file or from chunks.
+
+        Tokenizing, unary minus rewriting, the shunting-yard and the evaluation
+        run as a pipeline of generators, so the expression is never held in
+        memory as a whole: memory grows with its nesting depth, not its length.
+        Nothing is cached. When the expression has several errors, the first
+        one met in the input is reported.
+
+        :param source: file-like object or iterable of str
+            An object with a read method is read ``chunk_size`` characters at a time.
+        :param chunk_size: int
+        :param variables: float
+            Values of the variables used by the expression.
+        :return: float
+            The result of the calculation.
+        """
+        if hasattr(source, 'read'):
+            source = iter(partial(source.read, chunk_size), '')
+        tokens = self.parser.iter_tokens(source)
+        tokens = self.parser.iter_wrap_negatives(tokens)
+        return self.evaluate_postfix(self.parser.iter_postfix(tokens), variables)
+
+    @contextmanager
+    def profile(self, profiler=None):
+        """
+        Profile the expressions computed inside the block.
+
+        While profiling, programs are evaluated on the bytecode machine with an
+        instrumented operator table, never through compiled functions or
+        optimized trees, so that every operator call is accounted for.
+
+        :param profiler: Profiler, optional
+            Receives the measurements; a new one is created when omitted.
+        :return: Profiler
+        """
+        if profiler is None:
+            from Profiler import Profiler
+            profiler = Profiler()
+        previous = self.profiler
+        self.profiler = self.parser.profiler = profiler
+        try:
+            yield profiler
+        finally:
+            self.profiler = self.parser.profiler = previous
+
+    def _profiled_compute(self, expression, variables):
+        profiler = self.profiler
+        if self._profiled_machine is None or self._profiled_machine[0] is not profiler:
+            self._profiled_machine = (profiler, BytecodeMachine(profiler.instrument(self.parser.operators), self.exact))
+        machine = self._profiled_machine[1]
+
+        start = perf_counter_ns()
+        try:
+            key = ExpressionCache.normalize(expression)
+            result = self.result_cache.get(key, _MISSING)
+            if result is not _MISSING:
+                return result
+
+            program = self.program_cache.get(key)
+            if program is None:
+                postfix = self.parse(expression, key)
+                program = self.make_program(postfix, profiler.time('assemble', self.machine.assemble, postfix))
+                self.program_cache.put(key, program)
+
+            timeout = None
+            if self.budget is not None:
+                profiler.time('admit', self.admit, program)
+                timeout = self.budget.deadline
+            result = profiler.time('evaluate', machine.execute, program.code, variables, timeout)
+            if not program.variables:
+                self.result_cache.put(key, result)
+            return result
+        finally:
+            profiler.record_expression(expression, perf_counter_ns() - start)
+
+    def evaluate_vectorized(self, expression, **arrays):
+        """
+        Evaluate an expression once over whole NumPy arrays of variable values.
+
+        Errors that depend on the row (division by zero, invalid factorials,
+        results that are too large, ...) do not abort the batch: they are
+        reported per row in the error codes of the result.
+
+        :param expression: str
+            The mathematical expression to evaluate.
+        :param arrays: array_like
+            Values of the variables used by the expression.
+        :return: VectorResult
+            The values and the per-row error codes (0 when the row succeeded).
+        """
+        # NumPy is an optional dependency, only needed by this entry point
+        from VectorEvaluator import VectorEvaluator
+
+        program = self.get_program(expression)
+        return VectorEvaluator(self).evaluate(program.postfix, arrays)
+
+    def evaluate_parallel(self, expression, evaluator=None, **variables):
+        """
+        Evaluate one large expression, running its expensive independent
+        subtrees in a process pool.
+
+        The result, or the first error in source order, is the one of a
+        sequential evaluation.
+
+        :param expression: str
+            The mathematical expression to evaluate.
+        :param evaluator: ParallelEvaluator, optional
+            Evaluator whose pool is reused across calls; by default a pool is
+            started for this call only.
+        :param variables: float
+            Values of the variables used by the expression.
+        :return: float
+            The result of the calculation.
+        """
+        from ParallelEvaluator import ParallelEvaluator
+
+        postfix = self.get_program(expression).postfix
+        if evaluator is not None:
+            return evaluator.evaluate(postfix, variables)
+        evaluator = ParallelEvaluator(self)
+        try:
+            return evaluator.evaluate(postfix, variables)
+        finally:
+            evaluator.close()
+
+    def evaluate_batch(self, expressions, min_group=8):
+        """
+        Evaluate many expressions, vectorizing those that share a structure.
+
+        Expressions are grouped by the template key of the parser. Each
+        template is parsed once, the literals of its expressions are packed
+        into a matrix with one column per slot, and the group is evaluated in
+        one vectorized pass. Smaller groups, and groups whose template uses
+        variables, are evaluated one expression at a time.
+
+        :param expressions: iterable of str
+        :param min_group: int
+            Smallest group evaluated in one vectorized pass.
+        :return: VectorResult
+            The values (NaN where an expression failed) and the error codes, in
+            input order, with the codes of ``evaluate_vectorized``.
+        """
+        import numpy as np
+        from VectorEvaluator import VectorEvaluator, VectorResult
+
+        if self.exact:
+            raise ValueError("Batches are evaluated with float semantics, which exact calculators do not use.")
+        expressions = list(expressions)
+        values = np.full(len(expressions), np.nan)
+        errors = np.zeros(len(expressions), dtype=np.uint8)
+
+        # Template key -> (rows, literals of each row)
+        groups = {}
+        for row, expression in enumerate(expressions):
+            key, literals = self.parser.template(expression)
+            group = groups.get(key)
+            if group is None:
+                group = groups[key] = ([], [])
+            group[0].append(row)
+            group[1].append(literals)
+
+        for key, (rows, literals) in groups.items():
+            if len(rows) >= min_group:
+                try:
+                    postfix, slots = self.parser.parse_template(key)
+                except CalculatorException as e:
+                    # Parse errors do not depend on the literals
+                    errors[rows] = e.code
+                    continue
+                # Every name is a slot, which appears once, when the template uses no variables
+                if sum(map(self.parser.is_variable, postfix)) == len(slots):
+                    matrix = np.array(literals, dtype=np.float64).reshape(len(rows), len(slots))
+                    try:
+                        result = VectorEvaluator(self).evaluate(postfix, dict(zip(slots, matrix.T)))
+                    except CalculatorException:
+                        # A malformed program: the error met first depends on the row
+                        pass
+                    else:
+                        values[rows] = result.values
+                        errors[rows] = result.errors
+                        continue
+            for row in rows:
+                self._evaluate_row(expressions[row], row, values, errors)
+        return VectorResult(values, errors)
+
+    def _evaluate_row(self, expression, row, values, errors):
+        from VectorEvaluator import NON_REAL_RESULT_CODE
+
+        result = self.evaluate(expression)
+        if not result.ok:
+            errors[row] = result.code
+        elif isinstance(result.value, complex):
+            errors[row] = NON_REAL_RESULT_CODE
+        else:
+            values[row] = float(result.value)
+
+    def clear_cache(self):
+        """
+        Drop every cached program and result.
+        """
+        self.program_cache.clear()
+        self.result_cache.clear()
+
+    def evaluate_postfix(self, postfix, variables=None):
         """
         Evaluate a mathematical expression in postfix notation.
 
         :param postfix: list
             The postfix tokenized expression.
+        :param variables: dict, optional
+            Values of the variables used by the expression.
         :return: float
             The result of the calculation.
         """
@@ -59,7 +584,7 @@ class Calculator:
         operators = self.parser.operators
 
         for token in postfix:
-            if isinstance(token, float):
+            if isinstance(token, (int, float)):
                 # Operand: Push it onto the stack
                 stack.append(token)
             elif isinstance(token, str) and token in operators:
@@ -81,6 +606,10 @@ class Calculator:
 
                 # Push the result back onto the stack
                 stack.append(result)
+            elif self.parser.is_variable(token):
+                if not variables or token not in variables:
+                    raise UndefinedVariableException(token)
+                stack.append(variables[token])
             else:
                 raise InvalidTokenException(token)
 
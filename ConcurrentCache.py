@@ -0,0 +1,68 @@
+# ConcurrentCache.py
+
+import threading
+
+from ExpressionCache import ExpressionCache
+
+
+class ConcurrentCache(ExpressionCache):
+    def __init__(self, max_entries=4096, max_bytes=8 * 1024 * 1024):
+        """
+        Initialize a bounded cache that many threads can use at once.
+
+        Reads take no lock: a lookup is a single dict access, which is atomic
+        with the GIL and internally synchronized on free-threaded builds.
+        Writes are serialized by a lock. Reads do not reorder entries, so the
+        oldest inserted entry is evicted first instead of the least recently
+        used one. The hit and miss counters are not synchronized and are only
+        approximate under contention.
+
+        :param max_entries: int
+            Maximum number of entries (0 disables the cache).
+        :param max_bytes: int
+            Approximate upper bound on the memory used by keys and values.
+        """
+        super().__init__(max_entries, max_bytes)
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """
+        Return the cached value for the key, without locking.
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        return entry[0]
+
+    def put(self, key, value):
+        """
+        Store a value, evicting the oldest entries to respect both limits.
+        """
+        if self.max_entries <= 0:
+            return
+        size = self.estimate_size(key, value)
+        if size > self.max_bytes:
+            return
+
+        entries = self._entries
+        with self._lock:
+            previous = entries.pop(key, None)
+            if previous is not None:
+                self.current_bytes -= previous[1]
+            entries[key] = (value, size)
+            self.current_bytes += size
+
+            while len(entries) > self.max_entries or self.current_bytes > self.max_bytes:
+                _, evicted_size = entries.pop(next(iter(entries)))
+                self.current_bytes -= evicted_size
+                self.evictions += 1
+
+    def clear(self):
+        """
+        Drop every entry and reset the counters.
+        """
+        with self._lock:
+            super().clear()
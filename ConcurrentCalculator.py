@@ -0,0 +1,138 @@
+# ConcurrentCalculator.py
+
+import os
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from Calculator import Calculator, _MISSING
+from ConcurrentCache import ConcurrentCache
+from ExpressionCache import ExpressionCache
+
+
+class ConcurrentCalculator(Calculator):
+    def __init__(self, cache_size=4096, cache_bytes=8 * 1024 * 1024, compile_threshold=2, optimize=False,
+                 exact=False, max_workers=None, **options):
+        """
+        Initialize a calculator that can be shared between threads.
+
+        The operator tables are read-only and the parser, the bytecode machine
+        and compiled programs keep no state between calls, so only the caches
+        need care: they are ConcurrentCache instances, whose reads take no lock.
+        Concurrent calls for the same expression are coalesced: one thread
+        parses it (and evaluates it, when it has no variables) while the others
+        wait for its result or its exception.
+
+        Profiling and subexpression memos are not thread safe and are not
+        supported. The other options of Calculator are: bounds and budgets are
+        only read, program stores lock their database, and the parser engines
+        keep no state between calls.
+
+        :param cache_size: int
+        :param cache_bytes: int
+        :param compile_threshold: int
+        :param optimize: bool
+        :param exact: bool
+            See Calculator.
+        :param max_workers: int, optional
+            Number of threads used by calculate_many (default: as many as
+            ThreadPoolExecutor uses by default).
+        :param options:
+            bounds, store, budget and engine, see Calculator.
+        :raises ValueError: if a subexpression memo is given.
+        """
+        if options.get('memo') is not None:
+            raise ValueError("Subexpression memos are not thread safe")
+        super().__init__(cache_size, cache_bytes, compile_threshold, optimize, exact, **options)
+        self.program_cache = ConcurrentCache(cache_size, cache_bytes)
+        self.result_cache = ConcurrentCache(cache_size, cache_bytes)
+        self.max_workers = max_workers
+        # Key -> Future of the call in progress for that key
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def compute(self, expression, **variables):
+        """
+        Evaluate the given expression without handling errors.
+
+        Concurrent calls for the same expression without variables are
+        evaluated once.
+
+        :param expression: str
+            The mathematical expression to evaluate.
+        :param variables: float
+            Values of the variables used by the expression.
+        :return: float
+            The result of the calculation.
+        :raises CalculatorException: if the expression is invalid.
+        """
+        if variables:
+            return super().compute(expression, **variables)
+        key = ExpressionCache.normalize(expression)
+        result = self.result_cache.get(key, _MISSING)
+        if result is not _MISSING:
+            return result
+        return self._single_flight(('result', key), super().compute, expression)
+
+    def get_program(self, expression, key=None):
+        """
+        Return the cached program of an expression, parsing it once on a miss.
+
+        :param expression: str
+        :param key: str, optional
+            The normalized expression, when already computed.
+        :return: CompiledExpression
+        """
+        if key is None:
+            key = ExpressionCache.normalize(expression)
+        program = self.program_cache.get(key)
+        if program is not None:
+            return program
+        return self._single_flight(('program', key), super().get_program, expression, key)
+
+    def calculate_many(self, expressions, **variables):
+        """
+        Evaluate expressions on a bounded pool of threads.
+
+        At most a few tasks per thread are queued at a time, so a long or lazy
+        iterable is consumed as results are produced.
+
+        :param expressions: iterable of str
+        :param variables: float
+            Values of the variables used by the expressions.
+        :return: list of CalculationResult
+            The results, in input order.
+        """
+        # The default of ThreadPoolExecutor
+        workers = self.max_workers or min(32, (os.cpu_count() or 1) + 4)
+        results = []
+        with ThreadPoolExecutor(workers) as pool:
+            window = deque()
+            limit = 4 * workers
+            for expression in expressions:
+                if len(window) >= limit:
+                    results.append(window.popleft().result())
+                window.append(pool.submit(self.evaluate, expression, **variables))
+            results.extend(future.result() for future in window)
+        return results
+
+    def _single_flight(self, key, function, *args):
+        with self._lock:
+            future = self._in_flight.get(key)
+            leader = future is None
+            if leader:
+                future = self._in_flight[key] = Future()
+        if not leader:
+            return future.result()
+
+        try:
+            result = function(*args)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._in_flight[key]
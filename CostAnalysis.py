@@ -0,0 +1,291 @@
+# CostAnalysis.py
+
+import math
+
+from ExpressionParser import ExpressionParser
+from Operators import MAX_EXACT_BITS
+from exceptions import (
+    BudgetExceededException,
+    CalculatorException,
+    InvalidTokenException,
+    MissingOperandException,
+)
+
+# Floats are below 2^1024 in magnitude
+FLOAT_BITS = 1024
+WORD_BITS = 64
+# Exponent of Karatsuba multiplication, which CPython uses for large ints
+KARATSUBA = math.log2(3)
+LOG2_E = 1 / math.log(2)
+# Constant subexpressions estimated to cost at most this are evaluated, which
+# sizes their values exactly
+FOLD_COST = 64
+
+_UNKNOWN = object()
+
+
+class Estimate:
+    """
+    The static estimate of a (sub)expression.
+
+    ``cost`` is in units of one simple operator call: operators on large
+    integers cost more units with the number of machine words of their
+    operands. ``bits`` bounds the bit length of the value and ``integer``
+    tells whether it may be a Python int, whose size is not limited by the
+    float range.
+    """
+    __slots__ = ('tokens', 'depth', 'stack_depth', 'cost', 'bits', 'integer')
+
+    def __init__(self, tokens, depth, stack_depth, cost, bits, integer):
+        self.tokens = tokens
+        self.depth = depth
+        self.stack_depth = stack_depth
+        self.cost = cost
+        self.bits = bits
+        self.integer = integer
+
+    def __repr__(self):
+        return (f"Estimate(tokens={self.tokens}, depth={self.depth}, stack_depth={self.stack_depth}, "
+                f"cost={self.cost:.6g}, bits={self.bits:.6g}, integer={self.integer})")
+
+
+class Budget:
+    """
+    Limits on the expressions a calculator accepts and on their evaluation.
+
+    The static limits are checked on the estimate of an expression before it
+    is evaluated; the deadline, in seconds, is checked by the evaluator
+    between operators. Limits left to None are not enforced.
+    """
+    __slots__ = ('max_tokens', 'max_depth', 'max_cost', 'deadline')
+
+    def __init__(self, max_tokens=None, max_depth=None, max_cost=None, deadline=None):
+        self.max_tokens = max_tokens
+        self.max_depth = max_depth
+        self.max_cost = max_cost
+        self.deadline = deadline
+
+    def check(self, estimate):
+        """
+        Reject an expression whose estimate exceeds a static limit.
+
+        :param estimate: Estimate
+        :raises BudgetExceededException: naming the first limit exceeded.
+        """
+        for limit, value in (('tokens', estimate.tokens), ('depth', estimate.depth), ('cost', estimate.cost)):
+            maximum = getattr(self, 'max_' + limit)
+            if maximum is not None and value > maximum:
+                raise BudgetExceededException(limit, value, maximum, estimate)
+
+
+def _words(bits):
+    return max(1.0, bits / WORD_BITS)
+
+
+def _multiply_cost(a, b):
+    # Unbalanced products are computed as slices of the size of the smaller operand
+    large, small = max(_words(a), _words(b)), min(_words(a), _words(b))
+    return large * small ** (KARATSUBA - 1)
+
+
+def _shift(bits, exponent_bits):
+    # bits * 2^exponent_bits, infinite when it overflows
+    try:
+        return math.ldexp(bits, int(min(exponent_bits, 1 << 16)))
+    except OverflowError:
+        return math.inf
+
+
+def _literal_bits(value):
+    return max(1.0, math.log2(abs(value)) + 1) if value and math.isfinite(value) else 1.0
+
+
+def _operator(symbol, operands, exact):
+    """
+    Estimate the cost of an operator and the size of its result.
+
+    :return: tuple
+        The cost in units, the bound of the bit length of the result and
+        whether the result may be an integer.
+    """
+    a = operands[0]
+    b = operands[1] if len(operands) == 2 else None
+    integer = any(operand.integer for operand in operands)
+    bits = max(operand.bits for operand in operands)
+    cost = 1.0 + (_words(bits) if integer else 0.0)
+
+    if symbol in ('u-', '~', '$', '&'):
+        pass
+    elif symbol in ('+', '-', '@'):
+        bits += 1
+    elif symbol == '%':
+        bits = b.bits
+    elif symbol == '*':
+        if integer:
+            cost = 1.0 + _multiply_cost(a.bits, b.bits)
+        bits = a.bits + b.bits
+    elif symbol == '/':
+        integer = exact and a.integer and b.integer
+        if integer:
+            cost = 1.0 + _multiply_cost(a.bits, b.bits)
+        bits = a.bits if integer else FLOAT_BITS
+    elif symbol == '^':
+        integer = a.integer and b.integer
+        if integer:
+            bits = _shift(a.bits, b.bits)
+            if exact:
+                # The size of the result is checked before it is computed
+                bits = min(bits, MAX_EXACT_BITS)
+            # Repeated squaring: the last product dominates
+            cost = 1.0 + 2 * _words(bits) ** KARATSUBA
+        else:
+            bits = FLOAT_BITS
+    elif symbol == '!':
+        # Float factorials are looked up up to 170!, larger ones raise
+        largest = min(2.0 ** min(a.bits, FLOAT_BITS - 1), MAX_EXACT_BITS if exact else 170.0)
+        bits = max(1.0, math.lgamma(largest + 1) * LOG2_E + 1)
+        if exact:
+            bits = min(bits, MAX_EXACT_BITS)
+            cost = 1.0 + _words(bits) ** KARATSUBA
+        else:
+            cost = 1.0
+        integer = True
+    elif symbol == '#':
+        # Converting an int to text is quadratic in its length
+        cost = 1.0 + (_words(a.bits) ** 2 if a.integer else 0.0)
+        bits = math.log2(9 * (a.bits * math.log10(2) + 2)) + 1
+        integer = True
+    else:
+        bits, integer = (MAX_EXACT_BITS, True) if exact else (FLOAT_BITS, False)
+
+    if not integer:
+        bits = min(bits, FLOAT_BITS)
+    elif exact:
+        bits = min(bits, MAX_EXACT_BITS + 1)
+    return cost, bits, integer
+
+
+def _format(token):
+    return repr(token).removesuffix('.0') if isinstance(token, float) else str(token)
+
+
+def _text(symbol, texts):
+    if symbol == 'u-':
+        return f"-{texts[0]}"
+    if len(texts) == 1:
+        return f"{texts[0]}{symbol}" if symbol in ('!', '#') else f"{symbol}{texts[0]}"
+    return f"({texts[0]} {symbol} {texts[1]})"
+
+
+def _walk(postfix, operators, exact, subtrees=None, texts=True, strict=True):
+    # Entries are (text, estimate, value); texts are only built for subtrees
+    texts = texts and subtrees is not None
+    stack = []
+    try:
+        for token in postfix:
+            if isinstance(token, (int, float)):
+                entry = (texts and _format(token),
+                         Estimate(1, 1, 1, 1.0, _literal_bits(token), isinstance(token, int)), token)
+            elif isinstance(token, str) and token in operators:
+                arity = operators[token].arity
+                if len(stack) < arity:
+                    raise MissingOperandException(operators[token].symbol)
+                if arity not in (1, 2):
+                    raise CalculatorException(f"Unsupported operator arity: {arity}")
+                operands = stack[-arity:]
+                del stack[-arity:]
+                estimates = [estimate for _, estimate, _ in operands]
+                cost, bits, integer = _operator(token, estimates, exact)
+                value = _UNKNOWN
+                if cost <= FOLD_COST and all(operand[2] is not _UNKNOWN for operand in operands):
+                    try:
+                        value = operators[token].evaluate(*(operand[2] for operand in operands))
+                    except Exception:
+                        # Fails as cheaply when evaluated
+                        pass
+                    if isinstance(value, (int, float)):
+                        bits, integer = _literal_bits(value), isinstance(value, int)
+                    else:
+                        value = _UNKNOWN
+                stack_depth = estimates[0].stack_depth if arity == 1 else \
+                    max(estimates[0].stack_depth, estimates[1].stack_depth + 1)
+                entry = (texts and _text(token, [operand[0] for operand in operands]),
+                         Estimate(1 + sum(e.tokens for e in estimates), 1 + max(e.depth for e in estimates),
+                                  stack_depth, cost + sum(e.cost for e in estimates), bits, integer), value)
+            elif ExpressionParser.is_variable(token):
+                # Variables are assumed to hold floats
+                entry = (token, Estimate(1, 1, 1, 1.0, FLOAT_BITS, False), _UNKNOWN)
+            else:
+                raise InvalidTokenException(token)
+            stack.append(entry)
+            if subtrees is not None:
+                subtrees.append(entry[:2])
+        if len(stack) != 1:
+            raise CalculatorException("Invalid expression structure.")
+    except CalculatorException:
+        if strict:
+            raise
+        # The operands left on the stack are evaluated before the error is met
+        return _prefix([estimate for _, estimate, _ in stack])
+    return stack[0][1]
+
+
+def _prefix(estimates):
+    # The estimate of the operands on a stack, taken together
+    if not estimates:
+        return Estimate(0, 0, 0, 0.0, 1.0, False)
+    return Estimate(sum(e.tokens for e in estimates), max(e.depth for e in estimates),
+                    max(e.stack_depth + i for i, e in enumerate(estimates)), sum(e.cost for e in estimates),
+                    max(e.bits for e in estimates), any(e.integer for e in estimates))
+
+
+def explain(postfix, operators, exact=False):
+    """
+    Estimate every subexpression of a postfix program.
+
+    Literals, and cheap constant subexpressions, are sized from their value;
+    variables are assumed to hold floats. Other values are sized by bounds
+    propagated from their operands.
+
+    :param postfix: list
+        The postfix tokenized expression.
+    :param operators: dict
+        Maps operator symbols to Operator instances.
+    :param exact: bool
+        Estimate the exact-mode operators.
+    :return: list of tuple
+        (text, Estimate) for every subexpression, operands before the
+        operators that use them; the last one is the whole program.
+    :raises CalculatorException: if the program is malformed.
+    """
+    subtrees = []
+    _walk(postfix, operators, exact, subtrees)
+    return subtrees
+
+
+def subtree_estimates(postfix, operators, exact=False):
+    """
+    Estimate the subexpression ending at every token of a postfix program.
+
+    The subexpression ending at token i spans the ``tokens`` tokens up to it.
+
+    :return: list of Estimate
+        One estimate per token.
+    :raises CalculatorException: if the program is malformed.
+    """
+    subtrees = []
+    _walk(postfix, operators, exact, subtrees, texts=False)
+    return [estimate for _, estimate in subtrees]
+
+
+def estimate(postfix, operators, exact=False, strict=True):
+    """
+    Estimate a postfix program as a whole.
+
+    :param strict: bool
+        Raise on a malformed program; otherwise estimate the operands it
+        evaluates before its first error, all of them taken together.
+    :return: Estimate
+    :raises CalculatorException: if the program is malformed and strict.
+    """
+    return _walk(postfix, operators, exact, strict=strict)
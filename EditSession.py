@@ -0,0 +1,208 @@
+# EditSession.py
+
+import re
+
+from CalculationResult import CalculationResult
+from Calculator import Calculator
+from ExpressionParser import Token, NUMBER, LEFT_PARENTHESIS, RIGHT_PARENTHESIS
+
+PARENTHESES = re.compile(r'[()]')
+
+_DIRTY = object()
+
+
+class _Group:
+    """
+    The content of a pair of parentheses (or the whole expression): text
+    segments and nested groups, with the tokens of each segment and the value
+    of the group cached between edits.
+    """
+    __slots__ = ('parts', 'tokens', 'length', 'value')
+
+    def __init__(self):
+        self.parts = []
+        self.tokens = []
+        self.length = 0
+        self.value = _DIRTY
+
+    def append(self, part):
+        self.parts.append(part)
+        self.tokens.append(None)
+
+
+def _build(text):
+    """
+    Split a text into nested groups.
+
+    :return: _Group or None
+        None when the parentheses are not balanced.
+    """
+    stack = [(_Group(), 0)]
+    segment = 0
+    for match in PARENTHESES.finditer(text):
+        index = match.start()
+        if index > segment:
+            stack[-1][0].append(text[segment:index])
+        segment = index + 1
+        if match.group() == '(':
+            stack.append((_Group(), index + 1))
+        elif len(stack) == 1:
+            return None
+        else:
+            group, start = stack.pop()
+            group.length = index - start
+            stack[-1][0].append(group)
+    if len(stack) != 1:
+        return None
+    root = stack[0][0]
+    if segment < len(text):
+        root.append(text[segment:])
+    root.length = len(text)
+    return root
+
+
+def _flatten(group):
+    return ''.join(part if isinstance(part, str) else f"({_flatten(part)})" for part in group.parts)
+
+
+class EditSession:
+    def __init__(self, calculator=None, text='', **variables):
+        """
+        Initialize an editing session over one expression.
+
+        The expression is kept as a tree of parenthesized groups. An edit only
+        re-tokenizes the text segment it touches (or re-splits the innermost
+        group containing it when parentheses change) and re-evaluates the groups
+        on the path to the root, where every other group contributes its cached
+        value. The cost of an edit therefore depends on the size of the edited
+        group and its ancestors' own segments, not on the expression length.
+
+        Values follow the default evaluation of the calculator. When the edited
+        expression is invalid, the whole expression is evaluated again so that
+        the reported error is the one ``Calculator.compute`` raises.
+
+        :param calculator: Calculator, optional
+        :param text: str
+            The initial expression.
+        :param variables: float
+            Values of the variables used by the expression.
+        """
+        self.calculator = calculator if calculator is not None else Calculator()
+        self.parser = self.calculator.parser
+        self.variables = variables
+        self.text = ''
+        self.root = _Group()
+        self.result = None
+        self.set_text(text)
+
+    def set_text(self, text):
+        """
+        Replace the whole expression.
+
+        :param text: str
+        :return: CalculationResult
+        """
+        self.text = text
+        self.root = _build(text)
+        return self._evaluate()
+
+    def edit(self, start, end, replacement):
+        """
+        Replace the span ``text[start:end]``.
+
+        :param start: int
+        :param end: int
+        :param replacement: str
+        :return: CalculationResult
+            The result of the edited expression.
+        """
+        if not 0 <= start <= end <= len(self.text):
+            raise IndexError(f"Invalid edit span: {start}:{end}")
+        text = self.text[:start] + replacement + self.text[end:]
+        if self.root is None:
+            # Unbalanced parentheses: the tree is rebuilt until they balance again
+            return self.set_text(text)
+
+        self.text = text
+        delta = len(replacement) - (end - start)
+        group = self.root
+        path = [group]
+        offset = 0
+        while True:
+            position = offset
+            target = None
+            for k, part in enumerate(group.parts):
+                if isinstance(part, str):
+                    if position <= start and end <= position + len(part):
+                        target = k
+                        break
+                    position += len(part)
+                else:
+                    if position + 1 <= start and end <= position + 1 + part.length:
+                        target = k
+                        break
+                    position += part.length + 2
+
+            if target is not None and not isinstance(group.parts[target], str):
+                # The edit is inside a nested group
+                group = group.parts[target]
+                path.append(group)
+                offset = position + 1
+                continue
+
+            if target is not None and '(' not in replacement and ')' not in replacement:
+                # The edit only changes a text segment
+                part = group.parts[target]
+                group.parts[target] = part[:start - position] + replacement + part[end - position:]
+                group.tokens[target] = None
+            else:
+                # The edit changes the parentheses of this group: split it again
+                content = _flatten(group)
+                rebuilt = _build(content[:start - offset] + replacement + content[end - offset:])
+                if rebuilt is None:
+                    return self.set_text(text)
+                group.parts = rebuilt.parts
+                group.tokens = rebuilt.tokens
+            break
+
+        for group in path:
+            group.length += delta
+            group.value = _DIRTY
+        return self._evaluate()
+
+    def _evaluate(self):
+        try:
+            if self.root is None:
+                raise ValueError("Unbalanced parentheses")
+            self.result = CalculationResult(self.text, self._value(self.root))
+        except Exception:
+            # Report the same error as a full evaluation would
+            self.result = self.calculator.evaluate(self.text, **self.variables)
+        return self.result
+
+    def _value(self, group):
+        if group.value is _DIRTY:
+            tokens = self.parser.iter_wrap_negatives(self._tokens(group))
+            group.value = self.calculator.evaluate_postfix(self.parser.iter_postfix(tokens), self.variables)
+        return group.value
+
+    def _tokens(self, group):
+        tokens = []
+        for k, part in enumerate(group.parts):
+            if isinstance(part, str):
+                if group.tokens[k] is None:
+                    group.tokens[k] = self.parser.tokenize(part)
+                tokens.extend(group.tokens[k])
+            elif tokens and tokens[-1].text == '-':
+                # A unary minus before '(' is rewritten around the parenthesis
+                # itself, so the group is parsed in place instead of as a value
+                inner = self._tokens(part)
+                if not inner:
+                    raise ValueError("Empty parentheses")
+                tokens.append(Token(LEFT_PARENTHESIS, '(', None, 0, 0))
+                tokens.extend(inner)
+                tokens.append(Token(RIGHT_PARENTHESIS, ')', None, 0, 0))
+            else:
+                value = self._value(part)
+                tokens.append(Token(NUMBER, repr(value), value, 0, 0))
+        return tokens
@@ -0,0 +1,107 @@
+# ExpressionCache.py
+
+import sys
+from collections import OrderedDict
+
+
+class ExpressionCache:
+    def __init__(self, max_entries=4096, max_bytes=8 * 1024 * 1024):
+        """
+        Initialize a bounded LRU cache keyed by normalized expression strings.
+
+        :param max_entries: int
+            Maximum number of entries kept before the least recently used one is evicted.
+            A value of 0 disables the cache.
+        :param max_bytes: int
+            Approximate upper bound on the memory used by keys and values.
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+
+    @staticmethod
+    def normalize(expression):
+        """
+        Build the cache key of an expression.
+
+        The tokenizer drops every space before scanning, so expressions that only
+        differ in spaces always produce the same program and share an entry.
+        """
+        return expression.replace(' ', '')
+
+    @staticmethod
+    def estimate_size(key, value):
+        """
+        Estimate the number of bytes held by a cache entry.
+        """
+        size = sys.getsizeof(key) + sys.getsizeof(value)
+        if isinstance(value, (list, tuple)):
+            size += sum(sys.getsizeof(item) for item in value)
+        return size
+
+    def get(self, key, default=None):
+        """
+        Return the cached value for the key and mark it as recently used.
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, key, value):
+        """
+        Store a value, evicting least recently used entries to respect both limits.
+        """
+        if self.max_entries <= 0:
+            return
+        size = self.estimate_size(key, value)
+        if size > self.max_bytes:
+            # Never let a single oversized entry flush the whole cache
+            return
+
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self.current_bytes -= previous[1]
+
+        self._entries[key] = (value, size)
+        self.current_bytes += size
+
+        while len(self._entries) > self.max_entries or self.current_bytes > self.max_bytes:
+            _, (_, evicted_size) = self._entries.popitem(last=False)
+            self.current_bytes -= evicted_size
+            self.evictions += 1
+
+    def clear(self):
+        """
+        Drop every entry and reset the counters.
+        """
+        self._entries.clear()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def stats(self):
+        """
+        Return a snapshot of the cache counters.
+        """
+        return {
+            'entries': len(self._entries),
+            'bytes': self.current_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
@@ -1,18 +1,7 @@
-from Operators import (
-    AdditionOperator,
-    SubtractionOperator,
-    MultiplicationOperator,
-    DivisionOperator,
-    PowerOperator,
-    FactorialOperator,
-    UnaryMinusOperator,
-    TildeOperator,
-    ModuloOperator,
-    MaxOperator,
-    MinOperator,
-    AverageOperator,
-    DigitSumOperator
-)
+import re
+from collections import namedtuple
+
+from Operators import OPERATORS, EXACT_OPERATORS
 from exceptions import (
     InvalidTokenException,
     InvalidExpressionException,
@@ -22,225 +11,394 @@ from exceptions import (
 
 )
 
+# Token kinds
+NUMBER = 'number'
+NAME = 'name'
+OPERATOR = 'operator'
+LEFT_PARENTHESIS = 'left_parenthesis'
+RIGHT_PARENTHESIS = 'right_parenthesis'
+UNKNOWN = 'unknown'
+
+# kind: one of the token kinds above
+# text: the token without spaces
+# value: the parsed float of a number (int in exact mode), None otherwise
+# start, end: the span of the token in the source expression
+Token = namedtuple('Token', ['kind', 'text', 'value', 'start', 'end'])
+
+# Characters that can continue a number or a name, directly or after spaces
+TOKEN_CHARACTERS = '0123456789.ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz_ '
+
+# Longest integer literal accepted in exact mode (int() refuses longer strings)
+MAX_LITERAL_DIGITS = 4300
+
+# Spaces are ignored everywhere, including inside numbers and names ("2 3" is 23)
+TOKEN_PATTERN = re.compile(r"""
+    \ *(?:
+        (?P<number>\d(?:\ *\d)*(?:\ *\.(?:\ *\d)*)?)
+      | (?P<name>[A-Za-z_](?:\ *[A-Za-z0-9_])*)
+      | (?P<other>[^ ])
+    )
+""", re.VERBOSE | re.DOTALL)
+
+# A numeric literal of an expression without spaces: not part of a name, and
+# neither preceded nor followed by a point or a digit, so that a slot
+# replacing it always scans as a number of its own
+LITERAL_PATTERN = re.compile(r'(?<![A-Za-z0-9_.])\d+(?:\.\d*)?(?![0-9.])')
+
+# Text of a literal slot in a template key
+SLOT = '0'
+
 
 class ExpressionParser:
-    def __init__(self):
+    def __init__(self, exact=False):
         """
         Initialize the expression parser with supported operators.
+
+        :param exact: bool
+            Keep integer literals as Python ints and use the exact operators.
         """
-        self.operators = {
-            '+': AdditionOperator(),
-            '-': SubtractionOperator(),
-            'u-': UnaryMinusOperator(),
-            '~': TildeOperator(),
-            '*': MultiplicationOperator(),
-            '/': DivisionOperator(),
-            '^': PowerOperator(),
-            '!': FactorialOperator(),
-            '%': ModuloOperator(),
-            '$': MaxOperator(),
-            '&': MinOperator(),
-            '@': AverageOperator(),
-            '#': DigitSumOperator(),
-        }
+        self.exact = exact
+        self.operators = EXACT_OPERATORS if exact else OPERATORS
         self.operator_symbols = set(self.operators.keys())
         self.postfix_operators = {'!', '#'}
         self.left_parenthesis = '('
         self.right_parenthesis = ')'
+        # Profiler receiving the stage timings, None when profiling is off
+        self.profiler = None
 
     def tokenize(self, expression):
         """
-        Tokenize a mathematical expression into numbers, operators, and parentheses.
+        Tokenize a mathematical expression into numbers, variables, operators, and parentheses.
+
+        The expression is scanned once. Numbers are parsed while scanning, every
+        token keeps its span in the source, and consecutive tildes and empty
+        parentheses are detected while scanning.
+
+        :param expression: str
+        :return: list of Token
         """
-        # remove spaces
-        expression = expression.replace(' ', '')
         tokens = []
-        i = 0
-        length = len(expression)
-
-        while i < length:
-            ch = expression[i]
-
-            if ch.isdigit():
-                start = i
-                i += 1
-                has_decimal = False
-                # collect num til non digit and not dot
-                while i < length:
-                    if expression[i].isdigit():
-                        i += 1
-                    elif expression[i] == '.' and not has_decimal:
-                        has_decimal = True
-                        i += 1
-                    else:
-                        break
-                tokens.append(expression[start:i])
+        previous = None
+        empty_parenthesis = None
+
+        for token in self._scan(expression, 0, None, expression):
+            if token.kind == RIGHT_PARENTHESIS and empty_parenthesis is None and previous is not None \
+                    and previous.kind == LEFT_PARENTHESIS:
+                # Reported after the scan: consecutive tildes take precedence
+                empty_parenthesis = previous.start
+            tokens.append(token)
+            previous = token
+
+        if empty_parenthesis is not None:
+            raise InvalidExpressionException(
+                "Empty parentheses '()' are not allowed in the expression.",
+                expression,
+                empty_parenthesis
+            )
+
+        return tokens
 
-            # Checking Parentheses and Recognized Operators
-            elif ch in self.operator_symbols or ch == self.left_parenthesis or ch == self.right_parenthesis:
-                tokens.append(ch)
-                i += 1
+    def iter_tokens(self, chunks):
+        """
+        Tokenize an expression read in chunks, yielding tokens as they are found.
+
+        Only the text after the last operator or parenthesis of the chunks read
+        so far is kept, so memory does not grow with the length of the input.
+        Errors are raised as soon as they are met and carry no source excerpt.
+
+        :param chunks: iterable of str
+        :return: iterator of Token
+            Spans are offsets in the whole input.
+        """
+        pending = ''
+        offset = 0
+        previous = None
+
+        for chunk in chunks:
+            pending += chunk
+            # A token may continue past the end of the chunk unless the text ends
+            # with an operator, a parenthesis or another single-character token
+            cut = len(pending.rstrip(TOKEN_CHARACTERS))
+            if not cut:
+                continue
+            for token in self._scan(pending[:cut], offset, previous, None):
+                self._check_empty_parentheses(previous, token)
+                yield token
+                previous = token
+            pending = pending[cut:]
+            offset += cut
+
+        for token in self._scan(pending, offset, previous, None):
+            self._check_empty_parentheses(previous, token)
+            yield token
+            previous = token
+
+    @staticmethod
+    def _check_empty_parentheses(previous, token):
+        if token.kind == RIGHT_PARENTHESIS and previous is not None and previous.kind == LEFT_PARENTHESIS:
+            raise InvalidExpressionException("Empty parentheses '()' are not allowed in the expression.")
+
+    def _scan(self, source, offset, previous, expression):
+        """
+        Yield the tokens of a text that starts at the given offset of the input.
+
+        :param previous: Token or None
+            The token before the text, for the consecutive tildes check.
+        :param expression: str or None
+            The whole input when available, used in error messages.
+        """
+        for match in TOKEN_PATTERN.finditer(source):
+            kind = match.lastgroup
+            start, end = match.span(kind)
+            start += offset
+            end += offset
+            text = match.group(kind)
+
+            if kind == NUMBER:
+                if ' ' in text:
+                    text = text.replace(' ', '')
+                if self.exact and '.' not in text:
+                    if len(text) > MAX_LITERAL_DIGITS:
+                        raise InvalidExpressionException("Number is too large", expression, start)
+                    token = Token(NUMBER, text, int(text), start, end)
+                else:
+                    token = Token(NUMBER, text, float(text), start, end)
+            elif kind == NAME:
+                if ' ' in text:
+                    text = text.replace(' ', '')
+                token = Token(NAME, text, None, start, end)
+            elif text in self.operator_symbols:
+                if text == '~' and previous is not None and previous.text == '~':
+                    raise ConsecutiveTildesException(expression, start)
+                token = Token(OPERATOR, text, None, start, end)
+            elif text == self.left_parenthesis:
+                token = Token(LEFT_PARENTHESIS, text, None, start, end)
+            elif text == self.right_parenthesis:
+                token = Token(RIGHT_PARENTHESIS, text, None, start, end)
             else:
                 # Any Unknown or Unexpected Character
-                tokens.append(ch)
-                i += 1
-
-        # Checking Consecutive Tildes
-        for i in range(len(tokens) - 1):
-            if tokens[i] == '~' and tokens[i + 1] == '~':
-                raise ConsecutiveTildesException(expression, expression.find('~~') + 1)
-
-        # Checking Empty Parentheses
-        for i in range(len(tokens) - 1):
-            if tokens[i] == self.left_parenthesis and tokens[i + 1] == self.right_parenthesis:
-                raise InvalidExpressionException(
-                    "Empty parentheses '()' are not allowed in the expression.",
-                    expression,
-                    i
-                )
+                token = Token(UNKNOWN, text, None, start, end)
 
-        return tokens
+            yield token
+            previous = token
 
     def is_operator(self, token):
         return token in self.operator_symbols
 
     @staticmethod
-    def is_number(token):
-        try:
-            float(token)
-            return True
-        except ValueError:
-            return False
-
-    def wrap_negatives(self, tokens):
+    def is_variable(token):
+        return isinstance(token, str) and token.isascii() and token.isidentifier()
+
+    def wrap_negatives(self, tokens, expression=None):
         """
         Identifies and processes unary minus signs in the tokenized expression.
+
+        :param tokens: list of Token
+        :param expression: str, optional
+            The source expression, used in error messages.
+        :return: list of Token
+            The tokens with unary minuses replaced by 'u-' operators.
         """
-        new_tokens = []
-        i = 0
+        if expression is None:
+            expression = ''.join(token.text for token in tokens)
+        return list(self.iter_wrap_negatives(tokens, expression))
+
+    def iter_wrap_negatives(self, tokens, expression=None):
+        """
+        Replace unary minus signs with 'u-' operators, one token at a time.
+
+        A unary minus after a binary operator is wrapped in synthetic parentheses
+        together with its operand.
+
+        :param tokens: iterable of Token
+        :param expression: str, optional
+            The source expression, used in error messages.
+        :return: iterator of Token
+        """
+        tokens = iter(tokens)
+        token = next(tokens, None)
+        previous = None  # Text of the previous source token
+        last = None  # Text of the last token yielded
 
         # Handle leading sequence of unary minuses
-        while i < len(tokens) and tokens[i] == '-':
-            new_tokens.append('u-')
-            i += 1
+        while token is not None and token.text == '-':
+            yield self._unary_minus(token)
+            previous, last = '-', 'u-'
+            token = next(tokens, None)
 
         # Process the rest of the tokens
-        while i < len(tokens):
-            token = tokens[i]
-            if token == '-':
-                prev_token = tokens[i - 1] if i > 0 else None
-                if prev_token in self.operator_symbols or prev_token == self.left_parenthesis:
-                    if prev_token in self.postfix_operators:
-                        # Binary minus case after postfix operator
-                        new_tokens.append(token)
-                        i += 1
-                    else:
-                        # Handling minus after '('
-                        if prev_token == self.left_parenthesis:
-                            unary_minus_count = 0
-                            while i < len(tokens) and tokens[i] == '-':
-                                new_tokens.append('u-')
-                                unary_minus_count += 1
-                                i += 1
-                            if i < len(tokens):
-                                if tokens[i] == '~':
-                                    raise InvalidExpressionException(
-                                        "Tilde ('~') cannot follow a unary minus or a sequence of unary minuses.",
-                                        ''.join(tokens), i
-                                    )
-                                if self.is_number(tokens[i]) or tokens[i] == self.left_parenthesis:
-                                    new_tokens.append(tokens[i])
-                                    i += 1
-                                else:
-                                    raise InvalidExpressionException(
-                                        f"Invalid token sequence after unary minus: '{tokens[i]}'",
-                                        ''.join(tokens), i
-                                    )
-                        else:
-                            # Unary minus case with parentheses
-                            new_tokens.append('(')
-                            unary_minus_count = 0
-                            while i < len(tokens) and tokens[i] == '-':
-                                new_tokens.append('u-')
-                                unary_minus_count += 1
-                                i += 1
-                            if i < len(tokens):
-                                if tokens[i] == '~':
-                                    raise InvalidExpressionException(
-                                        "Tilde ('~') cannot follow a unary minus or a sequence of unary minuses.",
-                                        ''.join(tokens), i
-                                    )
-                                if self.is_number(tokens[i]) or tokens[i] == self.left_parenthesis:
-                                    new_tokens.append(tokens[i])
-                                    new_tokens.append(')')
-                                    i += 1
-                                else:
-                                    raise InvalidExpressionException(
-                                        f"Invalid token sequence after unary minus: '{tokens[i]}'",
-                                        ''.join(tokens), i
-                                    )
-                elif prev_token in self.postfix_operators:
-                    # Binary minus case after postfix operator
-                    new_tokens.append(token)
-                    i += 1
-                else:
-                    # Binary minus case
-                    new_tokens.append(token)
-                    i += 1
-            elif token == '~':
+        while token is not None:
+            text = token.text
+            if text == '-' and (previous in self.operator_symbols or previous == self.left_parenthesis) \
+                    and previous not in self.postfix_operators:
+                # Unary minus case: after '(' it needs no parentheses of its own
+                wrap = previous != self.left_parenthesis
+                if wrap:
+                    yield Token(LEFT_PARENTHESIS, '(', None, token.start, token.start)
+                while token is not None and token.text == '-':
+                    yield self._unary_minus(token)
+                    previous, last = '-', 'u-'
+                    token = next(tokens, None)
+                if token is None:
+                    break
+                self._check_unary_minus_operand(token, expression)
+                yield token
+                last = token.text
+                if wrap:
+                    yield Token(RIGHT_PARENTHESIS, ')', None, token.end, token.end)
+                    last = ')'
+            else:
                 # Prevent any tilde following unary minus directly
-                if new_tokens and new_tokens[-1] == 'u-':
+                if text == '~' and last == 'u-':
                     raise InvalidExpressionException(
                         "Tilde ('~') cannot directly follow a unary minus.",
-                        ''.join(tokens), i
+                        expression, token.start
                     )
-                new_tokens.append(token)
-                i += 1
-            else:
-                new_tokens.append(token)
-                i += 1
+                # Binary minus, including after a postfix operator, and any other token
+                yield token
+                last = text
+            previous = token.text
+            token = next(tokens, None)
+
+    @staticmethod
+    def _unary_minus(token):
+        return Token(OPERATOR, 'u-', None, token.start, token.end)
 
-        return new_tokens
+    def _check_unary_minus_operand(self, token, expression):
+        if token.text == '~':
+            raise InvalidExpressionException(
+                "Tilde ('~') cannot follow a unary minus or a sequence of unary minuses.",
+                expression, token.start
+            )
+        if token.kind not in (NUMBER, NAME, LEFT_PARENTHESIS):
+            raise InvalidExpressionException(
+                f"Invalid token sequence after unary minus: '{token.text}'",
+                expression, token.start
+            )
 
     def parse_expression(self, expression):
+        if self.profiler is not None:
+            return self._profiled_parse_expression(expression)
         if not expression.strip():
             raise InvalidExpressionException("Expression cannot be empty or whitespace only.", expression, 0)
 
         tokens = self.tokenize(expression)
-        tokens = self.wrap_negatives(tokens)
+        tokens = self.wrap_negatives(tokens, expression)
+        return self.parse_tokens(tokens, expression)
+
+    def template(self, expression):
+        """
+        Split an expression into its structural template and its literals.
 
-        output_queue = []
+        Parsing depends on the kinds of the tokens, never on the values of the
+        numbers, so expressions with the same template key parse to the same
+        postfix program up to their literals, which the program lists in
+        source order.
+
+        :param expression: str
+        :return: tuple
+            The template key (the expression without spaces, with every literal
+            replaced by a slot) and the literals as strings.
+        """
+        normalized = expression.replace(' ', '')
+        return LITERAL_PATTERN.sub(SLOT, normalized), LITERAL_PATTERN.findall(normalized)
+
+    def parse_template(self, key):
+        """
+        Parse a template key into a postfix program over its slots.
+
+        :param key: str
+            A template key returned by ``template``.
+        :return: tuple
+            The postfix program, with the literal of slot i replaced by the
+            name '_i', and the slot names in order.
+        """
+        postfix = self.parse_expression(key)
+        slots = []
+        for i, token in enumerate(postfix):
+            if isinstance(token, (int, float)):
+                postfix[i] = f"_{len(slots)}"
+                slots.append(postfix[i])
+        return postfix, slots
+
+    def _profiled_parse_expression(self, expression):
+        profiler = self.profiler
+        if not expression.strip():
+            error = InvalidExpressionException("Expression cannot be empty or whitespace only.", expression, 0)
+            profiler.record_error(error)
+            raise error
+
+        tokens = profiler.time('tokenize', self.tokenize, expression)
+        tokens = profiler.time('wrap_negatives', self.wrap_negatives, tokens, expression)
+        return profiler.time('parse_tokens', self.parse_tokens, tokens, expression)
+
+    def parse_tokens(self, tokens, expression):
+        """
+        Convert tokens, with unary minuses already wrapped, to postfix notation
+        with the shunting-yard algorithm.
+
+        :param tokens: list of Token
+        :param expression: str
+            The source expression, used in error messages.
+        :return: list
+            The postfix program.
+        """
+        return list(self.iter_postfix(tokens, expression))
+
+    def iter_postfix(self, tokens, expression=None):
+        """
+        Convert tokens to postfix notation, yielding the program as it is emitted.
+
+        Only the operator stack is kept, so memory grows with the nesting depth
+        of the expression rather than with its length.
+
+        :param tokens: iterable of Token
+            Tokens with unary minuses already wrapped.
+        :param expression: str, optional
+            The source expression, used in error messages.
+        :return: iterator
+            Numbers, variable names and operator symbols.
+        """
         operator_stack = []
         previous_token_type = None
-        current_position = 0
+        tokens = iter(tokens)
+        following = next(tokens, None)
+        end = 0
 
-        for i, token in enumerate(tokens):
-            token_str = str(token)
-            token_position = expression.find(token_str, current_position)
-            current_position = token_position + len(token_str)
+        while following is not None:
+            token = following
+            following = next(tokens, None)
+            end = token.end
+            kind = token.kind
+            text = token.text
 
-            if self.is_number(token):
-                output_queue.append(float(token))
+            if kind == NUMBER:
+                yield token.value
+                previous_token_type = 'number'
+            elif kind == NAME:
+                # Variables are kept by name and bound at evaluation time
+                yield text
                 previous_token_type = 'number'
-            elif token == '~':
-                if i + 1 >= len(tokens) or not (self.is_number(tokens[i + 1]) or tokens[i + 1] in ('-', '(')):
+            elif text == '~':
+                if following is None or not (following.kind in (NUMBER, NAME) or following.text in ('-', '(')):
                     raise InvalidExpressionException(
-                        f"Tilde ('~') must be followed by a number, a minus sign, or an opening parenthesis.",
+                        f"Tilde ('~') must be followed by a number, a variable, a minus sign,"
+                        f" or an opening parenthesis.",
                         expression,
-                        token_position
+                        token.start
                     )
-                operator_stack.append(token)
+                operator_stack.append(text)
                 previous_token_type = 'operator'
-            elif token in self.postfix_operators:
+            elif text in self.postfix_operators:
                 if previous_token_type not in ('number', 'right_parenthesis', 'postfix_operator'):
                     raise InvalidExpressionException(
-                        f"Postfix operator '{token}' must follow a number, another postfix operator,"
+                        f"Postfix operator '{text}' must follow a number, another postfix operator,"
                         f" or a closing parenthesis.",
                         expression,
-                        token_position
+                        token.start
                     )
 
-                o1 = self.operators[token]
+                o1 = self.operators[text]
                 while operator_stack:
                     top = operator_stack[-1]
                     if top == self.left_parenthesis:
@@ -251,21 +409,19 @@ class ExpressionParser:
                     if top == '~' and o1.precedence == o2.precedence and o1.associativity == 'right' \
                             and o2.associativity == 'right':
                         popped = operator_stack.pop()
-                        output_queue.append(popped)
+                        yield popped
                     else:
                         if (o2.associativity == 'left' and o2.precedence >= o1.precedence) or \
                            (o2.associativity == 'right' and o2.precedence > o1.precedence):
                             popped = operator_stack.pop()
-                            output_queue.append(popped)
+                            yield popped
                         else:
                             break
 
-                output_queue.append(token)
+                yield text
                 previous_token_type = 'postfix_operator'
-            elif self.is_operator(token):
-                o1 = self.operators.get(token)
-                if not o1:
-                    raise InvalidTokenException(token, expression, token_position)
+            elif kind == OPERATOR:
+                o1 = self.operators[text]
 
                 while operator_stack:
                     top = operator_stack[-1]
@@ -277,34 +433,32 @@ class ExpressionParser:
                     if (o1.associativity == 'left' and o1.precedence <= o2.precedence) or \
                        (o1.associativity == 'right' and o1.precedence < o2.precedence):
                         popped = operator_stack.pop()
-                        output_queue.append(popped)
+                        yield popped
                     else:
                         break
 
-                operator_stack.append(token)
+                operator_stack.append(text)
                 previous_token_type = 'operator'
-            elif token == self.left_parenthesis:
-                operator_stack.append(token)
+            elif kind == LEFT_PARENTHESIS:
+                operator_stack.append(text)
                 previous_token_type = 'left_parenthesis'
-            elif token == self.right_parenthesis:
+            elif kind == RIGHT_PARENTHESIS:
                 while operator_stack and operator_stack[-1] != self.left_parenthesis:
                     popped = operator_stack.pop()
-                    output_queue.append(popped)
+                    yield popped
                 if not operator_stack:
-                    raise MismatchedParenthesesException(expression, token_position)
+                    raise MismatchedParenthesesException(expression, token.start)
                 operator_stack.pop()  # Pop the '('
                 previous_token_type = 'right_parenthesis'
             else:
-                raise InvalidTokenException(token, expression, token_position)
+                raise InvalidTokenException(text, expression, token.start)
 
         # Pop any remaining operators
         while operator_stack:
             top = operator_stack.pop()
             if top in (self.left_parenthesis, self.right_parenthesis):
-                raise MismatchedParenthesesException(expression, current_position)
-            output_queue.append(top)
-
-        return output_queue
+                raise MismatchedParenthesesException(expression, end)
+            yield top
 
     def evaluate_postfix(self, postfix_tokens):
         stack = []
@@ -0,0 +1,324 @@
+# ExpressionTree.py
+
+import math
+import sys
+from functools import reduce
+from types import MappingProxyType
+
+from ExpressionParser import ExpressionParser
+from Operators import MAX_EXACT_BITS, MAX_RESULT
+from exceptions import (
+    CalculatorException,
+    InvalidTokenException,
+    MissingOperandException,
+    UndefinedVariableException,
+)
+
+NO_VARIABLES = MappingProxyType({})
+
+# Unary operators that negate their operand
+NEGATIONS = ('u-', '~')
+# Binary operators flattened into n-ary nodes. '+' is summed with math.fsum,
+# which does not depend on the order of its operands, so chains are flattened
+# on both sides. The others are only flattened along their left operand, which
+# keeps the exact left-to-right folding of the binary operators.
+FLATTENED_BOTH_SIDES = ('+',)
+FLATTENED_LEFT = ('*', '$', '&')
+
+# Instructions of the linear program of a tree
+CONST, NAME, UNARY, BINARY, NARY = range(5)
+
+
+class Node:
+    __slots__ = ()
+
+
+class Number(Node):
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __repr__(self):
+        return f"Number({self.value!r})"
+
+
+class Variable(Node):
+    __slots__ = ('name',)
+
+    def __init__(self, name):
+        self.name = name
+
+    def __repr__(self):
+        return f"Variable({self.name!r})"
+
+
+class Unary(Node):
+    __slots__ = ('operator', 'operand')
+
+    def __init__(self, operator, operand):
+        self.operator = operator
+        self.operand = operand
+
+    @property
+    def children(self):
+        return (self.operand,)
+
+    def __repr__(self):
+        return f"Unary({self.operator.symbol!r}, {self.operand!r})"
+
+
+class Binary(Node):
+    __slots__ = ('operator', 'left', 'right')
+
+    def __init__(self, operator, left, right):
+        self.operator = operator
+        self.left = left
+        self.right = right
+
+    @property
+    def children(self):
+        return self.left, self.right
+
+    def __repr__(self):
+        return f"Binary({self.operator.symbol!r}, {self.left!r}, {self.right!r})"
+
+
+class NAry(Node):
+    __slots__ = ('operator', 'operands')
+
+    def __init__(self, operator, operands):
+        self.operator = operator
+        self.operands = operands
+
+    @property
+    def children(self):
+        return self.operands
+
+    def __repr__(self):
+        return f"NAry({self.operator.symbol!r}, {self.operands!r})"
+
+
+def _sum(operator, values):
+    if all(type(value) is int for value in values):
+        # No partial sum is longer than the longest operand plus one bit per
+        # doubling of the count, so under MAX_EXACT_BITS the size checks of
+        # the exact operator cannot trigger
+        if max(value.bit_length() for value in values) + len(values).bit_length() <= MAX_EXACT_BITS:
+            return sum(values)
+        return reduce(operator.evaluate, values)
+    try:
+        return math.fsum(values)
+    except (TypeError, ValueError, OverflowError):
+        # Complex operands, inf - inf or an intermediate overflow
+        return reduce(operator.evaluate, values)
+
+
+def _product(operator, values):
+    # No partial product can exceed the product of the magnitudes above 1, so
+    # under that bound the per-step overflow checks cannot trigger
+    try:
+        bound = math.prod(max(1.0, abs(value)) for value in values)
+    except (TypeError, OverflowError):
+        bound = math.inf
+    if bound <= MAX_RESULT:
+        return math.prod(values)
+    return reduce(operator.evaluate, values)
+
+
+def _max(operator, values):
+    return max(values)
+
+
+def _min(operator, values):
+    return min(values)
+
+
+NARY_FUNCTIONS = {'+': _sum, '*': _product, '$': _max, '&': _min}
+
+
+class ExpressionTree:
+    def __init__(self, root):
+        """
+        Initialize a tree and linearize it for evaluation.
+
+        :param root: Node
+        """
+        self.root = root
+        self.program = self._linearize(root)
+
+    @classmethod
+    def build(cls, postfix, operators):
+        """
+        Build the tree of a postfix program.
+
+        :param postfix: list
+            The postfix tokenized expression.
+        :param operators: dict
+            Maps operator symbols to Operator instances.
+        :return: ExpressionTree
+        :raises CalculatorException: if the program is not a single well-formed expression.
+        """
+        stack = []
+        for token in postfix:
+            if isinstance(token, str) and token in operators:
+                operator = operators[token]
+                if len(stack) < operator.arity:
+                    raise MissingOperandException(operator.symbol)
+                if operator.arity == 1:
+                    stack.append(Unary(operator, stack.pop()))
+                else:
+                    right = stack.pop()
+                    stack.append(Binary(operator, stack.pop(), right))
+            elif ExpressionParser.is_variable(token):
+                stack.append(Variable(token))
+            elif isinstance(token, (int, float)):
+                stack.append(Number(token))
+            else:
+                raise InvalidTokenException(token)
+        if len(stack) != 1:
+            raise CalculatorException("Invalid expression structure.")
+        return cls(stack[0])
+
+    def optimize(self):
+        """
+        Return an optimized copy of the tree.
+
+        Pairs of negations ('u-', '~') cancel out, constant subtrees are folded
+        (subtrees whose evaluation raises are kept so the error surfaces at
+        evaluation time), and chains of '+', '*', '$' and '&' become n-ary nodes.
+
+        :return: ExpressionTree
+        """
+        root = self._rewrite(self.root, self._collapse_negations)
+        root = self._rewrite(root, self._fold_constants)
+        root = self._rewrite(root, self._flatten_chains)
+        return ExpressionTree(root)
+
+    def evaluate(self, variables=NO_VARIABLES):
+        """
+        Evaluate the tree.
+
+        :param variables: dict, optional
+            Values of the variables used by the expression.
+        :return: float
+            The result of the calculation.
+        """
+        stack = []
+        push = stack.append
+        pop = stack.pop
+
+        for kind, payload, count in self.program:
+            if kind == CONST:
+                push(payload)
+            elif kind == BINARY:
+                right = pop()
+                stack[-1] = payload.evaluate(stack[-1], right)
+            elif kind == UNARY:
+                stack[-1] = payload.evaluate(stack[-1])
+            elif kind == NARY:
+                values = stack[-count:]
+                del stack[-count:]
+                push(NARY_FUNCTIONS[payload.symbol](payload, values))
+            else:
+                if payload not in variables:
+                    raise UndefinedVariableException(payload)
+                push(variables[payload])
+
+        return stack[0]
+
+    def __sizeof__(self):
+        return object.__sizeof__(self) + sys.getsizeof(self.program) + \
+            sum(sys.getsizeof(instruction) for instruction in self.program)
+
+    @staticmethod
+    def _postorder(root):
+        # Iterative, so that long chains do not hit the recursion limit
+        order = []
+        pending = [root]
+        while pending:
+            node = pending.pop()
+            order.append(node)
+            if not isinstance(node, (Number, Variable)):
+                pending.extend(node.children)
+        order.reverse()
+        return order
+
+    def _linearize(self, root):
+        program = []
+        for node in self._postorder(root):
+            if isinstance(node, Number):
+                program.append((CONST, node.value, 0))
+            elif isinstance(node, Variable):
+                program.append((NAME, node.name, 0))
+            elif isinstance(node, Unary):
+                program.append((UNARY, node.operator, 1))
+            elif isinstance(node, Binary):
+                program.append((BINARY, node.operator, 2))
+            else:
+                program.append((NARY, node.operator, len(node.operands)))
+        return program
+
+    def _rewrite(self, root, rule):
+        """
+        Rebuild the tree bottom-up, applying the rule to every node once its
+        children have been rewritten.
+        """
+        rewritten = []
+        for node in self._postorder(root):
+            if isinstance(node, Unary):
+                node = Unary(node.operator, rewritten.pop())
+            elif isinstance(node, Binary):
+                right = rewritten.pop()
+                node = Binary(node.operator, rewritten.pop(), right)
+            elif isinstance(node, NAry):
+                count = len(node.operands)
+                operands = rewritten[-count:]
+                del rewritten[-count:]
+                node = NAry(node.operator, operands)
+            rewritten.append(rule(node))
+        return rewritten[0]
+
+    @staticmethod
+    def _collapse_negations(node):
+        if isinstance(node, Unary) and node.operator.symbol in NEGATIONS:
+            inner = node.operand
+            if isinstance(inner, Unary) and inner.operator.symbol in NEGATIONS:
+                return inner.operand
+        return node
+
+    @staticmethod
+    def _fold_constants(node):
+        try:
+            if isinstance(node, Unary) and isinstance(node.operand, Number):
+                return Number(node.operator.evaluate(node.operand.value))
+            if isinstance(node, Binary) and isinstance(node.left, Number) and isinstance(node.right, Number):
+                return Number(node.operator.evaluate(node.left.value, node.right.value))
+        except Exception:
+            pass
+        return node
+
+    @staticmethod
+    def _flatten_chains(node):
+        if not isinstance(node, Binary):
+            return node
+        symbol = node.operator.symbol
+        if symbol not in FLATTENED_BOTH_SIDES and symbol not in FLATTENED_LEFT:
+            return node
+
+        def operands_of(child):
+            if isinstance(child, NAry) and child.operator.symbol == symbol:
+                return child.operands
+            if isinstance(child, Binary) and child.operator.symbol == symbol:
+                return [child.left, child.right]
+            return [child]
+
+        operands = operands_of(node.left)
+        if symbol in FLATTENED_BOTH_SIDES:
+            operands = operands + operands_of(node.right)
+        else:
+            operands = operands + [node.right]
+        if len(operands) == 2:
+            # A lone binary operation is cheaper as is
+            return node
+        return NAry(node.operator, operands)
@@ -1,9 +1,14 @@
+import math
 from abc import ABC, abstractmethod
+from types import MappingProxyType
+from kernels import FACTORIALS, factorial, is_scientific, digit_sum, text_digit_sum
 from exceptions import DivisionByZeroException, FactorialNegativeNumberException, FactorialFloatException, \
     ResultTooLargeException, InvalidExpressionException
 
 
 class Operator(ABC):
+    __slots__ = ('symbol', 'precedence', 'associativity', 'arity')
+
     def __init__(self, symbol, precedence, associativity, arity):
         """
         Initialize the operator.
@@ -31,6 +36,8 @@ class Operator(ABC):
 
 
 class AdditionOperator(Operator):
+    __slots__ = ()
+
     def __init__(self):
         super().__init__('+', 1, 'left', 2)
 
@@ -41,6 +48,8 @@ class AdditionOperator(Operator):
 
 
 class SubtractionOperator(Operator):
+    __slots__ = ()
+
     def __init__(self):
         super().__init__('-', 1, 'left', 2)
 
@@ -51,6 +60,8 @@ class SubtractionOperator(Operator):
 
 
 class MultiplicationOperator(Operator):
+    __slots__ = ()
+
     def __init__(self):
         super().__init__('*', 2, 'left', 2)
 
@@ -69,6 +80,8 @@ class MultiplicationOperator(Operator):
 
 
 class DivisionOperator(Operator):
+    __slots__ = ()
+
     def __init__(self):
         super().__init__('/', 2, 'left', 2)
 
@@ -77,12 +90,15 @@ class DivisionOperator(Operator):
             raise ValueError("Second operand is required for DivisionOperator.")
         if operand2 == 0:
             raise DivisionByZeroException()
-        if abs(operand1 / operand2) > MAX_RESULT:
+        result = operand1 / operand2
+        if abs(result) > MAX_RESULT:
             raise ResultTooLargeException(f"Result too large: {operand1} / {operand2}")
-        return operand1 / operand2
+        return result
 
 
 class PowerOperator(Operator):
+    __slots__ = ()
+
     def __init__(self):
         super().__init__('^', 3, 'right', 2)
 
@@ -101,13 +117,21 @@ class PowerOperator(Operator):
 
 
 MAX_RESULT = 1e308
+# Size limit of the integers produced in exact mode, about 315,000 digits
+MAX_EXACT_BITS = 1 << 20
 
 
 class FactorialOperator(Operator):
+    __slots__ = ()
+
     def __init__(self):
         super().__init__('!', 6, 'right', 1)
 
     def evaluate(self, operand1, operand2=None):
+        result = factorial(operand1)
+        if result is not None:
+            return result
+
         if abs(operand1 - round(operand1)) < 0.0001:
             operand1 = round(operand1)
 
@@ -120,13 +144,12 @@ class FactorialOperator(Operator):
         if operand1 > 170:
             raise ResultTooLargeException(f"Factorial input too large: {operand1}")
 
-        result = 1
-        for i in range(1, operand1 + 1):
-            result *= i
-        return result
+        return FACTORIALS[operand1]
 
 
 class UnaryMinusOperator(Operator):
+    __slots__ = ()
+
     def __init__(self):
         super().__init__('u-', 3, 'right', 1)
 
@@ -135,6 +158,8 @@ class UnaryMinusOperator(Operator):
 
 
 class TildeOperator(Operator):
+    __slots__ = ()
+
     def __init__(self):
         super().__init__('~', 6, 'right', 1)
 
@@ -143,6 +168,8 @@ class TildeOperator(Operator):
 
 
 class ModuloOperator(Operator):
+    __slots__ = ()
+
     def __init__(self):
         super().__init__('%', 4, 'left', 2)
 
@@ -155,6 +182,8 @@ class ModuloOperator(Operator):
 
 
 class MaxOperator(Operator):
+    __slots__ = ()
+
     def __init__(self):
         super().__init__('$', 5, 'left', 2)
 
@@ -165,6 +194,8 @@ class MaxOperator(Operator):
 
 
 class MinOperator(Operator):
+    __slots__ = ()
+
     def __init__(self):
         super().__init__('&', 5, 'left', 2)
 
@@ -175,6 +206,8 @@ class MinOperator(Operator):
 
 
 class AverageOperator(Operator):
+    __slots__ = ()
+
     def __init__(self):
         super().__init__('@', 5, 'left', 2)
 
@@ -185,17 +218,176 @@ class AverageOperator(Operator):
 
 
 class DigitSumOperator(Operator):
+    __slots__ = ()
+
     def __init__(self):
         super().__init__('#', 6, 'right', 1)
 
     def evaluate(self, operand1, operand2=None):
-        operand_str = str(operand1)
-
-        if 'e' in operand_str.lower():
+        if is_scientific(operand1):
             raise InvalidExpressionException(f"Number is too large: {operand1}")
 
         if float(operand1) < 0:
             raise InvalidExpressionException(f"DigitSumOperator is not defined for negative numbers: {operand1}")
 
-        digit_sum = sum(int(digit) for digit in operand_str if digit.isdigit())
-        return digit_sum
+        return digit_sum(operand1)
+
+
+def _exact(result):
+    if result.bit_length() > MAX_EXACT_BITS:
+        raise ResultTooLargeException(f"Result too large: {result.bit_length()} bits")
+    return result
+
+
+def _check_float_range(operand1, operand2):
+    # Mixing a huge integer with a float would overflow while converting it
+    for operand in (operand1, operand2):
+        if type(operand) is int and operand.bit_length() > 1024:
+            raise ResultTooLargeException(f"Integer too large for a float: {operand.bit_length()} bits")
+
+
+class ExactAdditionOperator(AdditionOperator):
+    __slots__ = ()
+
+    def evaluate(self, operand1, operand2=None):
+        if type(operand1) is int and type(operand2) is int:
+            return _exact(operand1 + operand2)
+        _check_float_range(operand1, operand2)
+        return super().evaluate(operand1, operand2)
+
+
+class ExactSubtractionOperator(SubtractionOperator):
+    __slots__ = ()
+
+    def evaluate(self, operand1, operand2=None):
+        if type(operand1) is int and type(operand2) is int:
+            return _exact(operand1 - operand2)
+        _check_float_range(operand1, operand2)
+        return super().evaluate(operand1, operand2)
+
+
+class ExactMultiplicationOperator(MultiplicationOperator):
+    __slots__ = ()
+
+    def evaluate(self, operand1, operand2=None):
+        if type(operand1) is int and type(operand2) is int:
+            if operand1.bit_length() + operand2.bit_length() > MAX_EXACT_BITS + 1:
+                raise ResultTooLargeException(
+                    f"Result too large: {operand1.bit_length() + operand2.bit_length()} bits")
+            return _exact(operand1 * operand2)
+        _check_float_range(operand1, operand2)
+        return super().evaluate(operand1, operand2)
+
+
+class ExactDivisionOperator(DivisionOperator):
+    __slots__ = ()
+
+    def evaluate(self, operand1, operand2=None):
+        if type(operand1) is int and type(operand2) is int and operand2 != 0:
+            quotient, remainder = divmod(operand1, operand2)
+            if not remainder:
+                return quotient
+            # int / int is correctly rounded even when the operands exceed a float
+            try:
+                return super().evaluate(operand1, operand2)
+            except OverflowError:
+                raise ResultTooLargeException("Result too large for a float.")
+        _check_float_range(operand1, operand2)
+        return super().evaluate(operand1, operand2)
+
+
+class ExactPowerOperator(PowerOperator):
+    __slots__ = ()
+
+    def evaluate(self, operand1, operand2=None):
+        if type(operand1) is int and type(operand2) is int and operand2 >= 0:
+            # |a^b| < 2^(b * bits(a)), so oversized results are never computed
+            if abs(operand1) > 1 and operand2 * operand1.bit_length() > MAX_EXACT_BITS + operand2:
+                raise ResultTooLargeException(f"Result too large: about {operand2 * operand1.bit_length()} bits")
+            return _exact(operand1 ** operand2)
+        _check_float_range(operand1, operand2)
+        return super().evaluate(operand1, operand2)
+
+
+class ExactFactorialOperator(FactorialOperator):
+    __slots__ = ()
+
+    def evaluate(self, operand1, operand2=None):
+        if type(operand1) is not int:
+            return super().evaluate(operand1, operand2)
+        if operand1 < 0:
+            raise FactorialNegativeNumberException(operand1)
+        if operand1 < len(FACTORIALS):
+            return FACTORIALS[operand1]
+        # log2(n!) from the log-gamma function, so oversized results are never computed
+        if operand1 > MAX_EXACT_BITS:
+            raise ResultTooLargeException(f"Factorial input too large: {operand1.bit_length()}-bit integer")
+        if math.lgamma(operand1 + 1) / math.log(2) > MAX_EXACT_BITS:
+            raise ResultTooLargeException(f"Factorial input too large: {operand1}")
+        # math.factorial multiplies by binary splitting over the odd parts
+        return math.factorial(operand1)
+
+
+class ExactAverageOperator(AverageOperator):
+    __slots__ = ()
+
+    def evaluate(self, operand1, operand2=None):
+        if type(operand1) is int and type(operand2) is int:
+            total = operand1 + operand2
+            if not total % 2:
+                return total // 2
+        _check_float_range(operand1, operand2)
+        return super().evaluate(operand1, operand2)
+
+
+class ExactDigitSumOperator(DigitSumOperator):
+    __slots__ = ()
+
+    def evaluate(self, operand1, operand2=None):
+        if type(operand1) is not int:
+            return super().evaluate(operand1, operand2)
+        if operand1 < 0:
+            raise InvalidExpressionException(f"DigitSumOperator is not defined for negative numbers: {operand1}")
+        return text_digit_sum(_decimal(operand1))
+
+
+def _decimal(number):
+    # str() refuses integers above sys.get_int_max_str_digits() digits, so huge
+    # ones are split in halves around a power of ten
+    if number.bit_length() <= 4096:
+        return str(number)
+    digits = int(number.bit_length() * 0.30103) // 2
+    high, low = divmod(number, 10 ** digits)
+    return _decimal(high) + _decimal(low).zfill(digits)
+
+
+# Operators are stateless, so one shared instance of each serves every parser;
+# the tables are read-only views, safe to share between threads
+OPERATORS = MappingProxyType({
+    '+': AdditionOperator(),
+    '-': SubtractionOperator(),
+    'u-': UnaryMinusOperator(),
+    '~': TildeOperator(),
+    '*': MultiplicationOperator(),
+    '/': DivisionOperator(),
+    '^': PowerOperator(),
+    '!': FactorialOperator(),
+    '%': ModuloOperator(),
+    '$': MaxOperator(),
+    '&': MinOperator(),
+    '@': AverageOperator(),
+    '#': DigitSumOperator(),
+})
+
+# Exact mode keeps integers as Python ints and only falls back to floats for
+# results that are not integers
+EXACT_OPERATORS = MappingProxyType(dict(OPERATORS, **{
+    '+': ExactAdditionOperator(),
+    '-': ExactSubtractionOperator(),
+    '*': ExactMultiplicationOperator(),
+    '/': ExactDivisionOperator(),
+    '^': ExactPowerOperator(),
+    '!': ExactFactorialOperator(),
+    '@': ExactAverageOperator(),
+    '#': ExactDigitSumOperator(),
+}))
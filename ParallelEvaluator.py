@@ -0,0 +1,187 @@
+# ParallelEvaluator.py
+
+from Bytecode import BytecodeMachine
+from Operators import OPERATORS, EXACT_OPERATORS
+from exceptions import CalculatorException, UndefinedVariableException
+
+# Bytecode machines of a pool process, by mode
+_machines = {}
+
+
+def _machine(exact):
+    machine = _machines.get(exact)
+    if machine is None:
+        machine = _machines[exact] = BytecodeMachine(EXACT_OPERATORS if exact else OPERATORS, exact)
+    return machine
+
+
+def evaluate_subtree(postfix, exact, variables):
+    """
+    Evaluate the postfix program of a subtree in a pool process.
+
+    Operator tables do not pickle, so the process uses its own table of the
+    mode. Errors are returned rather than raised: the caller decides whether
+    an error is the first one of the whole expression.
+
+    :return: tuple
+        (True, value) or (False, exception).
+    """
+    machine = _machine(exact)
+    try:
+        return True, machine.execute(machine.assemble(postfix), variables)
+    except Exception as e:
+        return False, e
+
+
+class ParallelEvaluator:
+    def __init__(self, calculator, executor=None, max_workers=None, min_cost=50000):
+        """
+        Initialize an evaluator that spreads one large expression over processes.
+
+        :param calculator: Calculator
+            Provides the operator table and the mode.
+        :param executor: concurrent.futures.Executor, optional
+            Runs the subtrees; by default a process pool is started on first
+            use and shut down by ``close``.
+        :param max_workers: int, optional
+            Size of the default process pool.
+        :param min_cost: float
+            Estimated cost, in operator calls (see CostAnalysis), below which a
+            subtree is not worth sending to another process.
+        """
+        self.calculator = calculator
+        self.max_workers = max_workers
+        self.min_cost = min_cost
+        self._executor = executor
+        self._owns_executor = executor is None
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            from concurrent.futures import ProcessPoolExecutor
+            self._executor = ProcessPoolExecutor(self.max_workers)
+        return self._executor
+
+    def partition(self, postfix):
+        """
+        Find the independent subtrees of a program worth evaluating apart.
+
+        Starting from the whole expression, a subtree whose estimated cost
+        reaches min_cost is split further when one of its operands also
+        reaches it, and is a task of its own otherwise. Operands below the
+        threshold are left to the evaluating process.
+
+        :param postfix: list
+            The postfix tokenized expression.
+        :return: list of tuple
+            The (start, end) slices of the postfix program of the tasks, in
+            source order.
+        :raises CalculatorException: if the program is malformed.
+        """
+        from CostAnalysis import subtree_estimates
+
+        estimates = subtree_estimates(postfix, self.calculator.parser.operators, self.calculator.exact)
+        operators = self.calculator.parser.operators
+        tasks = []
+        pending = [len(postfix) - 1]
+        while pending:
+            end = pending.pop()
+            if estimates[end].cost < self.min_cost:
+                continue
+            token = postfix[end]
+            operands = []
+            if isinstance(token, str) and token in operators:
+                # The last operand ends just before its operator, the first one before the last
+                operands.append(end - 1)
+                if operators[token].arity == 2:
+                    operands.append(end - 1 - estimates[end - 1].tokens)
+            large = [operand for operand in operands if estimates[operand].cost >= self.min_cost]
+            if large:
+                pending.extend(large)
+            else:
+                tasks.append((end + 1 - estimates[end].tokens, end + 1))
+        tasks.sort()
+        return tasks
+
+    def evaluate(self, postfix, variables=None):
+        """
+        Evaluate a postfix program, running its large subtrees in parallel.
+
+        The subtrees run in the pool while this process evaluates the rest of
+        the program in postfix order, taking the outcome of each subtree at
+        its place. The first error met in that order is raised: it is the
+        error a sequential evaluation raises, since a subtree reports the first
+        error of its own tokens and nothing after it is looked at.
+
+        :param postfix: list
+            The postfix tokenized expression.
+        :param variables: dict, optional
+            Values of the variables used by the expression.
+        :return: float
+            The result of the calculation.
+        """
+        calculator = self.calculator
+        variables = variables or {}
+        try:
+            tasks = self.partition(postfix)
+        except CalculatorException:
+            tasks = []
+        if len(tasks) < 2:
+            # Malformed, or nothing to run side by side
+            return calculator.machine.execute(calculator.machine.assemble(postfix), variables)
+
+        futures = [self.executor.submit(evaluate_subtree, postfix[start:end], calculator.exact, variables)
+                   for start, end in tasks]
+        try:
+            return self._combine(postfix, tasks, futures, variables)
+        finally:
+            for future in futures:
+                future.cancel()
+
+    def _combine(self, postfix, tasks, futures, variables):
+        # The program is well-formed: partitioning it checked its structure
+        operators = self.calculator.parser.operators
+        starts = {start: (end, future) for (start, end), future in zip(tasks, futures)}
+        stack = []
+        position = 0
+        count = len(postfix)
+        while position < count:
+            task = starts.get(position)
+            if task is not None:
+                end, future = task
+                ok, outcome = future.result()
+                if not ok:
+                    raise outcome
+                stack.append(outcome)
+                position = end
+                continue
+            token = postfix[position]
+            position += 1
+            if isinstance(token, (int, float)):
+                stack.append(token)
+            elif token in operators:
+                operator = operators[token]
+                if operator.arity == 1:
+                    stack[-1] = operator.evaluate(stack[-1])
+                else:
+                    operand2 = stack.pop()
+                    stack[-1] = operator.evaluate(stack[-1], operand2)
+            elif token in variables:
+                stack.append(variables[token])
+            else:
+                raise UndefinedVariableException(token)
+        return stack[0]
+
+    def close(self):
+        """
+        Shut down the default process pool, if started.
+        """
+        if self._owns_executor and self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
+            self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,265 @@
+# PostfixCompiler.py
+
+import math
+import sys
+from types import MappingProxyType
+
+from ExpressionParser import ExpressionParser
+from Operators import MAX_RESULT
+from kernels import FACTORIALS, is_scientific, digit_sum
+from exceptions import (
+    CalculatorException,
+    InvalidTokenException,
+    InvalidExpressionException,
+    UndefinedVariableException,
+    MissingOperandException,
+    DivisionByZeroException,
+    FactorialNegativeNumberException,
+    FactorialFloatException,
+    ResultTooLargeException,
+)
+
+# Statement templates for every built-in operator. '{r}' is the stack slot that
+# receives the result, '{a}' and '{b}' are the operand slots. Each template
+# mirrors the checks of the matching Operator.evaluate so the generated code
+# raises exactly the same exceptions.
+OPERATOR_TEMPLATES = {
+    '+': (
+        "{r} = {a} + {b}",
+    ),
+    '-': (
+        "{r} = {a} - {b}",
+    ),
+    'u-': (
+        "{r} = -{a}",
+    ),
+    '~': (
+        "{r} = -{a}",
+    ),
+    '*': (
+        "try:",
+        "    {r} = {a} * {b}",
+        "except OverflowError:",
+        "    raise ResultTooLargeException(f'Result too large: {{{a}}} * {{{b}}}')",
+        "if abs({r}) > MAX_RESULT:",
+        "    raise ResultTooLargeException(f'Result too large: {{{r}}}')",
+    ),
+    '/': (
+        "if {b} == 0:",
+        "    raise DivisionByZeroException()",
+        "t = {a} / {b}",
+        "if abs(t) > MAX_RESULT:",
+        "    raise ResultTooLargeException(f'Result too large: {{{a}}} / {{{b}}}')",
+        "{r} = t",
+    ),
+    '^': (
+        "try:",
+        "    {r} = pow({a}, {b})",
+        "except OverflowError:",
+        "    raise ResultTooLargeException(f'Result too large: {{{a}}}^{{{b}}}')",
+        "if abs({r}) > MAX_RESULT:",
+        "    raise ResultTooLargeException(f'Result too large: {{{r}}}')",
+    ),
+    '!': (
+        "n = {a}",
+        "if abs(n - round(n)) < 0.0001:",
+        "    n = round(n)",
+        "if n < 0:",
+        "    raise FactorialNegativeNumberException(n)",
+        "if n != int(n):",
+        "    raise FactorialFloatException(n)",
+        "n = int(n)",
+        "if n > 170:",
+        "    raise ResultTooLargeException(f'Factorial input too large: {{n}}')",
+        "{r} = FACTORIALS[n]",
+    ),
+    '%': (
+        "if {b} == 0:",
+        "    raise DivisionByZeroException()",
+        "{r} = {a} % {b}",
+    ),
+    '$': (
+        "{r} = {b} if {b} > {a} else {a}",
+    ),
+    '&': (
+        "{r} = {b} if {b} < {a} else {a}",
+    ),
+    '@': (
+        "{r} = ({a} + {b}) / 2",
+    ),
+    '#': (
+        "if is_scientific({a}):",
+        "    raise InvalidExpressionException(f'Number is too large: {{{a}}}')",
+        "if float({a}) < 0:",
+        "    raise InvalidExpressionException(f'DigitSumOperator is not defined for negative numbers: {{{a}}}')",
+        "{r} = digit_sum({a})",
+    ),
+}
+
+# Templates for programs that range analysis proved safe: the operators run
+# as plain IEEE arithmetic, without the checks that the analysis ruled out
+UNCHECKED_TEMPLATES = dict(OPERATOR_TEMPLATES, **{
+    '*': ("{r} = {a} * {b}",),
+    '/': ("{r} = {a} / {b}",),
+    '^': ("{r} = {a} ** {b}",),
+    '!': ("{r} = FACTORIALS[round({a})]",),
+    '%': ("{r} = {a} % {b}",),
+})
+
+
+class CompiledExpression:
+    """
+    A bytecode program together with its lazily compiled function and, when
+    the calculator optimizes expressions, its optimized tree.
+    """
+    __slots__ = ('code', 'tree', 'variables', 'function', 'uses', 'estimate')
+
+    def __init__(self, code, tree=None):
+        self.code = code
+        self.tree = tree
+        self.variables = frozenset(code.names)
+        self.function = None
+        self.uses = 0
+        # Static cost estimate, computed when a budget first needs it
+        self.estimate = None
+
+    @property
+    def postfix(self):
+        return self.code.to_postfix()
+
+    def __sizeof__(self):
+        return object.__sizeof__(self) + sys.getsizeof(self.code) + \
+            (sys.getsizeof(self.tree) if self.tree is not None else 0)
+
+
+class PostfixCompiler:
+    def __init__(self, operators, templates=OPERATOR_TEMPLATES):
+        """
+        Initialize the compiler with the operator table of a parser.
+
+        :param operators: dict
+            Maps operator symbols to Operator instances.
+        :param templates: dict
+            Inline templates by operator symbol; other operators are called
+            through their evaluate method.
+        """
+        self.operators = operators
+        self.templates = templates
+
+    def compile(self, postfix, bounds=None, fallback=None):
+        """
+        Compile a postfix program into a reusable Python function.
+
+        The operand stack is resolved at compile time: every stack slot becomes a
+        local variable and every operator becomes straight-line code, so calling
+        the returned function costs no per-token dispatch. Errors that the postfix
+        interpreter would raise (missing operands, leftover values) are emitted
+        at the same point of the program.
+
+        :param postfix: list
+            The postfix tokenized expression.
+        :param bounds: dict, optional
+            Maps variable names to (low, high) intervals checked on entry.
+        :param fallback: callable, optional
+            Called with the variables, and its result returned, when a variable
+            is outside its bounds or the final value is outside the float range
+            of the calculator. Used by programs compiled without checks.
+        :return: callable
+            A function taking an optional dict of variable values that returns the result.
+        """
+        namespace = {
+            'NO_VARIABLES': MappingProxyType({}),
+            'MAX_RESULT': MAX_RESULT,
+            'FACTORIALS': FACTORIALS,
+            'is_scientific': is_scientific,
+            'digit_sum': digit_sum,
+            'CalculatorException': CalculatorException,
+            'InvalidTokenException': InvalidTokenException,
+            'InvalidExpressionException': InvalidExpressionException,
+            'UndefinedVariableException': UndefinedVariableException,
+            'MissingOperandException': MissingOperandException,
+            'DivisionByZeroException': DivisionByZeroException,
+            'FactorialNegativeNumberException': FactorialNegativeNumberException,
+            'FactorialFloatException': FactorialFloatException,
+            'ResultTooLargeException': ResultTooLargeException,
+        }
+        lines = self._compile_body(postfix, namespace)
+        if fallback is not None:
+            namespace['fallback'] = fallback
+            guards = []
+            for i, (name, (low, high)) in enumerate((bounds or {}).items()):
+                # Bounds are bound by name, infinite floats have no literal
+                namespace[f"low_{i}"], namespace[f"high_{i}"] = low, high
+                guards.extend((
+                    f"if not low_{i} <= variables.get({name!r}, NAN) <= high_{i}:",
+                    "    return fallback(variables)",
+                ))
+            namespace['NAN'] = float('nan')
+            if lines[-1] == "return s0":
+                lines[-1:] = ["if -MAX_RESULT <= s0 <= MAX_RESULT:", "    return s0", "return fallback(variables)"]
+            lines = guards + lines
+        source = "def _program(variables=NO_VARIABLES):\n" + "\n".join("    " + line for line in lines) + "\n"
+
+        exec(compile(source, "<calculator program>", "exec"), namespace)
+        return namespace['_program']
+
+    def _compile_body(self, postfix, namespace):
+        lines = []
+        depth = 0
+
+        for token in postfix:
+            if isinstance(token, float) and math.isfinite(token):
+                lines.append(f"s{depth} = {token!r}")
+                depth += 1
+            elif isinstance(token, (int, float)):
+                # Exact integers are bound by name, they may be too long for a
+                # literal, and so are floats that overflowed to inf
+                name = f"c_{len(namespace)}"
+                namespace[name] = token
+                lines.append(f"s{depth} = {name}")
+                depth += 1
+            elif isinstance(token, str) and token in self.operators:
+                operator = self.operators[token]
+                if depth < operator.arity:
+                    lines.append(f"raise MissingOperandException({operator.symbol!r})")
+                    return lines
+
+                if operator.arity == 1:
+                    slots = {'r': f"s{depth - 1}", 'a': f"s{depth - 1}", 'b': None}
+                elif operator.arity == 2:
+                    slots = {'r': f"s{depth - 2}", 'a': f"s{depth - 2}", 'b': f"s{depth - 1}"}
+                    depth -= 1
+                else:
+                    lines.append(f"raise CalculatorException('Unsupported operator arity: {operator.arity}')")
+                    return lines
+
+                lines.extend(self._operator_lines(token, operator, slots, namespace))
+            elif ExpressionParser.is_variable(token):
+                lines.extend((
+                    "try:",
+                    f"    s{depth} = variables[{token!r}]",
+                    "except KeyError:",
+                    f"    raise UndefinedVariableException({token!r}) from None",
+                ))
+                depth += 1
+            else:
+                namespace['_invalid_token'] = token
+                lines.append("raise InvalidTokenException(_invalid_token)")
+                return lines
+
+        if depth != 1:
+            lines.append("raise CalculatorException('Invalid expression structure.')")
+        else:
+            lines.append("return s0")
+        return lines
+
+    def _operator_lines(self, token, operator, slots, namespace):
+        template = self.templates.get(token)
+        if template is None:
+            # Operators without a template are called through their evaluate method
+            name = f"op_{len(namespace)}"
+            namespace[name] = operator.evaluate
+            if operator.arity == 1:
+                return [f"{slots['r']} = {name}({slots['a']})"]
+            return [f"{slots['r']} = {name}({slots['a']}, {slots['b']})"]
+        return [line.format(**slots) for line in template]
@@ -0,0 +1,179 @@
+# PrattParser.py
+
+from ExpressionParser import ExpressionParser, NUMBER, NAME, OPERATOR, LEFT_PARENTHESIS, RIGHT_PARENTHESIS
+from exceptions import InvalidExpressionException
+
+# Kinds of the tokens that can follow a unary minus
+OPERAND_KINDS = (NUMBER, NAME, LEFT_PARENTHESIS)
+
+
+class _Rejected(Exception):
+    """
+    Raised by the climbing parser on any input that is not well-formed.
+    """
+
+
+class PrattParser(ExpressionParser):
+    def __init__(self, exact=False):
+        """
+        Initialize a parser that converts expressions to postfix by precedence
+        climbing instead of the shunting-yard algorithm.
+
+        Every operator gets binding powers computed once from its precedence
+        and associativity: an operator met after an operand takes that operand
+        when its left power is above the right power of the operator waiting
+        for it. Left powers are 2 * precedence, plus 2 for right-associative
+        binary operators; right powers are 2 * precedence + 1. These reproduce
+        the popping rules of the shunting-yard, in which the associativity of
+        the incoming operator decides ties, so that '-2^2' is -(2^2) and '~5!'
+        is (~5)!.
+
+        Unary minuses are parsed directly instead of being rewritten first:
+        after '(' or at the start they apply to the following power operand,
+        while after a binary operator or '~' they apply to the next number,
+        name or parenthesis only, as the rewrite pass implies ('2^-2^2' is
+        2^((-2)^2), and '2*-(3+4)' is 2*(-3+4)).
+
+        Well-formed expressions produce the programs of the shunting-yard.
+        The climbing parser rejects every other input, which is then parsed
+        again by the shunting-yard so that results and errors stay the same.
+
+        :param exact: bool
+            Keep integer literals as Python ints and use the exact operators.
+        """
+        super().__init__(exact)
+        self.left_powers = {}
+        self.right_powers = {}
+        for symbol, operator in self.operators.items():
+            power = 2 * operator.precedence
+            if symbol in self.postfix_operators:
+                self.left_powers[symbol] = power
+            elif operator.arity == 2:
+                self.left_powers[symbol] = power + 2 if operator.associativity == 'right' else power
+                self.right_powers[symbol] = power + 1
+            else:
+                self.right_powers[symbol] = power + 1
+
+    def parse_expression(self, expression):
+        if self.profiler is not None:
+            return self._profiled_parse_expression(expression)
+        if not expression.strip():
+            raise InvalidExpressionException("Expression cannot be empty or whitespace only.", expression, 0)
+
+        tokens = self.tokenize(expression)
+        try:
+            return self.climb(tokens)
+        except (_Rejected, RecursionError):
+            # The shunting-yard reports the errors, or builds the program of
+            # an expression nested too deeply to climb recursively
+            return self.parse_tokens(self.wrap_negatives(tokens, expression), expression)
+
+    def _profiled_parse_expression(self, expression):
+        profiler = self.profiler
+        if not expression.strip():
+            error = InvalidExpressionException("Expression cannot be empty or whitespace only.", expression, 0)
+            profiler.record_error(error)
+            raise error
+
+        tokens = profiler.time('tokenize', self.tokenize, expression)
+        try:
+            return profiler.time('climb', self.climb, tokens)
+        except (_Rejected, RecursionError):
+            tokens = profiler.time('wrap_negatives', self.wrap_negatives, tokens, expression)
+            return profiler.time('parse_tokens', self.parse_tokens, tokens, expression)
+
+    def climb(self, tokens):
+        """
+        Convert a well-formed list of tokens to postfix by precedence climbing.
+
+        :param tokens: list of Token
+            The tokens of the expression, unary minuses included.
+        :return: list
+            The postfix program.
+        :raises _Rejected: if the tokens are not a well-formed expression.
+        """
+        postfix = []
+        emit = postfix.append
+        left_powers = self.left_powers
+        right_powers = self.right_powers
+        postfix_operators = self.postfix_operators
+        minus_power = right_powers['u-']
+        tilde_power = right_powers['~']
+        count = len(tokens)
+        position = 0
+
+        def operand(min_power, after_operator):
+            # Parse an operand, then the operators binding tighter than min_power
+            nonlocal position
+            if position >= count:
+                raise _Rejected
+            token = tokens[position]
+            position += 1
+            kind = token.kind
+            if kind == NUMBER:
+                emit(token.value)
+            elif kind == NAME:
+                emit(token.text)
+            elif kind == LEFT_PARENTHESIS:
+                group(0)
+            elif token.text == '-':
+                minuses = 1
+                while position < count and tokens[position].text == '-':
+                    minuses += 1
+                    position += 1
+                if position >= count or tokens[position].kind not in OPERAND_KINDS:
+                    raise _Rejected
+                if not after_operator:
+                    operand(minus_power, False)
+                    postfix.extend(['u-'] * minuses)
+                else:
+                    token = tokens[position]
+                    position += 1
+                    if token.kind == LEFT_PARENTHESIS:
+                        # The minuses open the parenthesized group
+                        group(minuses)
+                    else:
+                        emit(token.value if token.kind == NUMBER else token.text)
+                        postfix.extend(['u-'] * minuses)
+            elif token.text == '~':
+                if position >= count or tokens[position].kind not in OPERAND_KINDS and tokens[position].text != '-':
+                    raise _Rejected
+                operand(tilde_power, True)
+                emit('~')
+            else:
+                raise _Rejected
+            operators(min_power)
+
+        def operators(min_power):
+            nonlocal position
+            while position < count:
+                token = tokens[position]
+                if token.kind != OPERATOR:
+                    break
+                symbol = token.text
+                power = left_powers.get(symbol)
+                if power is None:
+                    raise _Rejected
+                if power <= min_power:
+                    break
+                position += 1
+                if symbol not in postfix_operators:
+                    operand(right_powers[symbol], True)
+                emit(symbol)
+
+        def group(minuses):
+            nonlocal position
+            if minuses:
+                operand(minus_power, False)
+                postfix.extend(['u-'] * minuses)
+                operators(0)
+            else:
+                operand(0, False)
+            if position >= count or tokens[position].kind != RIGHT_PARENTHESIS:
+                raise _Rejected
+            position += 1
+
+        operand(0, False)
+        if position != count:
+            raise _Rejected
+        return postfix
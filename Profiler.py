@@ -0,0 +1,123 @@
+# Profiler.py
+
+import heapq
+from collections import Counter
+from time import perf_counter_ns
+
+
+class ProfiledOperator:
+    """
+    Stand-in for an operator that counts and times its evaluations.
+    """
+    __slots__ = ('operator', 'symbol', 'precedence', 'associativity', 'arity', 'timing')
+
+    def __init__(self, operator, timing):
+        self.operator = operator
+        self.symbol = operator.symbol
+        self.precedence = operator.precedence
+        self.associativity = operator.associativity
+        self.arity = operator.arity
+        # [calls, nanoseconds], shared with the profiler
+        self.timing = timing
+
+    def evaluate(self, *operands):
+        start = perf_counter_ns()
+        try:
+            return self.operator.evaluate(*operands)
+        finally:
+            self.timing[0] += 1
+            self.timing[1] += perf_counter_ns() - start
+
+
+class Profiler:
+    def __init__(self, slowest=10):
+        """
+        Initialize an empty profile.
+
+        :param slowest: int
+            Number of slowest expressions to keep.
+        """
+        self.slowest_count = slowest
+        self.reset()
+
+    def reset(self):
+        """
+        Drop every measurement.
+        """
+        # Stage or operator name -> [calls, nanoseconds]
+        self.stages = {}
+        self.operators = {}
+        self.exceptions = Counter()
+        self.expressions = 0
+        self._slowest = []
+
+    def time(self, stage, function, *args):
+        """
+        Call a function as a timed stage.
+
+        An exception raised by the function is counted by class before it
+        propagates.
+
+        :param stage: str
+        :return: the result of the function.
+        """
+        timing = self.stages.get(stage)
+        if timing is None:
+            timing = self.stages[stage] = [0, 0]
+        start = perf_counter_ns()
+        try:
+            return function(*args)
+        except Exception as e:
+            self.exceptions[type(e).__name__] += 1
+            raise
+        finally:
+            timing[0] += 1
+            timing[1] += perf_counter_ns() - start
+
+    def record_error(self, error):
+        self.exceptions[type(error).__name__] += 1
+
+    def record_expression(self, expression, nanoseconds):
+        """
+        Account for one evaluated expression, keeping the slowest ones.
+        """
+        self.expressions += 1
+        entry = (nanoseconds, self.expressions, expression)
+        if len(self._slowest) < self.slowest_count:
+            heapq.heappush(self._slowest, entry)
+        elif self.slowest_count and nanoseconds > self._slowest[0][0]:
+            heapq.heapreplace(self._slowest, entry)
+
+    def instrument(self, operators):
+        """
+        Wrap an operator table so that every evaluation is counted and timed.
+
+        :param operators: dict
+            Maps operator symbols to Operator instances.
+        :return: dict
+            Maps the same symbols to ProfiledOperator instances.
+        """
+        instrumented = {}
+        for symbol, operator in operators.items():
+            timing = self.operators.setdefault(type(operator).__name__, [0, 0])
+            instrumented[symbol] = ProfiledOperator(operator, timing)
+        return instrumented
+
+    def report(self):
+        """
+        Summarize the measurements.
+
+        :return: dict
+            Calls and seconds per stage and per operator class, counts per
+            exception class and the slowest expressions, slowest first.
+        """
+        def timings(table):
+            return {name: {'calls': calls, 'seconds': ns / 1e9} for name, (calls, ns) in table.items() if calls}
+
+        return {
+            'expressions': self.expressions,
+            'stages': timings(self.stages),
+            'operators': timings(self.operators),
+            'exceptions': dict(self.exceptions),
+            'slowest': [(expression, ns / 1e9) for ns, _, expression in sorted(self._slowest, reverse=True)],
+        }
@@ -0,0 +1,221 @@
+# ProgramStore.py
+
+import hashlib
+import marshal
+import sqlite3
+import threading
+import types
+
+import kernels
+from ExpressionParser import ExpressionParser
+from Operators import OPERATORS, EXACT_OPERATORS
+
+# Version of the stored program encoding, bumped whenever it changes
+FORMAT_VERSION = 1
+
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS programs (hash BLOB PRIMARY KEY, program BLOB NOT NULL) WITHOUT ROWID",
+)
+
+
+def _digest_code(code, digest):
+    digest.update(code.co_code)
+    digest.update(repr(code.co_names).encode())
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            _digest_code(const, digest)
+        elif isinstance(const, frozenset):
+            # The order of a set of strings changes with the hash seed of the process
+            digest.update(repr(sorted(map(repr, const))).encode())
+        else:
+            digest.update(repr(const).encode())
+
+
+def _names(code):
+    yield from code.co_names
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            yield from _names(const)
+
+
+def _digest_function(function, digest, seen):
+    """
+    Digest the code of a function and of the module-level functions and
+    constants it uses, so that a change in a helper also changes the digest.
+    """
+    if function in seen:
+        return
+    seen.add(function)
+    _digest_code(function.__code__, digest)
+    for name in sorted(set(_names(function.__code__))):
+        value = function.__globals__.get(name)
+        if isinstance(value, types.FunctionType):
+            _digest_function(value, digest, seen)
+        elif isinstance(value, (int, float, str)):
+            digest.update(f"{name}={value!r}".encode())
+
+
+def fingerprint(tables=(OPERATORS, EXACT_OPERATORS)):
+    """
+    Fingerprint the definitions a stored program depends on.
+
+    The fingerprint covers the precedence, associativity and arity of every
+    operator, the code of its evaluate methods and of the helpers they call,
+    and the code of the parser, so that editing any of them invalidates the
+    programs parsed before.
+
+    :param tables: iterable of dict
+        The operator tables, mapping symbols to Operator instances.
+    :return: str
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(f"format={FORMAT_VERSION};marshal={marshal.version}".encode())
+    seen = set()
+    for operators in tables:
+        for symbol in sorted(operators):
+            operator = operators[symbol]
+            digest.update(repr((symbol, type(operator).__qualname__, operator.precedence,
+                                operator.associativity, operator.arity)).encode())
+            for cls in type(operator).__mro__:
+                if 'evaluate' in vars(cls):
+                    _digest_function(vars(cls)['evaluate'], digest, seen)
+    for _, function in sorted(vars(ExpressionParser).items()):
+        if isinstance(function, (staticmethod, classmethod)):
+            function = function.__func__
+        if isinstance(function, types.FunctionType):
+            _digest_function(function, digest, seen)
+    for _, function in sorted(vars(kernels).items()):
+        if isinstance(function, types.FunctionType):
+            _digest_function(function, digest, seen)
+    return digest.hexdigest()
+
+
+class ProgramStore:
+    def __init__(self, path, batch_size=256):
+        """
+        Open, or create, an on-disk store of parsed programs.
+
+        Programs are postfix lists, stored marshaled in an SQLite table keyed by
+        a 128-bit hash of the normalized expression and the parsing mode. The
+        database runs in WAL mode: any number of processes can read it while
+        one writes. Entries written under another fingerprint of the operators
+        and the parser are dropped when the store is opened, and the programs
+        of both the float and the exact mode share the file.
+
+        Writes are buffered and committed every ``batch_size`` programs and on
+        close, so a store should be closed (or used as a context manager).
+
+        :param path: str
+            The database file.
+        :param batch_size: int
+            Number of buffered writes committed at once.
+        """
+        self.path = path
+        self.fingerprint = fingerprint()
+        self.batch_size = batch_size
+        self.hits = 0
+        self.misses = 0
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, timeout=30.0, isolation_level=None, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        # Commits only reach the disk at checkpoints: a crash may lose the last ones
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._validate()
+
+    def _validate(self):
+        with self._lock:
+            connection = self._connection
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                for statement in SCHEMA:
+                    connection.execute(statement)
+                row = connection.execute("SELECT value FROM meta WHERE key = 'fingerprint'").fetchone()
+                if row is None or row[0] != self.fingerprint:
+                    connection.execute("DELETE FROM programs")
+                    connection.execute("INSERT OR REPLACE INTO meta VALUES ('fingerprint', ?)", (self.fingerprint,))
+                connection.execute("COMMIT")
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+
+    @staticmethod
+    def key(expression, exact=False):
+        """
+        Hash a normalized expression and the parsing mode.
+
+        :return: bytes
+        """
+        prefix = 'exact:' if exact else 'float:'
+        return hashlib.blake2b((prefix + expression).encode('utf-8', 'surrogatepass'), digest_size=16).digest()
+
+    def get(self, key):
+        """
+        Return the stored program of a key.
+
+        :param key: bytes
+        :return: list or None
+            The postfix program, None when it is not stored.
+        """
+        with self._lock:
+            blob = self._pending.get(key)
+            if blob is None:
+                row = self._connection.execute("SELECT program FROM programs WHERE hash = ?", (key,)).fetchone()
+                blob = row[0] if row is not None else None
+        if blob is None or blob[0] != FORMAT_VERSION:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return list(marshal.loads(blob[1:]))
+
+    def put(self, key, postfix):
+        """
+        Store the program of a key.
+
+        :param key: bytes
+        :param postfix: list
+        """
+        blob = bytes((FORMAT_VERSION,)) + marshal.dumps(tuple(postfix))
+        with self._lock:
+            self._pending[key] = blob
+            if len(self._pending) >= self.batch_size:
+                self._flush()
+
+    def flush(self):
+        """
+        Commit the buffered writes.
+        """
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        if not self._pending:
+            return
+        connection = self._connection
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.executemany("INSERT OR REPLACE INTO programs VALUES (?, ?)", self._pending.items())
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        self._pending.clear()
+
+    def close(self):
+        """
+        Commit the buffered writes and close the database.
+        """
+        self.flush()
+        self._connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        with self._lock:
+            self._flush()
+            return self._connection.execute("SELECT COUNT(*) FROM programs").fetchone()[0]
@@ -0,0 +1,124 @@
+# RangeAnalysis.py
+
+import math
+import operator as op
+
+from ExpressionParser import ExpressionParser
+from Operators import MAX_RESULT
+
+UNBOUNDED = (-math.inf, math.inf)
+
+
+def _widen(low, high):
+    # Bounds are rounded to nearest like the values they bound: one ulp of
+    # margin on each side keeps every runtime value inside the interval
+    return math.nextafter(low, -math.inf), math.nextafter(high, math.inf)
+
+
+def _corners(function, a, b):
+    """
+    Bound a function that is monotonic in each argument over a box.
+    """
+    try:
+        values = [function(x, y) for x in a for y in b]
+    except (ArithmeticError, ValueError):
+        return UNBOUNDED
+    if any(value != value or isinstance(value, complex) for value in values):
+        return UNBOUNDED
+    return _widen(min(values), max(values))
+
+
+def _bounded(interval):
+    return -MAX_RESULT <= interval[0] and interval[1] <= MAX_RESULT
+
+
+def _excludes_zero(interval):
+    return interval[0] > 0 or interval[1] < 0
+
+
+def _interval(token, a, b):
+    """
+    Return the interval of an operator over non-constant operands, or None
+    when some operand values in the intervals make the operator raise.
+    """
+    if token == '+':
+        return _corners(op.add, a, b)
+    if token == '-':
+        return _corners(op.sub, a, b)
+    if token in ('u-', '~'):
+        return -a[1], -a[0]
+    if token == '$':
+        return max(a[0], b[0]), max(a[1], b[1])
+    if token == '&':
+        return min(a[0], b[0]), min(a[1], b[1])
+    if token == '@':
+        return _corners(lambda x, y: (x + y) / 2, a, b)
+    if token == '*':
+        result = _corners(op.mul, a, b)
+    elif token == '/':
+        result = _corners(op.truediv, a, b) if _excludes_zero(b) else None
+    elif token == '^':
+        # Only positive bases: pow is then real and monotonic in each operand
+        result = _corners(pow, a, b) if a[0] > 0 else None
+    elif token == '%':
+        if not _excludes_zero(b):
+            return None
+        # The remainder has the sign of the divisor and a smaller magnitude
+        return (0.0, b[1]) if b[0] > 0 else (b[0], 0.0)
+    else:
+        # '!' and '#' are only analyzed on constants
+        return None
+    return result if result is not None and _bounded(result) else None
+
+
+def analyze(postfix, operators, bounds=None):
+    """
+    Bound the result of a postfix program by interval arithmetic.
+
+    Constant subterms are evaluated with the operators themselves; the other
+    values are bounded by intervals, starting from the bounds of the variables.
+    A program is proven safe when no operator can raise for any values inside
+    the bounds: it can then be evaluated without per-operator checks. NaN
+    values never trigger the checks of the operators, so they need no bound.
+
+    :param postfix: list
+        The postfix tokenized expression, with float literals.
+    :param operators: dict
+        Maps operator symbols to Operator instances.
+    :param bounds: dict, optional
+        Maps variable names to (low, high) intervals; other variables are unbounded.
+    :return: tuple or None
+        The (low, high) interval of the result, None when the program is not
+        proven safe.
+    """
+    # Entries are (interval, whether the value is a constant)
+    stack = []
+    for token in postfix:
+        if isinstance(token, float):
+            stack.append(((token, token), True))
+        elif isinstance(token, str) and token in operators:
+            arity = operators[token].arity
+            if len(stack) < arity or arity not in (1, 2):
+                return None
+            operands = stack[-arity:]
+            del stack[-arity:]
+            if all(constant for _, constant in operands):
+                try:
+                    value = operators[token].evaluate(*(interval[0] for interval, _ in operands))
+                except Exception:
+                    return None
+                if isinstance(value, complex):
+                    return None
+                stack.append(((value, value), True))
+                continue
+            interval = _interval(token, operands[0][0], operands[1][0] if arity == 2 else None)
+            if interval is None:
+                return None
+            stack.append((interval, False))
+        elif ExpressionParser.is_variable(token):
+            stack.append(((bounds or {}).get(token, UNBOUNDED), False))
+        else:
+            return None
+    if len(stack) != 1:
+        return None
+    return stack[0][0]
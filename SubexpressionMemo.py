@@ -0,0 +1,152 @@
+# SubexpressionMemo.py
+
+from itertools import count
+from time import perf_counter_ns
+
+from ExpressionCache import ExpressionCache
+from ExpressionParser import ExpressionParser
+from exceptions import (
+    CalculatorException,
+    InvalidTokenException,
+    MissingOperandException,
+    UndefinedVariableException,
+)
+
+# Operators whose result does not depend on the order of their operands
+COMMUTATIVE = frozenset(('+', '*', '$', '&', '@'))
+# max() and min() return their first operand on ties, so equal or unordered
+# (NaN) operands are not memoized under an order-independent key
+ORDER_ON_TIES = frozenset(('$', '&'))
+
+
+class SubexpressionMemo:
+    def __init__(self, max_nodes=1 << 16, max_values=1 << 16, max_bytes=16 * 1024 * 1024):
+        """
+        Initialize a memo of subexpression values shared across expressions.
+
+        Every subexpression is hash-consed into a node id: equal subterms get
+        the same id, whatever expression they appear in. The key of a node is
+        its operator and the ids of its operands, sorted for commutative
+        operators, so '2+3' and '3+2' share a node. Values of nodes that do not
+        depend on variables are memoized.
+
+        :param max_nodes: int
+            Maximum number of interned nodes.
+        :param max_values: int
+            Maximum number of memoized values.
+        :param max_bytes: int
+            Approximate memory budget of each of the two tables.
+        """
+        self.nodes = ExpressionCache(max_nodes, max_bytes)
+        self.values = ExpressionCache(max_values, max_bytes)
+        self._ids = count()
+        self.saved_evaluations = 0
+        self.saved_nanoseconds = 0
+
+    def intern(self, key):
+        """
+        Return the node id of a key, allocating one for a new key.
+        """
+        node = self.nodes.get(key)
+        if node is None:
+            node = next(self._ids)
+            self.nodes.put(key, node)
+        return node
+
+    def evaluate(self, postfix, operators, variables=None):
+        """
+        Evaluate a postfix program, reusing the values of known subterms.
+
+        :param postfix: list
+            The postfix tokenized expression.
+        :param operators: dict
+            Maps operator symbols to Operator instances. Keys use the operator
+            instances, so calculators with different operator tables can share
+            the memo.
+        :param variables: dict, optional
+            Values of the variables used by the expression.
+        :return: float
+            The result of the calculation.
+        """
+        # Entries are (node id, value, whether the value is constant)
+        stack = []
+        intern = self.intern
+        values = self.values
+
+        for token in postfix:
+            if isinstance(token, (int, float)):
+                literal = token.hex() if isinstance(token, float) else token
+                stack.append((intern((type(token), literal)), token, True))
+            elif isinstance(token, str) and token in operators:
+                operator = operators[token]
+                if len(stack) < operator.arity:
+                    raise MissingOperandException(operator.symbol)
+                if operator.arity == 1:
+                    a = stack.pop()
+                    operands = (a[1],)
+                    key = (operator, a[0])
+                    constant = a[2]
+                elif operator.arity == 2:
+                    b = stack.pop()
+                    a = stack.pop()
+                    operands = (a[1], b[1])
+                    if token in COMMUTATIVE and b[0] < a[0]:
+                        key = (operator, b[0], a[0])
+                    else:
+                        key = (operator, a[0], b[0])
+                    constant = a[2] and b[2]
+                    if constant and token in ORDER_ON_TIES and not (a[1] < b[1] or b[1] < a[1]):
+                        constant = False
+                else:
+                    raise CalculatorException(f"Unsupported operator arity: {operator.arity}")
+
+                node = intern(key)
+                entry = values.get(node) if constant else None
+                if entry is not None:
+                    value = entry[0]
+                    self.saved_evaluations += 1
+                    self.saved_nanoseconds += entry[1]
+                elif constant:
+                    start = perf_counter_ns()
+                    value = operator.evaluate(*operands)
+                    values.put(node, (value, perf_counter_ns() - start))
+                else:
+                    value = operator.evaluate(*operands)
+                stack.append((node, value, constant))
+            elif ExpressionParser.is_variable(token):
+                if not variables or token not in variables:
+                    raise UndefinedVariableException(token)
+                stack.append((intern(('variable', token)), variables[token], False))
+            else:
+                raise InvalidTokenException(token)
+
+        if len(stack) != 1:
+            raise CalculatorException("Invalid expression structure.")
+        return stack[0][1]
+
+    def clear(self):
+        """
+        Drop every node and value and reset the counters.
+        """
+        self.nodes.clear()
+        self.values.clear()
+        self.saved_evaluations = 0
+        self.saved_nanoseconds = 0
+
+    def stats(self):
+        """
+        Report the size of the memo and the work it saved.
+
+        :return: dict
+            ``saved_evaluations`` counts the operator evaluations replaced by a
+            lookup and ``saved_seconds`` is the time those evaluations took when
+            they were first computed.
+        """
+        return {
+            'nodes': len(self.nodes),
+            'values': len(self.values),
+            'hits': self.values.hits,
+            'misses': self.values.misses,
+            'saved_evaluations': self.saved_evaluations,
+            'saved_seconds': self.saved_nanoseconds / 1e9,
+        }
@@ -0,0 +1,268 @@
+# VectorEvaluator.py
+
+import math
+from collections import namedtuple
+
+import numpy as np
+
+import kernels
+from ExpressionParser import ExpressionParser
+from Operators import MAX_RESULT
+from exceptions import (
+    CalculatorException,
+    InvalidTokenException,
+    InvalidExpressionException,
+    MissingOperandException,
+    DivisionByZeroException,
+    FactorialNegativeNumberException,
+    FactorialFloatException,
+    ResultTooLargeException,
+    UndefinedVariableException,
+    UNEXPECTED_ERROR_CODE,
+)
+
+# Error code for rows whose scalar result is not a real number
+NON_REAL_RESULT_CODE = 101  # e.g. (-8)^0.5, whose scalar result is a complex number
+
+# Integers above this bound are not exactly representable as float64
+EXACT_FLOAT_LIMIT = 2.0 ** 53
+
+FACTORIALS = np.array(kernels.FACTORIALS, dtype=np.float64)
+
+VectorResult = namedtuple('VectorResult', ['values', 'errors'])
+
+
+class VectorEvaluator:
+    def __init__(self, calculator):
+        """
+        Initialize a vectorized evaluator for one batch.
+
+        Every operator of Operators.py has a NumPy kernel that reproduces the
+        checks of its evaluate method row by row. The few rows a kernel cannot
+        reproduce exactly in float64 (digit sums of exact integers above 2^53)
+        are re-evaluated with the scalar interpreter of the calculator.
+
+        :param calculator: Calculator
+            Provides the operator table and the scalar fallback.
+        """
+        self.calculator = calculator
+        self.operators = calculator.parser.operators
+        self.kernels = {
+            '+': self._add,
+            '-': self._subtract,
+            'u-': self._negate,
+            '~': self._negate,
+            '*': self._multiply,
+            '/': self._divide,
+            '^': self._power,
+            '!': self._factorial,
+            '%': self._modulo,
+            '$': self._max,
+            '&': self._min,
+            '@': self._average,
+            '#': self._digit_sum,
+        }
+        self.errors = None
+        self.fallback = None
+
+    def evaluate(self, postfix, arrays):
+        """
+        Evaluate a postfix program over arrays of variable values.
+
+        Errors that do not depend on the row (undefined variables, missing
+        operands, invalid tokens) are raised for the whole batch.
+
+        :param postfix: list
+            The postfix tokenized expression.
+        :param arrays: dict
+            Maps variable names to array_like values, broadcast together.
+        :return: VectorResult
+            The values (NaN where a row failed) and the error codes (0 on success).
+        """
+        names = self._check_structure(postfix, arrays)
+
+        columns = {name: np.asarray(arrays[name], dtype=np.float64) for name in names}
+        shape = np.broadcast_shapes(*(column.shape for column in columns.values())) if columns else ()
+        columns = {name: np.broadcast_to(column, shape).ravel() for name, column in columns.items()}
+        size = math.prod(shape)
+
+        self.errors = np.zeros(size, dtype=np.uint8)
+        self.fallback = np.zeros(size, dtype=bool)
+        no_ints = np.zeros(size, dtype=bool)
+        stack = []
+
+        with np.errstate(all='ignore'):
+            for token in postfix:
+                if isinstance(token, float):
+                    stack.append((np.full(size, token), no_ints))
+                elif ExpressionParser.is_variable(token):
+                    stack.append((columns[token], no_ints))
+                elif self.operators[token].arity == 1:
+                    stack.append(self._apply(token, stack.pop()))
+                else:
+                    right = stack.pop()
+                    left = stack.pop()
+                    stack.append(self._apply(token, left, right))
+
+        values = np.array(stack[0][0], dtype=np.float64)
+        self._evaluate_fallback(postfix, columns, values)
+
+        values[self.errors != 0] = np.nan
+        return VectorResult(values.reshape(shape), self.errors.reshape(shape))
+
+    def _check_structure(self, postfix, arrays):
+        names = []
+        depth = 0
+        for token in postfix:
+            if isinstance(token, float):
+                depth += 1
+            elif isinstance(token, str) and token in self.operators:
+                operator = self.operators[token]
+                if depth < operator.arity:
+                    raise MissingOperandException(operator.symbol)
+                depth -= operator.arity - 1
+            elif ExpressionParser.is_variable(token):
+                if token not in arrays:
+                    raise UndefinedVariableException(token)
+                if token not in names:
+                    names.append(token)
+                depth += 1
+            else:
+                raise InvalidTokenException(token)
+        if depth != 1:
+            raise CalculatorException("Invalid expression structure.")
+        return names
+
+    def _apply(self, token, left, right=None):
+        kernel = self.kernels.get(token)
+        if kernel is None:
+            # Operators without a kernel are evaluated row by row by the scalar fallback
+            self._defer(np.ones(self.errors.shape, dtype=bool))
+            return np.full(self.errors.shape, np.nan), left[1]
+        if right is None:
+            return kernel(*left)
+        return kernel(*left, *right)
+
+    def _fail(self, mask, exception_class):
+        """
+        Record an error on the rows of the mask that have not failed yet.
+        """
+        code = exception_class if isinstance(exception_class, int) else exception_class.code
+        self.errors[mask & (self.errors == 0)] = code
+
+    def _defer(self, mask):
+        """
+        Mark rows that must be re-evaluated by the scalar interpreter.
+        """
+        self.fallback |= mask & (self.errors == 0)
+
+    def _evaluate_fallback(self, postfix, columns, values):
+        for row in np.flatnonzero(self.fallback):
+            variables = {name: float(column[row]) for name, column in columns.items()}
+            self.errors[row] = 0
+            try:
+                value = self.calculator.evaluate_postfix(postfix, variables)
+            except CalculatorException as e:
+                self.errors[row] = e.code
+                continue
+            except Exception:
+                self.errors[row] = UNEXPECTED_ERROR_CODE
+                continue
+            if isinstance(value, complex):
+                self.errors[row] = NON_REAL_RESULT_CODE
+            else:
+                values[row] = float(value)
+
+    # Kernels take (values, is_int) pairs: is_int marks rows on which the scalar
+    # interpreter holds an exact Python int (results of '!' and '#').
+
+    @staticmethod
+    def _add(a, a_int, b, b_int):
+        return a + b, a_int & b_int
+
+    @staticmethod
+    def _subtract(a, a_int, b, b_int):
+        return a - b, a_int & b_int
+
+    @staticmethod
+    def _negate(a, a_int):
+        return -a, a_int
+
+    def _multiply(self, a, a_int, b, b_int):
+        result = a * b
+        self._fail(np.abs(result) > MAX_RESULT, ResultTooLargeException)
+        return result, a_int & b_int
+
+    def _divide(self, a, a_int, b, b_int):
+        zero = b == 0
+        self._fail(zero, DivisionByZeroException)
+        result = a / np.where(zero, 1.0, b)
+        self._fail(np.abs(result) > MAX_RESULT, ResultTooLargeException)
+        return result, np.zeros_like(a_int)
+
+    def _power(self, a, a_int, b, b_int):
+        # pow raises ZeroDivisionError for 0^-n and returns a complex number
+        # for a negative base with a fractional exponent, unless |a|^b is too
+        # large, which it reports first
+        self._fail((a == 0) & (b < 0), UNEXPECTED_ERROR_CODE)
+        non_real = (a < 0) & np.isfinite(b) & (b != np.floor(b))
+        self._fail(non_real & (np.power(np.abs(a), b) > MAX_RESULT), ResultTooLargeException)
+        self._fail(non_real, NON_REAL_RESULT_CODE)
+        result = np.power(a, b)
+        self._fail(np.abs(result) > MAX_RESULT, ResultTooLargeException)
+        return result, a_int & b_int & (b >= 0)
+
+    def _factorial(self, a, a_int):
+        # round() raises on NaN and infinity
+        self._fail(~np.isfinite(a), UNEXPECTED_ERROR_CODE)
+        rounded = np.round(a)
+        n = np.where(np.abs(a - rounded) < 0.0001, rounded, a)
+        self._fail(n < 0, FactorialNegativeNumberException)
+        self._fail(n != np.floor(n), FactorialFloatException)
+        self._fail(n > 170, ResultTooLargeException)
+        index = np.clip(np.nan_to_num(n), 0, 170).astype(np.intp)
+        return FACTORIALS[index], np.ones_like(a_int)
+
+    def _modulo(self, a, a_int, b, b_int):
+        zero = b == 0
+        self._fail(zero, DivisionByZeroException)
+        return np.remainder(a, np.where(zero, 1.0, b)), a_int & b_int
+
+    @staticmethod
+    def _max(a, a_int, b, b_int):
+        greater = b > a
+        return np.where(greater, b, a), np.where(greater, b_int, a_int)
+
+    @staticmethod
+    def _min(a, a_int, b, b_int):
+        less = b < a
+        return np.where(less, b, a), np.where(less, b_int, a_int)
+
+    @staticmethod
+    def _average(a, a_int, b, b_int):
+        return (a + b) / 2, np.zeros_like(a_int)
+
+    def _digit_sum(self, a, a_int):
+        # The scalar operator sums the digits of str(operand): an exact int has no
+        # exponent form, a float has one outside [1e-4, 1e16) and ends with '.0'
+        # when integral. 'inf' and 'nan' contain no digit and sum to 0.
+        finite = np.isfinite(a)
+        magnitude = np.abs(a)
+        self._defer(a_int & (magnitude >= EXACT_FLOAT_LIMIT))
+        exponent_form = ~a_int & finite & ((magnitude >= 1e16) | ((a != 0) & (magnitude < 1e-4)))
+        self._fail(exponent_form, InvalidExpressionException)
+        self._fail(a < 0, InvalidExpressionException)
+
+        result = np.zeros_like(a)
+        integral = finite & (a == np.floor(a)) & (magnitude < EXACT_FLOAT_LIMIT)
+        digits = magnitude[integral].astype(np.int64)
+        sums = np.zeros_like(digits)
+        while digits.any():
+            sums += digits % 10
+            digits //= 10
+        result[integral] = sums
+
+        fractional = finite & ~integral & ~exponent_form & (a >= 0)
+        if fractional.any():
+            result[fractional] = [kernels.digit_sum(float(value)) for value in a[fractional]]
+        return result, np.ones_like(a_int)
@@ -0,0 +1,146 @@
+# batch.py
+
+import argparse
+import mmap
+import os
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from Calculator import Calculator
+from main import FORMATTERS, stream
+
+OUTPUT_BUFFER_SIZE = 1 << 16
+
+# Calculator of a worker process, built once by the pool initializer
+_calculator = None
+
+
+def split_ranges(data, parts):
+    """
+    Split a buffer into line-aligned byte ranges of about the same size.
+
+    :param data: bytes-like object supporting find (bytes, mmap)
+    :param parts: int
+    :return: list of tuple
+        (start, end) offsets; every range ends after a newline or at the end.
+    """
+    size = len(data)
+    ranges = []
+    start = 0
+    for i in range(1, parts + 1):
+        if start >= size:
+            break
+        end = size * i // parts
+        if end <= start:
+            continue
+        if end < size:
+            newline = data.find(b'\n', end - 1)
+            end = size if newline < 0 else newline + 1
+        ranges.append((start, end))
+        start = end
+    return ranges
+
+
+def iter_lines(data, start, end):
+    """
+    Yield the lines of a byte range, decoding one line at a time.
+    """
+    find = data.find
+    while start < end:
+        newline = find(b'\n', start, end)
+        if newline < 0:
+            newline = end
+        yield data[start:newline].decode('utf-8', 'replace')
+        start = newline + 1
+
+
+def _init_worker():
+    global _calculator
+    _calculator = Calculator()
+
+
+def _evaluate_range(input_path, start, end, output_path, output_format):
+    # Runs in a worker process: the range is read from the worker's own mapping
+    with open(input_path, 'rb') as source, \
+            mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ) as data, \
+            open(output_path, 'w', encoding='utf-8', buffering=OUTPUT_BUFFER_SIZE) as out:
+        return stream(_calculator, iter_lines(data, start, end), out, output_format)
+
+
+def run_batch(input_path, output_path, workers=None, output_format='plain', ranges_per_worker=4):
+    """
+    Evaluate a file of expressions, one per line, on a pool of processes.
+
+    The input is memory-mapped and split into line-aligned byte ranges. Each
+    worker process builds its calculator once, evaluates whole ranges and
+    writes their records to a temporary file; the files are then appended to
+    the output in range order, so records follow the input order.
+
+    :param input_path: str
+    :param output_path: str
+    :param workers: int, optional
+        Number of processes (default: the number of CPUs).
+    :param output_format: str
+        One of 'plain', 'tsv' or 'jsonl'.
+    :param ranges_per_worker: int
+        Ranges per process; more ranges balance uneven lines better.
+    :return: tuple
+        The number of expressions and the number of errors.
+    """
+    if output_format not in FORMATTERS:
+        raise ValueError(f"Unknown output format: {output_format}")
+    workers = workers or os.cpu_count() or 1
+
+    with open(input_path, 'rb') as source:
+        if os.fstat(source.fileno()).st_size == 0:
+            open(output_path, 'w').close()
+            return 0, 0
+        with mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            ranges = split_ranges(data, workers * ranges_per_worker)
+
+    directory = os.path.dirname(os.path.abspath(output_path))
+    parts = []
+    try:
+        for _ in ranges:
+            handle, path = tempfile.mkstemp(prefix='.batch-', suffix='.part', dir=directory)
+            os.close(handle)
+            parts.append(path)
+
+        with ProcessPoolExecutor(workers, initializer=_init_worker) as pool:
+            futures = [pool.submit(_evaluate_range, input_path, start, end, path, output_format)
+                       for (start, end), path in zip(ranges, parts)]
+            counts = [future.result() for future in futures]
+
+        with open(output_path, 'wb') as out:
+            for path in parts:
+                with open(path, 'rb') as part:
+                    shutil.copyfileobj(part, out, OUTPUT_BUFFER_SIZE)
+    finally:
+        for path in parts:
+            if os.path.exists(path):
+                os.remove(path)
+
+    return sum(count for count, _ in counts), sum(errors for _, errors in counts)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Evaluate a file of expressions on several processes")
+    parser.add_argument('input', help="file with one expression per line")
+    parser.add_argument('-o', '--output', required=True, help="file receiving one record per expression")
+    parser.add_argument('-j', '--workers', type=int, default=None, help="number of processes (default: CPUs)")
+    parser.add_argument('--format', choices=sorted(FORMATTERS), default='plain')
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    count, errors = run_batch(args.input, args.output, args.workers, args.format)
+    elapsed = time.perf_counter() - start
+    rate = count / elapsed if elapsed > 0 else float('inf')
+    print(f"Evaluated {count} expressions ({errors} errors) in {elapsed:.3f}s: {rate:.0f} expressions/s",
+          file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
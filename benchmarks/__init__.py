@@ -0,0 +1,7 @@
+# benchmarks/__init__.py
+"""
+Reproducible latency benchmarks of the calculator.
+
+    python -m benchmarks run --output results.json
+    python -m benchmarks compare baseline.json results.json
+"""
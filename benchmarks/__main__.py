@@ -0,0 +1,97 @@
+# benchmarks/__main__.py
+
+import argparse
+import json
+import sys
+
+from benchmarks import kernels, parsers
+from benchmarks.corpora import build_corpora
+from benchmarks.runner import run, compare
+from benchmarks.threads import stress
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description="Calculator benchmarks")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_command = commands.add_parser('run', help="measure every stage on every corpus")
+    run_command.add_argument('--output', '-o', help="write the JSON report to this file")
+    run_command.add_argument('--repeat', type=int, default=5)
+    run_command.add_argument('--scale', type=float, default=1.0, help="size factor of the generated corpora")
+    run_command.add_argument('--seed', type=int, default=2024)
+    run_command.add_argument('--corpus', action='append', help="restrict to a corpus (repeatable)")
+    run_command.add_argument('--stage', action='append', help="restrict to a stage (repeatable)")
+
+    compare_command = commands.add_parser('compare', help="flag regressions against a baseline report")
+    compare_command.add_argument('baseline')
+    compare_command.add_argument('current')
+    compare_command.add_argument('--threshold', type=float, default=0.10, help="tolerated relative change")
+
+    threads_command = commands.add_parser('threads', help="stress a shared calculator and measure thread scaling")
+    threads_command.add_argument('--threads', type=int, action='append', help="thread count (repeatable)")
+    threads_command.add_argument('--repeat', type=int, default=20)
+    threads_command.add_argument('--scale', type=float, default=1.0, help="size factor of the generated corpora")
+    threads_command.add_argument('--seed', type=int, default=2024)
+
+    kernels_command = commands.add_parser('kernels', help="time the operator kernels against their baselines")
+    kernels_command.add_argument('--number', type=int, default=100000, help="calls per measurement")
+
+    parsers_command = commands.add_parser('parsers', help="time the precedence-climbing parser against the shunting-yard")
+    parsers_command.add_argument('--repeat', type=int, default=5)
+    parsers_command.add_argument('--scale', type=float, default=1.0, help="size factor of the generated corpora")
+    parsers_command.add_argument('--seed', type=int, default=2024)
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'run':
+        corpora = build_corpora(args.seed, args.scale)
+        if args.corpus:
+            corpora = {name: corpora[name] for name in args.corpus}
+        report = run(corpora, args.repeat, args.stage)
+        for corpus, stages in report['results'].items():
+            for stage, metrics in stages.items():
+                print(f"{corpus:<20} {stage:<17} {metrics['throughput']:>12.0f}/s "
+                      f"p50 {metrics['p50_us']:>10.1f}us  p99 {metrics['p99_us']:>10.1f}us  "
+                      f"peak {metrics['peak_kib']:>9.1f}KiB")
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump(report, f, indent=2)
+        return 0
+
+    if args.command == 'kernels':
+        for name, metrics in kernels.run(args.number).items():
+            print(f"{name:<22} baseline {metrics['baseline_ns']:>9.1f}ns  kernel {metrics['kernel_ns']:>9.1f}ns  "
+                  f"speedup {metrics['speedup']:6.2f}x")
+        return 0
+
+    if args.command == 'parsers':
+        for name, metrics in parsers.run(build_corpora(args.seed, args.scale), args.repeat).items():
+            print(f"{name:<20} shunting-yard {metrics['shunting_yard_ms']:>9.2f}ms  "
+                  f"pratt {metrics['pratt_ms']:>9.2f}ms  speedup {metrics['speedup']:5.2f}x  "
+                  f"conversion only {metrics['convert_speedup']:5.2f}x")
+        return 0
+
+    if args.command == 'threads':
+        corpus = [expression for expressions in build_corpora(args.seed, args.scale).values()
+                  for expression in expressions]
+        report = stress(corpus, args.threads or (1, 2, 4, 8), args.repeat)
+        print(f"python {report['meta']['python']}, GIL enabled: {report['meta']['gil_enabled']}")
+        for threads, metrics in report['results'].items():
+            print(f"{threads:>3} threads {metrics['throughput']:>12.0f}/s  speedup {metrics['speedup']:5.2f}x  "
+                  f"mismatches {metrics['mismatches']}")
+        return 1 if any(metrics['mismatches'] for metrics in report['results'].values()) else 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+    rows = compare(baseline, current, args.threshold)
+    for row in rows:
+        flag = "REGRESSION" if row['regression'] else "ok"
+        print(f"{row['corpus']:<20} {row['stage']:<17} p50 {row['p50_change']:+8.1%}  "
+              f"throughput {row['throughput_change']:+8.1%}  {flag}")
+    return 1 if any(row['regression'] for row in rows) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
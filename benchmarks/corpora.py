@@ -0,0 +1,95 @@
+# benchmarks/corpora.py
+
+import random
+
+# Hand-written inputs in the style of interactive use
+REALISTIC = [
+    "2+3", "10-4", "3*4", "8/2", "2^3", "5!", "~3", "10%3", "10$3", "10&3", "10@20",
+    "(2+3)*4-5", "10/(2+3)*4", "(3!+2)^2", "~(5*2)+10", "(10%3)^2+4", "2^(3+1)+1",
+    "((3+4)^2)/7", "(2*5)!/(10)", "((3+2)!/(5-1))*2", "(10-3$4)*2", "((3+5)@(2+3))^2",
+    "10/(2+3)*4+(5-3+8+1)", "((3!+2)^2+(4-2)+12+1)", "~(5*2)+(10/(5-3)+20+1)",
+    "(10#-2)^2", "123#", "~--3", "2 * 3.5 + 1", "12.75 / 0.25 - 3",
+]
+
+
+def deep_nesting(rng, count=50):
+    expressions = []
+    for _ in range(count):
+        depth = rng.randint(50, 200)
+        expressions.append("(" * depth + str(rng.randint(1, 9)) +
+                           "".join(f"{rng.choice('+-*')}{rng.randint(1, 9)})" for _ in range(depth)))
+    return expressions
+
+
+def long_chains(rng, count=20):
+    expressions = []
+    for _ in range(count):
+        terms = rng.randint(200, 2000)
+        expressions.append(str(rng.randint(1, 99)) +
+                           "".join(f"{rng.choice('+-*/')}{rng.randint(1, 99)}" for _ in range(terms)))
+    return expressions
+
+
+def unary_heavy(rng, count=200):
+    expressions = []
+    for _ in range(count):
+        parts = []
+        for _ in range(rng.randint(5, 30)):
+            prefix = rng.choice(["-", "--", "---", "~", "~-", "~--", ""])
+            operand = rng.choice([str(rng.randint(1, 50)), f"({rng.randint(1, 9)}+{rng.randint(1, 9)})"])
+            parts.append(prefix + operand)
+        expressions.append("(" + ")+(".join(parts) + ")")
+    return expressions
+
+
+def factorial_digit_sum(rng, count=200):
+    expressions = []
+    for _ in range(count):
+        parts = []
+        for _ in range(rng.randint(3, 15)):
+            parts.append(rng.choice([
+                f"{rng.randint(0, 20)}!",
+                f"{rng.randint(0, 170)}!#",
+                f"{rng.randint(1, 10 ** 9)}#",
+                f"({rng.randint(1, 5)}!)!",
+                f"{rng.randint(0, 9)}!!#",
+            ]))
+        expressions.append("+".join(parts))
+    return expressions
+
+
+def invalid_heavy(rng, count=300):
+    templates = [
+        "{a}+*{b}", "({a}+{b}", "{a}+{b})", "{a}~~{b}", "{a}*()", "{a}/0", "{a}?{b}", "~-{a}",
+        "{a}!!!!!!!!", "-{a}!", "{a}/({b}-{b})", "{a}.{b}.{a}", "", "   ", "({a}+{b})#-", "{a}^{b}^{b}^{b}",
+    ]
+    expressions = []
+    for _ in range(count):
+        template = rng.choice(templates)
+        expressions.append(template.format(a=rng.randint(1, 200), b=rng.randint(1, 9)))
+    return expressions
+
+
+def build_corpora(seed=2024, scale=1.0):
+    """
+    Build every corpus deterministically.
+
+    :param seed: int
+    :param scale: float
+        Multiplies the number of generated expressions.
+    :return: dict
+        Maps corpus names to lists of expressions.
+    """
+    rng = random.Random(seed)
+
+    def size(count):
+        return max(1, int(count * scale))
+
+    return {
+        'realistic': REALISTIC,
+        'deep_nesting': deep_nesting(rng, size(50)),
+        'long_chains': long_chains(rng, size(20)),
+        'unary_heavy': unary_heavy(rng, size(200)),
+        'factorial_digit_sum': factorial_digit_sum(rng, size(200)),
+        'invalid_heavy': invalid_heavy(rng, size(300)),
+    }
@@ -0,0 +1,77 @@
+# benchmarks/kernels.py
+
+import timeit
+
+from Operators import OPERATORS, DigitSumOperator, FactorialOperator
+from exceptions import (
+    FactorialFloatException,
+    FactorialNegativeNumberException,
+    InvalidExpressionException,
+    ResultTooLargeException,
+)
+
+
+# The evaluate methods the kernels replaced, kept as baselines. They are
+# called as methods too, so that both sides pay the same call overhead.
+
+class _LoopFactorial(FactorialOperator):
+    __slots__ = ()
+
+    def evaluate(self, operand1, operand2=None):
+        if abs(operand1 - round(operand1)) < 0.0001:
+            operand1 = round(operand1)
+        if operand1 < 0:
+            raise FactorialNegativeNumberException(operand1)
+        if operand1 != int(operand1):
+            raise FactorialFloatException(operand1)
+        operand1 = int(operand1)
+        if operand1 > 170:
+            raise ResultTooLargeException(f"Factorial input too large: {operand1}")
+        result = 1
+        for i in range(2, operand1 + 1):
+            result *= i
+        return result
+
+
+class _TextDigitSum(DigitSumOperator):
+    __slots__ = ()
+
+    def evaluate(self, operand1, operand2=None):
+        operand_str = str(operand1)
+        if 'e' in operand_str.lower():
+            raise InvalidExpressionException(f"Number is too large: {operand1}")
+        if float(operand1) < 0:
+            raise InvalidExpressionException(f"DigitSumOperator is not defined for negative numbers: {operand1}")
+        return sum(int(digit) for digit in operand_str if digit.isdigit())
+
+
+# (name, baseline, operator, arguments)
+CASES = [
+    ('factorial 20', _LoopFactorial().evaluate, OPERATORS['!'].evaluate, (20.0,)),
+    ('factorial 170', _LoopFactorial().evaluate, OPERATORS['!'].evaluate, (170.0,)),
+    ('digit sum 123456789', _TextDigitSum().evaluate, OPERATORS['#'].evaluate, (123456789.0,)),
+    ('digit sum 12.375', _TextDigitSum().evaluate, OPERATORS['#'].evaluate, (12.375,)),
+    ('digit sum 170!', _TextDigitSum().evaluate, OPERATORS['#'].evaluate, (OPERATORS['!'].evaluate(170.0),)),
+]
+
+
+def run(number=100000):
+    """
+    Time every operator kernel against the implementation it replaced.
+
+    :param number: int
+        Calls per measurement.
+    :return: dict
+        Maps case names to the baseline and kernel times in nanoseconds per
+        call and the speedup.
+    """
+    results = {}
+    for name, baseline, kernel, arguments in CASES:
+        baseline_ns = min(timeit.repeat(lambda: baseline(*arguments), number=number, repeat=3)) / number * 1e9
+        kernel_ns = min(timeit.repeat(lambda: kernel(*arguments), number=number, repeat=3)) / number * 1e9
+        results[name] = {
+            'baseline_ns': baseline_ns,
+            'kernel_ns': kernel_ns,
+            'speedup': baseline_ns / kernel_ns if kernel_ns else 0.0,
+        }
+    return results
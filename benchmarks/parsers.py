@@ -0,0 +1,72 @@
+# benchmarks/parsers.py
+
+import timeit
+
+from ExpressionParser import ExpressionParser
+from PrattParser import PrattParser
+
+
+def _parse_all(parser, expressions):
+    for expression in expressions:
+        try:
+            parser.parse_expression(expression)
+        except Exception:
+            pass
+
+
+def _convert_all(convert, tokenized):
+    for expression, tokens in tokenized:
+        try:
+            convert(tokens, expression)
+        except Exception:
+            pass
+
+
+def run(corpora, repeat=5):
+    """
+    Time the precedence-climbing parser against the shunting-yard on corpora.
+
+    Both engines are timed end to end, from the source text, and on the
+    conversion alone, from tokens: the shunting-yard then includes the unary
+    minus rewrite it needs, and the climbing parser its fallback on invalid
+    inputs.
+
+    :param corpora: dict
+        Maps corpus names to lists of expressions.
+    :param repeat: int
+        Measurements per corpus; the fastest is kept.
+    :return: dict
+        Maps corpus names to the times in milliseconds of both engines and the
+        speedups, end to end and for the conversion.
+    """
+    shunting_yard, pratt = ExpressionParser(), PrattParser()
+
+    def shunting_yard_convert(tokens, expression):
+        return shunting_yard.parse_tokens(shunting_yard.wrap_negatives(tokens, expression), expression)
+
+    def pratt_convert(tokens, expression):
+        try:
+            return pratt.climb(tokens)
+        except Exception:
+            return shunting_yard_convert(tokens, expression)
+
+    results = {}
+    for name, expressions in corpora.items():
+        tokenized = []
+        for expression in expressions:
+            try:
+                tokenized.append((expression, shunting_yard.tokenize(expression)))
+            except Exception:
+                pass
+        timings = {
+            'shunting_yard_ms': lambda: _parse_all(shunting_yard, expressions),
+            'pratt_ms': lambda: _parse_all(pratt, expressions),
+            'shunting_yard_convert_ms': lambda: _convert_all(shunting_yard_convert, tokenized),
+            'pratt_convert_ms': lambda: _convert_all(pratt_convert, tokenized),
+        }
+        metrics = {key: min(timeit.repeat(function, number=1, repeat=repeat)) * 1e3
+                   for key, function in timings.items()}
+        metrics['speedup'] = metrics['shunting_yard_ms'] / metrics['pratt_ms']
+        metrics['convert_speedup'] = metrics['shunting_yard_convert_ms'] / metrics['pratt_convert_ms']
+        results[name] = metrics
+    return results
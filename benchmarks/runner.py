@@ -0,0 +1,164 @@
+# benchmarks/runner.py
+
+import platform
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+from Calculator import Calculator
+from ExpressionParser import ExpressionParser
+
+
+def _try(function, argument):
+    try:
+        return function(*argument)
+    except Exception:
+        return None
+
+
+def build_stages(corpus):
+    """
+    Prepare the calls of every stage for a corpus.
+
+    Each stage receives the output of the previous one, so an expression that
+    fails in a stage is not measured by the following ones.
+
+    :param corpus: list of str
+    :return: dict
+        Maps stage names to (function, list of argument tuples).
+    """
+    parser = ExpressionParser()
+    cold = Calculator(cache_size=0)
+    warm = Calculator()
+
+    tokens = [(_try(parser.tokenize, (expression,)), expression) for expression in corpus]
+    tokens = [(t, expression) for t, expression in tokens if t is not None]
+    wrapped = [(_try(parser.wrap_negatives, (t, expression)), expression) for t, expression in tokens]
+    wrapped = [(w, expression) for w, expression in wrapped if w is not None]
+    postfix = [_try(parser.parse_tokens, (w, expression)) for w, expression in wrapped]
+
+    def end_to_end(calculator):
+        def calculate(expression):
+            try:
+                return calculator.compute(expression)
+            except Exception:
+                return None
+        return calculate
+
+    return {
+        'tokenize': (parser.tokenize, [(expression,) for expression in corpus]),
+        'wrap_negatives': (parser.wrap_negatives, tokens),
+        'parse_tokens': (parser.parse_tokens, wrapped),
+        'parse_expression': (parser.parse_expression, [(expression,) for expression in corpus]),
+        'evaluate_postfix': (cold.evaluate_postfix, [(p,) for p in postfix if p is not None]),
+        'calculate_cold': (end_to_end(cold), [(expression,) for expression in corpus]),
+        'calculate_warm': (end_to_end(warm), [(expression,) for expression in corpus]),
+    }
+
+
+def measure(function, arguments, repeat):
+    """
+    Time every call and report throughput, latency percentiles and peak memory.
+
+    :return: dict
+    """
+    timer = time.perf_counter_ns
+    latencies = []
+    start = timer()
+    for _ in range(repeat):
+        for argument in arguments:
+            call_start = timer()
+            try:
+                function(*argument)
+            except Exception:
+                pass
+            latencies.append(timer() - call_start)
+    elapsed = (timer() - start) / 1e9
+
+    # One extra pass under tracemalloc, which would distort the timings
+    tracemalloc.start()
+    for argument in arguments:
+        try:
+            function(*argument)
+        except Exception:
+            pass
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    latencies.sort()
+    count = len(latencies)
+    if not count:
+        return {'calls': 0, 'seconds': 0.0, 'throughput': 0.0, 'p50_us': 0.0, 'p99_us': 0.0, 'peak_kib': 0.0}
+    return {
+        'calls': count,
+        'seconds': elapsed,
+        'throughput': count / elapsed if elapsed else 0.0,
+        'p50_us': latencies[count // 2] / 1000,
+        'p99_us': latencies[min(count - 1, int(count * 0.99))] / 1000,
+        'peak_kib': peak / 1024,
+    }
+
+
+def run(corpora, repeat=5, stages=None):
+    """
+    Benchmark every stage on every corpus.
+
+    :param corpora: dict
+        Maps corpus names to lists of expressions.
+    :param repeat: int
+        Passes over each corpus.
+    :param stages: iterable of str, optional
+        Restricts the measured stages.
+    :return: dict
+        The JSON-compatible report.
+    """
+    results = {}
+    for name, corpus in corpora.items():
+        results[name] = {}
+        for stage, (function, arguments) in build_stages(corpus).items():
+            if stages is None or stage in stages:
+                results[name][stage] = measure(function, arguments, repeat)
+
+    return {
+        'meta': {
+            'python': sys.version.split()[0],
+            'implementation': platform.python_implementation(),
+            'platform': platform.platform(),
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'repeat': repeat,
+        },
+        'results': results,
+    }
+
+
+def compare(baseline, current, threshold=0.10):
+    """
+    Compare two reports.
+
+    A stage regresses when its median latency grows, or its throughput drops,
+    by more than the threshold.
+
+    :param baseline: dict
+    :param current: dict
+    :param threshold: float
+        Tolerated relative change.
+    :return: list of dict
+        One row per stage measured in both reports, with a 'regression' flag.
+    """
+    rows = []
+    for corpus, stages in current['results'].items():
+        for stage, metrics in stages.items():
+            reference = baseline['results'].get(corpus, {}).get(stage)
+            if not reference or not reference['calls'] or not metrics['calls']:
+                continue
+            p50_change = metrics['p50_us'] / reference['p50_us'] - 1 if reference['p50_us'] else 0.0
+            throughput_change = metrics['throughput'] / reference['throughput'] - 1 if reference['throughput'] else 0.0
+            rows.append({
+                'corpus': corpus,
+                'stage': stage,
+                'p50_change': p50_change,
+                'throughput_change': throughput_change,
+                'regression': p50_change > threshold or throughput_change < -threshold,
+            })
+    return rows
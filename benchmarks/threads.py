@@ -0,0 +1,58 @@
+# benchmarks/threads.py
+
+import sys
+import time
+
+from Calculator import Calculator
+from ConcurrentCalculator import ConcurrentCalculator
+
+
+def _outcome(result):
+    return ('value', repr(result.value)) if result.ok else ('error', result.code)
+
+
+def stress(corpus, thread_counts=(1, 2, 4, 8), repeat=20):
+    """
+    Evaluate a corpus on a shared ConcurrentCalculator with several thread counts.
+
+    Every pass starts from empty caches, so threads race on parsing, caching
+    and compiling the same expressions. Each outcome is checked against a
+    sequential evaluation on a plain Calculator.
+
+    :param corpus: list of str
+    :param thread_counts: iterable of int
+    :param repeat: int
+        Passes over the corpus per thread count.
+    :return: dict
+        The JSON-compatible report, with the throughput of every thread count,
+        its speedup over one thread and the number of mismatched outcomes.
+    """
+    reference = Calculator()
+    expected = [_outcome(reference.evaluate(expression)) for expression in corpus]
+
+    rows = {}
+    for threads in thread_counts:
+        calculator = ConcurrentCalculator(max_workers=threads)
+        mismatches = 0
+        start = time.perf_counter()
+        for _ in range(repeat):
+            calculator.clear_cache()
+            results = calculator.calculate_many(corpus)
+            mismatches += sum(_outcome(result) != outcome for result, outcome in zip(results, expected))
+        elapsed = time.perf_counter() - start
+        rows[threads] = {
+            'throughput': len(corpus) * repeat / elapsed if elapsed else 0.0,
+            'mismatches': mismatches,
+        }
+
+    base = rows[min(rows)]['throughput'] if rows else 0.0
+    for row in rows.values():
+        row['speedup'] = row['throughput'] / base if base else 0.0
+    return {
+        'meta': {
+            'python': sys.version.split()[0],
+            # False on free-threaded builds running without the GIL
+            'gil_enabled': getattr(sys, '_is_gil_enabled', lambda: True)(),
+        },
+        'results': rows,
+    }
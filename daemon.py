@@ -0,0 +1,87 @@
+# daemon.py
+
+import os
+import socket
+
+RECEIVE_SIZE = 1 << 16
+
+
+def send(path, expression, timeout=5.0):
+    """
+    Ask a running daemon to evaluate one expression.
+
+    Only the socket module is needed, so a client starts as fast as the
+    interpreter does.
+
+    :param path: str
+        The Unix socket of the daemon.
+    :param expression: str
+    :param timeout: float
+        Seconds to wait for the daemon.
+    :return: str
+        The record line of the expression, as printed by ``main.py -e``.
+    :raises OSError: if no daemon answers on the socket.
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.settimeout(timeout)
+        client.connect(path)
+        client.sendall(expression.replace('\n', ' ').encode() + b'\n')
+        client.shutdown(socket.SHUT_WR)
+        chunks = []
+        while True:
+            chunk = client.recv(RECEIVE_SIZE)
+            if not chunk:
+                break
+            chunks.append(chunk)
+    line = b''.join(chunks).decode()
+    if not line:
+        raise ConnectionError("The daemon closed the connection without answering.")
+    return line
+
+
+def serve(path, calculator=None):
+    """
+    Answer expressions on a Unix socket until interrupted.
+
+    Every line received is evaluated by one long-lived calculator, whose caches
+    stay warm across clients, and answered with one plain record line. The
+    protocol is line-based, so any Unix socket client can be used, e.g.
+    ``echo '2+3' | nc -U /tmp/calculator.sock``.
+
+    :param path: str
+        The Unix socket to create; a stale socket file is replaced.
+    :param calculator: Calculator, optional
+    """
+    import signal
+    import socketserver
+    import threading
+
+    from Calculator import Calculator
+    from main import format_plain
+
+    calculator = calculator if calculator is not None else Calculator()
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            for line in self.rfile:
+                expression = line.decode('utf-8', 'replace').strip()
+                try:
+                    record = format_plain(expression, calculator.compute(expression), None)
+                except Exception as e:
+                    record = format_plain(expression, None, e)
+                self.wfile.write(record.encode())
+
+    def stop(signum, frame):
+        raise SystemExit(0)
+
+    if os.path.exists(path):
+        os.remove(path)
+    if threading.current_thread() is threading.main_thread():
+        # Remove the socket file when the daemon is terminated
+        signal.signal(signal.SIGTERM, stop)
+    # Connections are handled one at a time: the calculator is not shared between threads
+    with socketserver.UnixStreamServer(path, Handler) as server:
+        try:
+            server.serve_forever()
+        finally:
+            os.remove(path)
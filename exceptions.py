@@ -1,150 +1,222 @@
 # exceptions.py
 
+# Code reported for errors that are not calculator exceptions
+UNEXPECTED_ERROR_CODE = 100  # e.g. the ZeroDivisionError raised by 0^-1
+
+
 class CalculatorException(Exception):
     """
     Base class for all calculator-related exceptions.
+
+    Every class carries a stable numeric ``code`` that batch APIs use to report
+    errors per row instead of raising. Constructors only store their arguments:
+    the message is rendered by ``render`` when the exception is converted to a
+    string, so errors that nobody displays cost no formatting.
     """
-    pass
+    code = 1
+    expression = None
+    index = None
+
+    def __str__(self):
+        return self.render()
+
+    def render(self):
+        return super().__str__()
+
+    @staticmethod
+    def generate_error_message(expression, index, message):
+        marker = ' ' * index + '^'
+        return f"{message}:\n{expression}\n{marker}"
+
+    def _located(self, message, fallback):
+        # The caret marker needs the source expression
+        if self.expression and self.index is not None:
+            return self.generate_error_message(self.expression, self.index, message)
+        return fallback
 
 
 class InvalidTokenException(CalculatorException):
     """
     Raised when an invalid token is encountered in the expression.
     """
+    code = 2
+
     def __init__(self, token, expression=None, index=None):
-        if expression and index is not None:
-            error_message = self.generate_error_message(expression, index, f"Invalid token '{token}'")
-        else:
-            error_message = f"Invalid token encountered: {token}"
-        super().__init__(error_message)
+        super().__init__(token, expression, index)
+        self.token = token
+        self.expression = expression
+        self.index = index
 
-    @staticmethod
-    def generate_error_message(expression, index, message):
-        marker = ' ' * index + '^'
-        return f"{message}:\n{expression}\n{marker}"
+    def render(self):
+        return self._located(f"Invalid token '{self.token}'", f"Invalid token encountered: {self.token}")
 
 
 class InvalidExpressionException(CalculatorException):
     """
     Raised when the expression is invalid or improperly formatted.
     """
+    code = 3
+
     def __init__(self, message="Invalid expression.", expression=None, index=None):
-        if expression and index is not None:
-            error_message = self.generate_error_message(expression, index, message)
-        else:
-            error_message = message
-        super().__init__(error_message)
+        super().__init__(message, expression, index)
+        self.message = message
+        self.expression = expression
+        self.index = index
 
-    @staticmethod
-    def generate_error_message(expression, index, message):
-        marker = ' ' * index + '^'
-        return f"{message}:\n{expression}\n{marker}"
+    def render(self):
+        return self._located(self.message, self.message)
 
 
 class DivisionByZeroException(CalculatorException):
     """
     Raised when a division by zero is attempted.
     """
-    def __init__(self):
-        super().__init__("Division by zero is not allowed.")
+    code = 4
+
+    def render(self):
+        return "Division by zero is not allowed."
 
 
 class ConsecutiveTildesException(CalculatorException):
     """
     Raised when consecutive tilde operators are encountered in the expression.
     """
+    code = 5
+
     def __init__(self, expression=None, index=None):
-        if expression and index is not None:
-            error_message = self.generate_error_message(expression, index, "Consecutive tildes are not allowed")
-        else:
-            error_message = "Consecutive tildes are not allowed in the expression."
-        super().__init__(error_message)
+        super().__init__(expression, index)
+        self.expression = expression
+        self.index = index
 
-    @staticmethod
-    def generate_error_message(expression, index, message):
-        marker = ' ' * index + '^'
-        return f"{message}:\n{expression}\n{marker}"
+    def render(self):
+        return self._located("Consecutive tildes are not allowed",
+                             "Consecutive tildes are not allowed in the expression.")
 
 
 class MissingOperandException(CalculatorException):
     """
     Raised when an operator is missing a required operand.
     """
+    code = 6
+
     def __init__(self, operator, expression=None, index=None):
-        if expression and index is not None:
-            error_message = self.generate_error_message(expression, index, f"Missing operand for operator '{operator}'")
-        else:
-            error_message = f"Missing operand for operator: {operator}"
-        super().__init__(error_message)
+        super().__init__(operator, expression, index)
+        self.operator = operator
+        self.expression = expression
+        self.index = index
 
-    @staticmethod
-    def generate_error_message(expression, index, message):
-        marker = ' ' * index + '^'
-        return f"{message}:\n{expression}\n{marker}"
+    def render(self):
+        return self._located(f"Missing operand for operator '{self.operator}'",
+                             f"Missing operand for operator: {self.operator}")
 
 
 class MismatchedParenthesesException(CalculatorException):
     """
     Raised when there are mismatched parentheses in the expression.
     """
+    code = 7
+
     def __init__(self, expression=None, index=None):
-        if expression and index is not None:
-            error_message = self.generate_error_message(expression, index, "Mismatched parentheses")
-        else:
-            error_message = "Mismatched parentheses in the expression."
-        super().__init__(error_message)
+        super().__init__(expression, index)
+        self.expression = expression
+        self.index = index
 
-    @staticmethod
-    def generate_error_message(expression, index, message):
-        marker = ' ' * index + '^'
-        return f"{message}:\n{expression}\n{marker}"
+    def render(self):
+        return self._located("Mismatched parentheses", "Mismatched parentheses in the expression.")
 
 
 class InvalidCharacterException(CalculatorException):
     """
     Raised when an invalid character is encountered in the expression.
     """
+    code = 8
+
     def __init__(self, char, expression=None, index=None):
-        if expression and index is not None:
-            error_message = self.generate_error_message(expression, index, f"Invalid character '{char}'")
-        else:
-            error_message = f"Invalid character encountered: {char}"
-        super().__init__(error_message)
+        super().__init__(char, expression, index)
+        self.char = char
+        self.expression = expression
+        self.index = index
 
-    @staticmethod
-    def generate_error_message(expression, index, message):
-        marker = ' ' * index + '^'
-        return f"{message}:\n{expression}\n{marker}"
+    def render(self):
+        return self._located(f"Invalid character '{self.char}'", f"Invalid character encountered: {self.char}")
 
 
 class FactorialNegativeNumberException(CalculatorException):
     """
     Raised when attempting to calculate the factorial of a negative number.
     """
+    code = 9
+
     def __init__(self, operand=None):
-        if operand is not None:
-            message = f"Factorial is not defined for negative numbers: {operand}"
-        else:
-            message = "Factorial is not defined for negative numbers."
-        super().__init__(message)
+        super().__init__(operand)
+        self.operand = operand
+
+    def render(self):
+        if self.operand is not None:
+            return f"Factorial is not defined for negative numbers: {self.operand}"
+        return "Factorial is not defined for negative numbers."
 
 
 class FactorialFloatException(CalculatorException):
     """
     Raised when attempting to calculate the factorial of a float number.
     """
+    code = 10
+
     def __init__(self, operand=None):
-        if operand is not None:
-            message = f"Factorial is not defined for non-integer numbers: {operand}"
-        else:
-            message = "Factorial is not defined for non-integer numbers."
-        super().__init__(message)
+        super().__init__(operand)
+        self.operand = operand
+
+    def render(self):
+        if self.operand is not None:
+            return f"Factorial is not defined for non-integer numbers: {self.operand}"
+        return "Factorial is not defined for non-integer numbers."
 
 
 class ResultTooLargeException(CalculatorException):
     """
     Raised when the result of a calculation exceeds the allowable range.
     """
+    code = 11
+
     def __init__(self, result):
-        message = f"The result {result} is too large to handle."
-        super().__init__(message)
+        super().__init__(result)
+        self.result = result
+
+    def render(self):
+        return f"The result {self.result} is too large to handle."
+
+
+class UndefinedVariableException(CalculatorException):
+    """
+    Raised when an expression refers to a variable that has no value.
+    """
+    code = 12
+
+    def __init__(self, name):
+        super().__init__(name)
+        self.name = name
+
+    def render(self):
+        return f"Undefined variable: {self.name}"
+
+
+class BudgetExceededException(CalculatorException):
+    """
+    Raised when an expression exceeds a limit of the calculator's budget,
+    either by its static estimate or by running past its deadline.
+    """
+    code = 13
+
+    def __init__(self, limit, value, maximum, estimate=None):
+        super().__init__(limit, value, maximum)
+        self.limit = limit
+        self.value = value
+        self.maximum = maximum
+        # The static estimate of the expression, None for deadlines
+        self.estimate = estimate
+
+    def render(self):
+        if self.limit == 'deadline':
+            return f"Evaluation exceeded its deadline: {self.value:.3g}s > {self.maximum:.3g}s"
+        return f"Expression exceeds its {self.limit} budget: {self.value:.6g} > {self.maximum:.6g}"
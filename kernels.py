@@ -0,0 +1,85 @@
+# kernels.py
+
+import math
+
+INF = math.inf
+
+# Factorials that fit in a float, looked up instead of multiplied out
+FACTORIALS = tuple(math.factorial(n) for n in range(171))
+
+# Digit sums of 0..9999: integers are summed four digits at a time
+DIGIT_SUMS = tuple(sum(map(int, str(n))) for n in range(10000))
+
+# Integers up to this bound are summed arithmetically, longer ones as text
+ARITHMETIC_DIGIT_LIMIT = 10 ** 16
+
+
+def factorial(value):
+    """
+    Look up the factorial of an integral value.
+
+    :param value: int or float
+    :return: int or None
+        value! for an integral value in 0..170, None for any other value,
+        which the caller checks the slow way.
+    """
+    if (type(value) is int or type(value) is float and value.is_integer()) and 0 <= value <= 170:
+        return FACTORIALS[int(value)]
+    return None
+
+
+def is_scientific(value):
+    """
+    Tell whether str() prints a number in scientific notation.
+
+    Floats are printed with an exponent outside [1e-4, 1e16), except zero,
+    infinities and NaN; integers never are.
+
+    :param value: int or float
+    :return: bool
+    """
+    if type(value) is float:
+        magnitude = abs(value)
+        return value != 0 and (magnitude < 1e-4 or 1e16 <= magnitude < INF)
+    if type(value) is int:
+        return False
+    return 'e' in str(value).lower()
+
+
+def digit_sum(value):
+    """
+    Sum the decimal digits of a number as str() prints it.
+
+    Integers, and integral floats (printed with a '.0'), are summed
+    arithmetically below 10^16. The fraction of other floats is part of their
+    digits ('12.5' sums to 8); 'inf' and 'nan' have no digits and sum to 0.
+    Numbers printed in scientific notation have no well-defined digits and are
+    rejected by the callers first (see is_scientific).
+
+    :param value: non-negative int or float
+    :return: int
+    """
+    if type(value) is float:
+        if not (value.is_integer() and value < ARITHMETIC_DIGIT_LIMIT):
+            return text_digit_sum(repr(value))
+        value = int(value)
+    elif type(value) is not int:
+        return text_digit_sum(str(value))
+    if value >= ARITHMETIC_DIGIT_LIMIT:
+        return text_digit_sum(str(value))
+
+    total = 0
+    while value >= 10000:
+        value, low = divmod(value, 10000)
+        total += DIGIT_SUMS[low]
+    return total + DIGIT_SUMS[value]
+
+
+def text_digit_sum(text):
+    """
+    Sum the digits of a decimal text, ignoring any other character.
+    """
+    # Nine counts in C instead of one int() call per character
+    return (text.count('1') + 2 * text.count('2') + 3 * text.count('3') + 4 * text.count('4')
+            + 5 * text.count('5') + 6 * text.count('6') + 7 * text.count('7') + 8 * text.count('8')
+            + 9 * text.count('9'))
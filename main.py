@@ -1,9 +1,190 @@
 # main.py
 
-from Calculator import *
+import math
+import sys
 
+# Modules needed by a single mode are imported by that mode, so that a one-shot
+# evaluation (-e) only pays for the parser and the calculator
+OUTPUT_BUFFER_SIZE = 1 << 16
+
+
+def first_line(error):
+    # The caret marker of parse errors is meant for the console
+    message = str(error)
+    return message.splitlines()[0] if message else type(error).__name__
+
+
+def format_plain(expression, result, error):
+    if error is not None:
+        return f"Error: {first_line(error)}\n"
+    return f"{result}\n"
+
+
+def format_tsv(expression, result, error):
+    expression = expression.replace('\t', ' ')
+    if error is not None:
+        return f"{expression}\t\t{type(error).__name__}\t{first_line(error)}\n"
+    return f"{expression}\t{result}\t\t\n"
+
+
+def json_record(expression, result, error):
+    """
+    Build the JSON-compatible record of an evaluated expression.
+    """
+    if error is not None:
+        return {'expression': expression, 'result': None, 'error': type(error).__name__, 'message': str(error)}
+    if isinstance(result, int) or (isinstance(result, float) and math.isfinite(result)):
+        value = result
+    else:
+        # JSON has no infinities, NaN or complex numbers
+        value = str(result)
+    return {'expression': expression, 'result': value, 'error': None, 'message': None}
+
+
+def format_jsonl(expression, result, error):
+    import json
+    return json.dumps(json_record(expression, result, error)) + "\n"
+
+
+FORMATTERS = {
+    'plain': format_plain,
+    'tsv': format_tsv,
+    'jsonl': format_jsonl,
+}
+
+
+def stream(calculator, lines, out, output_format='plain'):
+    """
+    Evaluate one expression per line and write one record per expression.
+
+    :param calculator: Calculator
+    :param lines: iterable of str
+        Read lazily, one expression per line.
+    :param out: file-like object
+        Receives the records.
+    :param output_format: str
+        One of 'plain', 'tsv' or 'jsonl'.
+    :return: tuple
+        The number of expressions and the number of errors.
+    """
+    formatter = FORMATTERS[output_format]
+    write = out.write
+    count = errors = 0
+
+    for line in lines:
+        expression = line.strip()
+        count += 1
+        try:
+            write(formatter(expression, calculator.compute(expression), None))
+        except Exception as e:
+            errors += 1
+            write(formatter(expression, None, e))
+
+    return count, errors
+
+
+def make_calculator(cache=None, warm=None, max_cost=None, deadline=None):
+    """
+    Build the calculator of the streaming and daemon modes.
+
+    :param cache: str, optional
+        Database file of a persistent program store.
+    :param warm: str, optional
+        Corpus file, one expression per line, loaded into the caches first.
+    :param max_cost: float, optional
+        Reject expressions whose estimated cost exceeds this many operator calls.
+    :param deadline: float, optional
+        Abandon evaluations running longer than this many seconds.
+    :return: Calculator
+    """
+    from Calculator import Calculator
+
+    store = budget = None
+    if cache is not None:
+        from ProgramStore import ProgramStore
+        store = ProgramStore(cache)
+    if max_cost is not None or deadline is not None:
+        from CostAnalysis import Budget
+        budget = Budget(max_cost=max_cost, deadline=deadline)
+    calculator = Calculator(store=store, budget=budget)
+    if warm is not None:
+        with open(warm, 'r', buffering=OUTPUT_BUFFER_SIZE) as lines:
+            calculator.warm(lines)
+    return calculator
+
+
+def run_stream(source, output_format, calculator=None):
+    import time
+    from Calculator import Calculator
+
+    calculator = calculator if calculator is not None else Calculator()
+    out = open(sys.stdout.fileno(), 'w', buffering=OUTPUT_BUFFER_SIZE, closefd=False)
+    start = time.perf_counter()
+
+    if source == '-':
+        count, errors = stream(calculator, sys.stdin, out, output_format)
+    else:
+        with open(source, 'r', buffering=OUTPUT_BUFFER_SIZE) as lines:
+            count, errors = stream(calculator, lines, out, output_format)
+    out.flush()
+
+    elapsed = time.perf_counter() - start
+    rate = count / elapsed if elapsed > 0 else float('inf')
+    print(f"Evaluated {count} expressions ({errors} errors) in {elapsed:.3f}s: {rate:.0f} expressions/s",
+          file=sys.stderr)
+
+
+def one_shot(expression, socket_path=None):
+    """
+    Evaluate a single expression and print its result.
+
+    :param expression: str
+    :param socket_path: str, optional
+        Unix socket of a running daemon; the expression is evaluated locally
+        when no daemon answers.
+    :return: int
+        The exit status: 0 on success, 1 on error.
+    """
+    if socket_path is not None:
+        from daemon import send
+
+        try:
+            line = send(socket_path, expression)
+        except OSError:
+            pass
+        else:
+            sys.stdout.write(line)
+            return 1 if line.startswith("Error: ") else 0
+
+    from Calculator import Calculator
+
+    try:
+        sys.stdout.write(format_plain(expression, Calculator(cache_size=0).compute(expression), None))
+        return 0
+    except Exception as e:
+        sys.stdout.write(format_plain(expression, None, e))
+        return 1
+
+
+def _one_shot_arguments(argv):
+    # Recognizes '-e EXPR [--socket PATH]' without importing argparse
+    options = {}
+    arguments = iter(argv)
+    for argument in arguments:
+        if argument in ('-e', '--expression'):
+            options['expression'] = next(arguments, None)
+        elif argument == '--socket':
+            options['socket'] = next(arguments, None)
+        else:
+            return None
+    if options.get('expression') is None or ('socket' in options and options['socket'] is None):
+        return None
+    return options
+
+
+def interactive():
+    from Calculator import Calculator
 
-def main():
     calculator = Calculator()
     print("Advanced Calculator - Omega Class 2024")
     print("Enter a mathematical expression to calculate or type 'exit' to quit.")
@@ -24,5 +205,63 @@ def main():
             print("Invalid expression. Please try again.")
 
 
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+    options = _one_shot_arguments(argv)
+    if options is not None:
+        return one_shot(options['expression'], options.get('socket'))
+
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Advanced Calculator - Omega Class 2024")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument('--stdin', action='store_const', const='-', dest='source',
+                        help="evaluate one expression per line read from standard input")
+    source.add_argument('--file', dest='source', metavar='PATH',
+                        help="evaluate one expression per line read from a file")
+    source.add_argument('-e', '--expression', help="evaluate one expression and exit")
+    source.add_argument('--serve', metavar='SOCKET', help="run a daemon answering on a Unix socket")
+    source.add_argument('--explain', metavar='EXPR', help="print the estimated cost of every subexpression and exit")
+    parser.add_argument('--format', choices=sorted(FORMATTERS), default='plain',
+                        help="output format of the streaming mode (default: plain)")
+    parser.add_argument('--socket', help="with -e, ask the daemon listening on this Unix socket first")
+    parser.add_argument('--cache', metavar='PATH',
+                        help="keep parsed programs in this database across runs (streaming and daemon modes)")
+    parser.add_argument('--warm', metavar='CORPUS',
+                        help="load the programs of a corpus file before evaluating (streaming and daemon modes)")
+    parser.add_argument('--max-cost', type=float, metavar='UNITS',
+                        help="reject expressions estimated to cost more operator calls (streaming and daemon modes)")
+    parser.add_argument('--deadline', type=float, metavar='SECONDS',
+                        help="abandon evaluations running longer (streaming and daemon modes)")
+    args = parser.parse_args(argv)
+
+    if args.expression is not None:
+        return one_shot(args.expression, args.socket)
+    if args.explain is not None:
+        from Calculator import Calculator
+        try:
+            Calculator(cache_size=0).explain(args.explain)
+        except Exception as e:
+            sys.stdout.write(format_plain(args.explain, None, e))
+            return 1
+        return 0
+    if args.serve is None and args.source is None:
+        interactive()
+        return 0
+
+    calculator = make_calculator(args.cache, args.warm, args.max_cost, args.deadline)
+    try:
+        if args.serve is not None:
+            from daemon import serve
+            serve(args.serve, calculator)
+        else:
+            run_stream(args.source, args.format, calculator)
+    finally:
+        if calculator.store is not None:
+            calculator.store.close()
+    return 0
+
+
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
@@ -0,0 +1,309 @@
+# server.py
+
+import argparse
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from Calculator import Calculator
+from main import json_record
+
+MAX_BODY_SIZE = 1 << 20
+
+REASONS = {
+    200: 'OK',
+    400: 'Bad Request',
+    404: 'Not Found',
+    405: 'Method Not Allowed',
+    413: 'Payload Too Large',
+}
+
+
+class CalculatorServer:
+    def __init__(self, calculator=None, host='127.0.0.1', port=8080, batch_size=64, batch_delay=0.002,
+                 queue_size=1024):
+        """
+        Initialize an HTTP/JSON service around one shared calculator.
+
+        Concurrent requests are queued and coalesced into micro-batches, which are
+        evaluated on a single worker thread: the event loop never evaluates
+        expressions itself and the calculator is only ever used by one thread.
+
+        :param calculator: Calculator, optional
+        :param host: str
+        :param port: int
+            0 picks a free port, available in ``port`` once started.
+        :param batch_size: int
+            Maximum number of expressions evaluated per batch.
+        :param batch_delay: float
+            Seconds to wait for more requests before evaluating a partial batch.
+        :param queue_size: int
+            Maximum number of queued requests; when full, connections wait
+            before their requests are accepted.
+        """
+        self.calculator = calculator if calculator is not None else Calculator()
+        self.host = host
+        self.port = port
+        self.batch_size = batch_size
+        self.batch_delay = batch_delay
+        self.queue_size = queue_size
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='calculator')
+        self.requests = 0
+        self.batches = 0
+        self._queue = None
+        self._batcher = None
+        self._server = None
+
+    async def start(self):
+        self._queue = asyncio.Queue(self.queue_size)
+        self._batcher = asyncio.create_task(self._run_batches())
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def serve_forever(self):
+        await self.start()
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def close(self):
+        self._server.close()
+        await self._server.wait_closed()
+        self._batcher.cancel()
+        self.executor.shutdown(wait=True)
+
+    async def evaluate(self, expressions, variables=None):
+        """
+        Queue expressions for the next batch and wait for their records.
+
+        :param expressions: list of str
+        :param variables: dict, optional
+        :return: list of dict
+        """
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((expressions, variables or {}, future))
+        return await future
+
+    async def _run_batches(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            size = len(batch[0][0])
+            if size < self.batch_size and self.batch_delay:
+                await asyncio.sleep(self.batch_delay)
+            while size < self.batch_size and not self._queue.empty():
+                item = self._queue.get_nowait()
+                batch.append(item)
+                size += len(item[0])
+
+            jobs = [(expressions, variables) for expressions, variables, _ in batch]
+            try:
+                results = await loop.run_in_executor(self.executor, self._evaluate_batch, jobs)
+            except Exception as e:
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            self.batches += 1
+            for (_, _, future), records in zip(batch, results):
+                if not future.done():
+                    future.set_result(records)
+
+    def _evaluate_batch(self, jobs):
+        # Runs on the worker thread
+        results = []
+        for expressions, variables in jobs:
+            records = []
+            for expression in expressions:
+                try:
+                    records.append(json_record(expression, self.calculator.compute(expression, **variables), None))
+                except Exception as e:
+                    records.append(json_record(expression, None, e))
+            results.append(records)
+        return results
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                try:
+                    method, target, version = request_line.decode('latin-1').split()
+                except ValueError:
+                    await self._respond(writer, 400, {'error': 'Malformed request line.'}, False)
+                    break
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                connection = headers.get('connection', '').lower()
+                keep_alive = connection == 'keep-alive' if version == 'HTTP/1.0' else connection != 'close'
+
+                length = headers.get('content-length') or '0'
+                # int() would also take signs, spaces and underscores
+                if not (length.isascii() and length.isdigit()):
+                    await self._respond(writer, 400, {'error': 'Malformed Content-Length.'}, False)
+                    break
+                length = int(length)
+                if length > MAX_BODY_SIZE:
+                    await self._respond(writer, 413, {'error': 'Request body too large.'}, False)
+                    break
+                body = await reader.readexactly(length) if length else b''
+
+                status, payload = await self._dispatch(method, target, body)
+                await self._respond(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _dispatch(self, method, target, body):
+        if target == '/health':
+            if method != 'GET':
+                return 405, {'error': 'Use GET.'}
+            return 200, {'status': 'ok', 'requests': self.requests, 'batches': self.batches}
+        if target != '/calculate':
+            return 404, {'error': f"Unknown path: {target}"}
+        if method != 'POST':
+            return 405, {'error': 'Use POST.'}
+
+        try:
+            request = json.loads(body)
+        except ValueError:
+            return 400, {'error': 'Body is not valid JSON.'}
+        if not isinstance(request, dict):
+            return 400, {'error': 'Body must be a JSON object.'}
+        variables = request.get('variables') or {}
+        if not isinstance(variables, dict):
+            return 400, {'error': "'variables' must be an object."}
+
+        expressions = request.get('expressions')
+        if isinstance(expressions, list) and all(isinstance(e, str) for e in expressions):
+            self.requests += 1
+            return 200, {'results': await self.evaluate(expressions, variables)}
+        if isinstance(request.get('expression'), str):
+            self.requests += 1
+            return 200, (await self.evaluate([request['expression']], variables))[0]
+        return 400, {'error': "Expected 'expression' (string) or 'expressions' (list of strings)."}
+
+    @staticmethod
+    async def _respond(writer, status, payload, keep_alive):
+        body = json.dumps(payload).encode()
+        head = (
+            f"HTTP/1.1 {status} {REASONS[status]}\r\n"
+            f"Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+        )
+        writer.write(head.encode('latin-1') + body)
+        await writer.drain()
+
+
+async def request(reader, writer, payload, host='127.0.0.1', method='POST', target='/calculate'):
+    """
+    Send one request on a keep-alive connection and read the JSON response.
+
+    :return: tuple
+        The status code and the decoded body.
+    """
+    body = json.dumps(payload).encode() if payload is not None else b''
+    writer.write(
+        f"{method} {target} HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\n"
+        f"Content-Length: {len(body)}\r\n\r\n".encode('latin-1') + body
+    )
+    await writer.drain()
+
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        if name.strip().lower() == 'content-length':
+            length = int(value)
+    return status, json.loads(await reader.readexactly(length))
+
+
+async def load_test(host, port, expressions, requests=1000, concurrency=16, batch=1):
+    """
+    Drive a running server from keep-alive connections and measure it.
+
+    :param expressions: list of str
+        Sent in turn, ``batch`` expressions per request.
+    :param requests: int
+        Total number of requests.
+    :param concurrency: int
+        Number of connections sending requests concurrently.
+    :return: dict
+        Throughput and latency percentiles.
+    """
+    pending = iter(range(requests))
+    latencies = []
+    failures = 0
+
+    async def connection():
+        nonlocal failures
+        reader, writer = await asyncio.open_connection(host, port)
+        try:
+            for i in pending:
+                chunk = [expressions[(i * batch + j) % len(expressions)] for j in range(batch)]
+                payload = {'expressions': chunk} if batch > 1 else {'expression': chunk[0]}
+                start = time.perf_counter()
+                status, _ = await request(reader, writer, payload, host)
+                latencies.append(time.perf_counter() - start)
+                if status != 200:
+                    failures += 1
+        finally:
+            writer.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(connection() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'expressions': len(latencies) * batch,
+        'failures': failures,
+        'seconds': elapsed,
+        'requests_per_second': len(latencies) / elapsed,
+        'p50_ms': latencies[len(latencies) // 2] * 1000,
+        'p99_ms': latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Calculator HTTP/JSON service")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--batch-delay', type=float, default=0.002, help="seconds")
+    parser.add_argument('--queue-size', type=int, default=1024)
+    parser.add_argument('--load-test', action='store_true',
+                        help="run the load-test client against a running server instead of serving")
+    parser.add_argument('-n', '--requests', type=int, default=1000)
+    parser.add_argument('-c', '--concurrency', type=int, default=16)
+    parser.add_argument('--batch', type=int, default=1, help="expressions per load-test request")
+    args = parser.parse_args(argv)
+
+    if args.load_test:
+        expressions = ["(2+3)*4-5", "((3!+2)^2+(4-2)+12+1)", "10/(2+3)*4+(5-3+8+1)", "123#+5!", "1/0"]
+        stats = asyncio.run(load_test(args.host, args.port, expressions, args.requests, args.concurrency, args.batch))
+        print(json.dumps(stats, indent=2))
+    else:
+        server = CalculatorServer(host=args.host, port=args.port, batch_size=args.batch_size,
+                                  batch_delay=args.batch_delay, queue_size=args.queue_size)
+        asyncio.run(server.serve_forever())
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,19 @@
 # test_calculator.py
+import math
+
 import pytest
 from Calculator import Calculator
+from Profiler import Profiler
+from exceptions import (
+    CalculatorException,
+    ConsecutiveTildesException,
+    DivisionByZeroException,
+    InvalidExpressionException,
+    MismatchedParenthesesException,
+    MissingOperandException,
+    ResultTooLargeException,
+    UNEXPECTED_ERROR_CODE,
+)
 
 calculator = Calculator()
 
@@ -103,3 +116,972 @@ def test_simple_expressions(expression, expected):
 def test_complex_expressions(expression, expected):
     result = calculator.calculate(expression)
     assert result == pytest.approx(expected, rel=1e-5), f"Failed for expression: {expression}"
+
+
+# Test the expression caches
+def test_cache_shares_whitespace_variants():
+    calc = Calculator()
+    assert calc.calculate("2 + 3 * 4") == 14
+    assert calc.calculate("2+3*4") == 14
+    assert calc.result_cache.hits == 1
+    assert len(calc.program_cache) == 1
+
+
+def test_cache_skips_parsing_on_hit(monkeypatch):
+    calc = Calculator()
+    calc.calculate("(3!+2)^2")
+    calc.result_cache.clear()
+
+    def fail(expression):
+        raise AssertionError("parser should not run on a cache hit")
+
+    monkeypatch.setattr(calc.parser, "parse_expression", fail)
+    assert calc.calculate("(3!+2)^2") == 64
+    assert calc.program_cache.hits == 1
+
+
+def test_cache_lru_eviction_and_clear():
+    calc = Calculator(cache_size=2)
+    for expression in ("1+1", "2+2", "1+1", "3+3"):
+        calc.calculate(expression)
+    assert "1+1" in calc.result_cache
+    assert "2+2" not in calc.result_cache
+    assert calc.result_cache.evictions == 1
+
+    calc.clear_cache()
+    assert len(calc.result_cache) == 0 and len(calc.program_cache) == 0
+    assert calc.result_cache.stats()['hits'] == 0
+
+
+def test_cache_byte_limit():
+    calc = Calculator(cache_bytes=2000)
+    for i in range(20):
+        calc.calculate(f"{i}+{i}")
+    assert calc.program_cache.current_bytes <= 2000
+    assert calc.program_cache.evictions > 0
+
+
+def test_cache_does_not_store_errors():
+    calc = Calculator()
+    assert calc.calculate("3+*") is None
+    assert calc.calculate("1/0") is None
+    assert len(calc.result_cache) == 0
+
+
+# Test the postfix compiler against the interpreter
+@pytest.mark.parametrize("expression", [
+    "(3!+2)^2", "~(5*2)+10", "10/(2+3)*4", "((3+5)@(2+3))^2", "(10-3$4)*2",
+    "10&3", "10%3", "123#", "(10#-2)^2", "2^-2^2", "2*-(3+4)", "~--3",
+])
+def test_compiled_matches_interpreter(expression):
+    postfix = calculator.parser.parse_expression(expression)
+    function = calculator.compiler.compile(postfix)
+    assert function() == calculator.evaluate_postfix(postfix)
+
+
+@pytest.mark.parametrize("postfix, exception", [
+    ([1.0, 0.0, '/'], "DivisionByZeroException"),
+    ([1e200, 1e200, '*'], "ResultTooLargeException"),
+    ([10.0, 400.0, '^'], "ResultTooLargeException"),
+    ([-1.0, '!'], "FactorialNegativeNumberException"),
+    ([1.5, '!'], "FactorialFloatException"),
+    ([171.0, '!'], "ResultTooLargeException"),
+    ([-1.0, '#'], "InvalidExpressionException"),
+    ([1.0, '+'], "MissingOperandException"),
+    ([1.0, 2.0], "CalculatorException"),
+    ([1.0, 0.0, '/', '+'], "DivisionByZeroException"),
+])
+def test_compiled_raises_same_exceptions(postfix, exception):
+    function = calculator.compiler.compile(postfix)
+    with pytest.raises(Exception) as compiled_error:
+        function()
+    with pytest.raises(Exception) as interpreted_error:
+        calculator.evaluate_postfix(postfix)
+    assert type(compiled_error.value).__name__ == exception
+    assert type(compiled_error.value) is type(interpreted_error.value)
+    assert str(compiled_error.value) == str(interpreted_error.value)
+
+
+def test_hot_program_is_compiled():
+    calc = Calculator(compile_threshold=2)
+    calc.calculate("(2+3)*4")
+    calc.result_cache.clear()
+    assert calc.calculate("(2+3)*4") == 20
+    assert calc.program_cache.get("(2+3)*4").function is not None
+
+
+def test_compiled_programs_keep_infinite_literals():
+    calc = Calculator(compile_threshold=2)
+    for _ in range(3):
+        assert calc.evaluate("x-" + "9" * 400, x=1).value == -math.inf
+        assert calc.evaluate("(1/0)+" + "9" * 400).error_class is DivisionByZeroException
+    assert calc.program_cache.get("x-" + "9" * 400).function is not None
+
+
+# Test variables
+@pytest.mark.parametrize("expression, variables, expected", [
+    ("x+1", {"x": 2}, 3),
+    ("2*rate_1^2", {"rate_1": 3}, 18),
+    ("x!#", {"x": 5}, 3),
+    ("-x*(y-1)", {"x": 2, "y": 5}, -8),
+])
+def test_variables(expression, variables, expected):
+    calc = Calculator()
+    assert calc.calculate(expression, **variables) == pytest.approx(expected)
+    # A second binding reuses the cached program
+    assert calc.calculate(expression, **variables) == pytest.approx(expected)
+    assert calc.program_cache.hits >= 1 and len(calc.result_cache) == 0
+
+
+def test_undefined_variable():
+    with pytest.raises(Exception, match="Undefined variable: y"):
+        Calculator().compute("x+y", x=1)
+
+
+# Test vectorized evaluation against the scalar interpreter
+@pytest.mark.parametrize("expression", [
+    "x+y*2", "x/y", "x^y", "x!", "~x#", "x#", "x%y", "x$y&2", "x@y", "(x+y)!#",
+    "-x^2", "20!#+x", "x*1e300", "(x*10)!", "(x/3)#",
+])
+def test_vectorized_matches_scalar(expression):
+    np = pytest.importorskip("numpy")
+    xs = np.array([-171.0, -3.0, -0.5, 0.0, 0.5, 2.0, 3.0, 12.25, 170.0, 171.0, 1e20])
+    ys = np.array([-2.0, 0.0, 0.5, 1.0, 2.0, 3.0, 2520.5])
+    x, y = (grid.ravel() for grid in np.meshgrid(xs, ys))
+    expression = expression.replace("1e300", "(10^300)")
+
+    calc = Calculator()
+    result = calc.evaluate_vectorized(expression, x=x, y=y)
+
+    for row in range(len(x)):
+        try:
+            expected = calc.compute(expression, x=float(x[row]), y=float(y[row]))
+        except Exception as e:
+            assert result.errors[row] == getattr(e, "code", 100), (x[row], y[row])
+            continue
+        if isinstance(expected, complex):
+            assert result.errors[row] == 101
+        else:
+            assert result.errors[row] == 0, (x[row], y[row])
+            assert result.values[row] == pytest.approx(float(expected), rel=1e-12, nan_ok=True)
+
+
+def test_vectorized_raises_structural_errors():
+    np = pytest.importorskip("numpy")
+    calc = Calculator()
+    with pytest.raises(Exception, match="Undefined variable"):
+        calc.evaluate_vectorized("x+y", x=np.arange(3))
+    assert calc.evaluate_vectorized("2+3").values == 5
+
+
+# Test batches grouped by structural template
+def test_template_replaces_literals_with_slots():
+    parser = calculator.parser
+    assert parser.template("(1 2 + 3.5) * x1 ^ 2") == ("(0+0)*x1^0", ["12", "3.5", "2"])
+    assert parser.template("1.5.3")[0] == "1.5.3"
+    postfix, slots = parser.parse_template("-0^0!")
+    assert slots == ["_0", "_1"]
+    assert postfix == ["_0", "_1", "!", "^", "u-"]
+
+
+def test_evaluate_batch_matches_scalar():
+    pytest.importorskip("numpy")
+    shapes = ["({}+{})*{}^{}", "{}/{}", "{}!#", "-{}^{}", "~{}%{}", "{}$-{}&{}", "({}*10)!", "{}+*", "_0+{}"]
+    literals = ["0", "1", "3.5", "0.5", "170", "171", "12", "2 3"]
+    expressions = [shape.format(*(literals[(i + k) % len(literals)] for k in range(shape.count("{}"))))
+                   for shape in shapes for i in range(len(literals) * 2)]
+
+    result = Calculator().evaluate_batch(expressions)
+
+    for expression, value, code in zip(expressions, result.values, result.errors):
+        expected = Calculator().evaluate(expression)
+        if not expected.ok:
+            assert code == expected.code, expression
+        elif isinstance(expected.value, complex):
+            assert code == 101, expression
+        else:
+            assert code == 0, expression
+            assert value == pytest.approx(float(expected.value), rel=1e-12), expression
+
+
+@pytest.mark.parametrize("expression", ["~171^100#@7!", "(-3^3)@3^12.375^10*0.5&100", "(-2)^0.5", "(-9)^1000.5"])
+def test_evaluate_batch_reports_overflow_before_non_real_powers(expression):
+    pytest.importorskip("numpy")
+    result = Calculator().evaluate_batch([expression] * 8)
+    expected = Calculator().evaluate(expression)
+    assert list(result.errors) == [expected.code if not expected.ok else 101] * 8
+
+
+# Test the typed tokenizer
+def test_tokenize_typed_tokens_with_spans():
+    tokens = calculator.parser.tokenize("12.5 * (x1 - 3)")
+    assert [(t.kind, t.text, t.value) for t in tokens] == [
+        ("number", "12.5", 12.5), ("operator", "*", None), ("left_parenthesis", "(", None),
+        ("name", "x1", None), ("operator", "-", None), ("number", "3", 3.0),
+        ("right_parenthesis", ")", None),
+    ]
+    assert [(t.start, t.end) for t in tokens][:4] == [(0, 4), (5, 6), (7, 8), (8, 10)]
+
+
+def test_tokenize_ignores_spaces_inside_numbers():
+    assert [t.value for t in calculator.parser.tokenize("1 2. 5")] == [12.5]
+
+
+@pytest.mark.parametrize("expression, message", [
+    ("1 + ~~2", "Consecutive tildes are not allowed:\n1 + ~~2\n     ^"),
+    ("2 * ()", "Empty parentheses '()' are not allowed in the expression.:\n2 * ()\n    ^"),
+    ("2 + 3 ?", "Invalid token '?':\n2 + 3 ?\n      ^"),
+])
+def test_error_positions_use_source_spans(expression, message):
+    with pytest.raises(Exception) as error:
+        calculator.parser.parse_expression(expression)
+    assert str(error.value) == message
+
+
+# Test the bytecode format
+def test_bytecode_superinstructions_and_depth():
+    from Bytecode import CONST_CONST_BINOP, CONST_BINOP
+    postfix = calculator.parser.parse_expression("(1+2)*(x-3)")
+    program = calculator.machine.assemble(postfix)
+    assert program.opcodes[0] == CONST_CONST_BINOP
+    assert CONST_BINOP in program.opcodes
+    assert program.max_depth == 2
+    assert program.to_postfix() == postfix
+    assert calculator.machine.execute(program, {"x": 5}) == 6
+
+
+def test_bytecode_is_smaller_than_postfix():
+    import sys
+    postfix = calculator.parser.parse_expression("+".join(f"{i}*{i % 7}" for i in range(500)))
+    program = calculator.machine.assemble(postfix)
+    assert sys.getsizeof(program) * 2 < sys.getsizeof(postfix) + sum(sys.getsizeof(t) for t in postfix)
+    assert calculator.machine.execute(program) == calculator.evaluate_postfix(postfix)
+
+
+@pytest.mark.parametrize("postfix", [[1.0, '+'], [1.0, 2.0], [1.0, 0.0, '/', '+'], [2.0, 'y']])
+def test_bytecode_raises_same_exceptions(postfix):
+    program = calculator.machine.assemble(postfix)
+    with pytest.raises(Exception) as bytecode_error:
+        calculator.machine.execute(program)
+    with pytest.raises(Exception) as interpreted_error:
+        calculator.evaluate_postfix(program.to_postfix())
+    assert type(bytecode_error.value) is type(interpreted_error.value)
+    assert str(bytecode_error.value) == str(interpreted_error.value)
+
+
+def test_operators_are_shared_singletons():
+    from ExpressionParser import ExpressionParser
+    assert ExpressionParser().operators['+'] is ExpressionParser().operators['+']
+    with pytest.raises(AttributeError):
+        ExpressionParser().operators['+'].cache = {}
+
+
+# Test the optimized expression tree
+def optimized_tree(expression):
+    from ExpressionTree import ExpressionTree
+    postfix = calculator.parser.parse_expression(expression)
+    return ExpressionTree.build(postfix, calculator.parser.operators).optimize()
+
+
+def test_tree_folds_constants_and_negations():
+    assert repr(optimized_tree("x*3!+(2^10)").root) == "Binary('+', Binary('*', Variable('x'), Number(6)), Number(1024.0))"
+    assert repr(optimized_tree("~-x").root) == "Variable('x')"
+    # Subtrees that raise are kept for evaluation
+    assert repr(optimized_tree("x+1/0").root) == "Binary('+', Variable('x'), Binary('/', Number(1.0), Number(0.0)))"
+
+
+def test_tree_flattens_chains():
+    tree = optimized_tree("a+b+(c+d)*e*f$g$h")
+    assert repr(tree.root) == (
+        "NAry('+', [Variable('a'), Variable('b'), "
+        "NAry('*', [Binary('+', Variable('c'), Variable('d')), Variable('e'), "
+        "NAry('$', [Variable('f'), Variable('g'), Variable('h')])])])"
+    )
+    assert tree.evaluate({k: 1.0 for k in "abcdefgh"}) == 4.0
+
+
+@pytest.mark.parametrize("expression", [
+    "(2+3)*4-5", "~(5*2)+10", "((3+5)@(2+3))^2", "(2*5)!/(10-5)+14+1+2", "(10-3$4)*2+(5^2)+12+1",
+    "~--3", "2*-(3+4)", "1+2*3*4*5+6", "2$5$1&3",
+])
+def test_optimized_matches_default(expression):
+    assert Calculator(optimize=True).calculate(expression) == pytest.approx(calculator.calculate(expression))
+
+
+def test_optimized_long_chains():
+    expression = "+".join(["0.1"] * 5000) + "-" + "*".join(["1.0001"] * 3000)
+    result = Calculator(optimize=True).calculate(expression)
+    assert result == pytest.approx(calculator.calculate(expression))
+    assert Calculator(optimize=True).calculate("x+0.2+0.3", x=0.1) == 0.6
+
+
+@pytest.mark.parametrize("expression", ["(10^200)*(10^200)*0*(1/0)", "1+2+(1/0)+(-1)!", "x*2"])
+def test_optimized_raises_same_exceptions(expression):
+    with pytest.raises(Exception) as default_error:
+        Calculator().compute(expression)
+    with pytest.raises(Exception) as optimized_error:
+        Calculator(optimize=True).compute(expression)
+    assert type(optimized_error.value) is type(default_error.value)
+
+
+# Test the streaming mode of main.py
+@pytest.mark.parametrize("output_format, expected", [
+    ("plain", "5.0\nError: Division by zero is not allowed.\nError: Invalid token '?':\n"),
+    ("tsv", "2+3\t5.0\t\t\n1/0\t\tDivisionByZeroException\tDivision by zero is not allowed.\n"
+            "2?\t\tInvalidTokenException\tInvalid token '?':\n"),
+])
+def test_stream_formats(output_format, expected):
+    import io
+    import main
+    out = io.StringIO()
+    assert main.stream(Calculator(), io.StringIO("2+3\n1/0\n2?\n"), out, output_format) == (3, 2)
+    assert out.getvalue() == expected
+
+
+def test_stream_jsonl():
+    import io
+    import json
+    import main
+    out = io.StringIO()
+    main.stream(Calculator(), ["5!#\n", "3+*\n"], out, "jsonl")
+    records = [json.loads(line) for line in out.getvalue().splitlines()]
+    assert records[0] == {"expression": "5!#", "result": 3, "error": None, "message": None}
+    assert records[1]["error"] == "MissingOperandException"
+
+
+# Test the asyncio service on localhost
+def test_server_batches_requests():
+    import asyncio
+    import server
+
+    async def scenario():
+        service = server.CalculatorServer(port=0, batch_delay=0.01)
+        await service.start()
+        try:
+            reader, writer = await asyncio.open_connection('127.0.0.1', service.port)
+            # Several requests on the same keep-alive connection
+            assert await server.request(reader, writer, {'expression': '(3!+2)^2'}) == (200, {
+                'expression': '(3!+2)^2', 'result': 64.0, 'error': None, 'message': None})
+            status, body = await server.request(reader, writer, {'expressions': ['x+1', '1/0'], 'variables': {'x': 2}})
+            assert status == 200
+            assert [r['result'] for r in body['results']] == [3.0, None]
+            assert body['results'][1]['error'] == 'DivisionByZeroException'
+            assert (await server.request(reader, writer, {'nothing': 1}))[0] == 400
+            assert (await server.request(reader, writer, None, method='GET', target='/health'))[0] == 200
+            writer.close()
+
+            # A malformed Content-Length is answered with 400 and the connection closed
+            for length in (b'abc', b'-5', b'+5', b'1_0'):
+                reader, writer = await asyncio.open_connection('127.0.0.1', service.port)
+                writer.write(b'POST /calculate HTTP/1.1\r\nContent-Length: ' + length + b'\r\n\r\n{}')
+                await writer.drain()
+                response = await reader.read()
+                assert response.startswith(b'HTTP/1.1 400 ') and b'Content-Length' in response.split(b'\r\n\r\n')[1]
+                writer.close()
+
+            # Concurrent requests are coalesced into fewer batches
+            batches = service.batches
+            results = await asyncio.gather(*(service.evaluate([f"{i}*2"]) for i in range(50)))
+            assert [r[0]['result'] for r in results] == [i * 2.0 for i in range(50)]
+            assert service.batches - batches < 50
+
+            stats = await server.load_test('127.0.0.1', service.port, ['1+1', '2*3'], requests=40,
+                                           concurrency=4, batch=3)
+            assert stats['requests'] == 40 and stats['failures'] == 0
+        finally:
+            await service.close()
+
+    asyncio.run(scenario())
+
+
+# Test the benchmark suite on tiny corpora
+def test_benchmark_run_and_compare():
+    from benchmarks.corpora import build_corpora
+    from benchmarks.runner import run, compare
+
+    corpora = build_corpora(scale=0.01)
+    report = run({'realistic': corpora['realistic'], 'invalid_heavy': corpora['invalid_heavy']}, repeat=1)
+    stages = report['results']['realistic']
+    assert set(stages) == {'tokenize', 'wrap_negatives', 'parse_tokens', 'parse_expression', 'evaluate_postfix',
+                           'calculate_cold', 'calculate_warm'}
+    assert all(metrics['calls'] > 0 for metrics in stages.values())
+
+    assert not any(row['regression'] for row in compare(report, report))
+    slower = {'results': {'realistic': {'tokenize': dict(stages['tokenize'], p50_us=stages['tokenize']['p50_us'] * 2)}}}
+    rows = compare(report, slower)
+    assert len(rows) == 1 and rows[0]['regression']
+
+
+# Test the opt-in profiling hooks
+def test_profiler_reports_stages_operators_and_errors():
+    calculator = Calculator()
+    with calculator.profile(Profiler(slowest=2)) as profiler:
+        assert calculator.compute("5!#+2") == 5.0
+        assert calculator.compute("5!#+2") == 5.0  # result cache hit
+        for expression in ("1/0", "3+*", ""):
+            with pytest.raises(CalculatorException):
+                calculator.compute(expression)
+    assert calculator.profiler is None and calculator.parser.profiler is None
+
+    report = profiler.report()
+    assert report['expressions'] == 5
+    assert report['stages']['tokenize']['calls'] == 3
+    assert report['stages']['evaluate']['calls'] == 3
+    assert report['operators']['FactorialOperator']['calls'] == 1
+    assert report['operators']['DivisionOperator']['calls'] == 1
+    assert report['exceptions'] == {'DivisionByZeroException': 1, 'MissingOperandException': 1,
+                                    'InvalidExpressionException': 1}
+    assert len(report['slowest']) == 2
+
+
+# Test the exact integer mode
+@pytest.mark.parametrize("expression, expected", [
+    ("1000!/998!", 999000),
+    ("171!/170!", 171),
+    ("2^64+1", 2 ** 64 + 1),
+    ("(2^64+1)-2^64", 1),
+    ("7/2", 3.5),
+    ("3@4", 3.5),
+    ("2@4", 3),
+    ("30!#", 117),
+    ("2^-1", 0.5),
+    ("2*-(3+4)", 2),
+    ("~--3", -3),
+])
+def test_exact_mode(expression, expected):
+    exact = Calculator(exact=True, compile_threshold=1)
+    result = exact.compute(expression)
+    assert result == expected and type(result) is type(expected)
+    # The function compiled on first use agrees with the bytecode
+    assert exact.machine.execute(exact.get_program(expression).code) == expected
+
+
+def test_exact_mode_limits():
+    exact = Calculator(exact=True)
+    assert exact.compute("3!!!") == math.factorial(720)
+    for expression in ("100000!", "10^400000", "(2^1100)*1.5"):
+        with pytest.raises(ResultTooLargeException):
+            exact.compute(expression)
+    # The float mode keeps its range
+    with pytest.raises(ResultTooLargeException):
+        Calculator().compute("1000!/998!")
+
+
+# Test the streaming evaluation of long expressions
+def test_evaluate_stream_matches_compute():
+    import io
+    expression = "(" + "+".join(f"2*-({i}+4)-~-3!%x" for i in range(500)) + ")^2#"
+    expected = calculator.compute(expression, x=7)
+    # Chunk boundaries fall inside numbers, names and between spaces
+    assert calculator.evaluate_stream(io.StringIO(expression), chunk_size=3, x=7) == expected
+    assert calculator.evaluate_stream(["1 2", " 3+", "4 ", "5"]) == 168.0
+
+
+@pytest.mark.parametrize("expression, exception", [
+    ("1/0", DivisionByZeroException),
+    ("(()", InvalidExpressionException),
+    ("~~2", ConsecutiveTildesException),
+    ("2+", MissingOperandException),
+    ("(2+3", MismatchedParenthesesException),
+])
+def test_evaluate_stream_errors(expression, exception):
+    with pytest.raises(exception):
+        calculator.evaluate_stream(iter(expression))
+
+
+def test_evaluate_stream_memory_is_bounded():
+    import tracemalloc
+
+    def chunks(count):
+        for i in range(count):
+            yield f"{i}*2-1+"
+        yield "0"
+
+    tracemalloc.start()
+    try:
+        assert calculator.evaluate_stream(chunks(2000)) == sum(i * 2 - 1 for i in range(2000))
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert peak < 64 * 1024
+
+
+# Test the structured results
+def test_evaluate_returns_structured_results(capsys):
+    ok = calculator.evaluate("2*x", x=3)
+    assert ok.ok and ok.value == 6.0 and ok.code == 0 and ok.message is None
+
+    failed = calculator.evaluate("1+2)")
+    assert not failed.ok and failed.value is None
+    assert failed.error_class is MismatchedParenthesesException and failed.code == MismatchedParenthesesException.code
+    assert failed.position == 3 and failed.expected
+    assert failed.message == "Mismatched parentheses:\n1+2)\n   ^"
+
+    unexpected = calculator.evaluate("0^-1")
+    assert unexpected.code == UNEXPECTED_ERROR_CODE and not unexpected.expected
+    assert capsys.readouterr().out == ""
+
+
+def test_error_messages_are_rendered_lazily(monkeypatch):
+    rendered = []
+    monkeypatch.setattr(MissingOperandException, 'render', lambda self: rendered.append(self) or "rendered")
+    result = calculator.evaluate("2+*3")
+    assert not rendered
+    assert result.message == "rendered" and len(rendered) == 1
+
+
+# Test the incremental edit session
+def test_edit_session_matches_full_evaluation():
+    from EditSession import EditSession
+
+    session = EditSession(Calculator(), "(1+2)*(3+(4-x))", x=1.0)
+    assert session.result.value == 18.0
+    edits = [
+        ((10, 10, "2"), "(1+2)*(3+(24-x))"),
+        ((0, 0, "2*-"), "2*-(1+2)*(3+(24-x))"),  # unary minus before '(' keeps its quirk
+        ((3, 3, "("), "2*-((1+2)*(3+(24-x))"),  # unbalanced
+        ((19, 19, ")"), "2*-((1+2)*(3+(24-x)))"),
+        ((14, 18, ""), "2*-((1+2)*(3+()))"),  # empty parentheses
+        ((14, 14, "5!"), "2*-((1+2)*(3+(5!)))"),
+    ]
+    for (start, end, replacement), text in edits:
+        result = session.edit(start, end, replacement)
+        assert session.text == text
+        expected = calculator.evaluate(text, x=1.0)
+        assert (result.value, result.error_class) == (expected.value, expected.error_class)
+
+
+def test_edit_session_only_tokenizes_the_edited_segment(monkeypatch):
+    from EditSession import EditSession
+
+    expression = "+".join(f"({i}*2-(3+{i}))" for i in range(200))
+    session = EditSession(Calculator(), expression)
+    tokenized = []
+    tokenize = session.parser.tokenize
+    monkeypatch.setattr(session.parser, 'tokenize', lambda text: tokenized.append(text) or tokenize(text))
+
+    position = expression.index("(3+150)") + 3
+    assert session.edit(position, position + 3, "7").value == calculator.compute(session.text)
+    assert tokenized == ["3+7"]
+
+
+# Test the shared subexpression memo
+def test_subexpression_memo_shares_subterms():
+    from SubexpressionMemo import SubexpressionMemo
+
+    memo = SubexpressionMemo()
+    first, second = Calculator(memo=memo), Calculator(memo=memo)
+    assert first.compute("((3!+2)^2+1)*2") == 130.0
+    saved = memo.stats()['saved_evaluations']
+    # The shared factor is found again from another calculator, operands swapped
+    assert second.compute("3-(1+(2+3!)^2)") == -62.0
+    assert memo.stats()['saved_evaluations'] == saved + 4
+    assert memo.intern((first.parser.operators['+'], 1, 2)) != memo.intern((first.parser.operators['+'], 2, 1))
+
+    # Ties of '$' and '&' keep the operand order of the expression
+    assert first.compute("3!$6") == 6 and type(first.compute("3!$6")) is int
+    assert type(first.compute("6$3!")) is float
+    assert first.compute("x*2+(3!)", x=2) == 10.0
+
+
+@pytest.mark.parametrize("expression", ["1/0", "3+*", "y+1"])
+def test_subexpression_memo_raises_same_exceptions(expression):
+    from SubexpressionMemo import SubexpressionMemo
+
+    with pytest.raises(type(calculator.evaluate(expression).error)):
+        Calculator(memo=SubexpressionMemo()).compute(expression)
+
+
+# Test the multi-process batch entry point
+def test_split_ranges_are_line_aligned():
+    from batch import split_ranges
+
+    data = b"1+1\n22*3\n\n4!\n5"
+    ranges = split_ranges(data, 4)
+    assert ranges[0][0] == 0 and ranges[-1][1] == len(data)
+    assert all(data[end - 1:end] == b"\n" for _, end in ranges[:-1])
+    assert all(a[1] == b[0] for a, b in zip(ranges, ranges[1:]))
+
+
+def test_run_batch_keeps_input_order(tmp_path):
+    import io
+    import main
+    from batch import run_batch
+
+    lines = [f"{i}*2+3!" if i % 5 else "1/0" for i in range(300)]
+    source = tmp_path / "input.txt"
+    source.write_text("\n".join(lines) + "\n")
+    expected = io.StringIO()
+    main.stream(Calculator(), lines, expected, "jsonl")
+
+    assert run_batch(str(source), str(tmp_path / "output.jsonl"), workers=2, output_format="jsonl") == (300, 60)
+    assert (tmp_path / "output.jsonl").read_text() == expected.getvalue()
+    assert not list(tmp_path.glob(".batch-*"))
+
+
+# Test the one-shot command line and the daemon
+def test_one_shot_imports_only_what_it_needs():
+    import subprocess
+    import sys
+
+    code = "import sys, main; status = main.main(['-e', '2*(3+4)']); print(sorted(sys.modules)); sys.exit(status)"
+    done = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    result, modules = done.stdout.splitlines()
+    assert result == "14.0"
+    for module in ('argparse', 'json', 'asyncio', 'socket', 'ExpressionTree', 'Profiler'):
+        assert repr(module) not in modules
+
+
+def test_daemon_answers_one_shot_clients(tmp_path, capsys):
+    import os
+    import threading
+    import time
+    import daemon
+    import main
+
+    path = str(tmp_path / "calculator.sock")
+    threading.Thread(target=daemon.serve, args=(path,), daemon=True).start()
+    for _ in range(100):
+        if os.path.exists(path):
+            break
+        time.sleep(0.02)
+    assert daemon.send(path, "(3!+2)^2") == "64.0\n"
+    assert main.main(['-e', '1/0', '--socket', path]) == 1
+    assert capsys.readouterr().out == "Error: Division by zero is not allowed.\n"
+    # Without a daemon the expression is evaluated locally
+    assert main.main(['-e', '5!', '--socket', str(tmp_path / "missing.sock")]) == 0
+    assert capsys.readouterr().out == "120\n"
+
+
+# Test the thread-safe calculator
+def test_concurrent_calculator_coalesces_identical_expressions(monkeypatch):
+    import threading
+    import time
+    from ConcurrentCalculator import ConcurrentCalculator
+
+    calc = ConcurrentCalculator()
+    parse = calc.parser.parse_expression
+    calls = []
+
+    def slow_parse(expression):
+        calls.append(expression)
+        time.sleep(0.05)
+        return parse(expression)
+
+    monkeypatch.setattr(calc.parser, "parse_expression", slow_parse)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(calc.evaluate("2+3*4"))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert calls == ["2+3*4"]
+    assert [result.value for result in results] == [14.0] * 8
+    with pytest.raises(DivisionByZeroException):
+        calc.compute("1/0")
+
+
+def test_concurrent_calculator_has_no_races():
+    from ConcurrentCalculator import ConcurrentCalculator
+    from benchmarks.corpora import build_corpora
+    from benchmarks.threads import stress
+
+    corpus = [expression for expressions in build_corpora(scale=0.1).values() for expression in expressions]
+    report = stress(corpus, thread_counts=(1, 4), repeat=3)
+    assert all(row['mismatches'] == 0 for row in report['results'].values())
+
+    calc = ConcurrentCalculator(max_workers=3)
+    results = calc.calculate_many((f"{i}*x" for i in range(100)), x=2)
+    assert [result.value for result in results] == [2.0 * i for i in range(100)]
+
+
+def test_concurrent_calculator_accepts_calculator_options(tmp_path):
+    from ConcurrentCalculator import ConcurrentCalculator
+    from CostAnalysis import Budget
+    from ProgramStore import ProgramStore
+    from SubexpressionMemo import SubexpressionMemo
+    from exceptions import BudgetExceededException
+
+    with ProgramStore(str(tmp_path / "programs.db")) as store:
+        calc = ConcurrentCalculator(max_workers=2, bounds={"x": (0.0, 1.0)}, store=store,
+                                    budget=Budget(max_cost=1e6), engine="pratt")
+        results = calc.calculate_many(["2*-(3+4)", "x*10^300", "170!^170!"], x=0.5)
+        assert [result.value for result in results[:2]] == [2.0, 5e299]
+        assert isinstance(results[2].error, BudgetExceededException)
+        assert len(store) == 3
+    with pytest.raises(ValueError):
+        ConcurrentCalculator(memo=SubexpressionMemo())
+
+
+# Test the range analysis and the unchecked evaluation of safe programs
+@pytest.mark.parametrize("expression, bounds, expected", [
+    ("2*3+x", {}, (-math.inf, math.inf)),
+    ("x*y", {}, None),
+    ("x*10^300", {"x": (0.0, 1.0)}, (0.0, 1e300)),
+    ("x/(y-1)", {"x": (0.0, 1.0), "y": (2.0, 3.0)}, (0.0, 1.0)),
+    ("x/(y-1)", {"x": (0.0, 1.0), "y": (0.0, 3.0)}, None),
+    ("x^2", {"x": (-1.0, 1.0)}, None),
+    ("x^2", {"x": (0.5, 2.0)}, (0.25, 4.0)),
+    ("x!", {"x": (3.0, 3.0)}, None),
+    ("3!+x%2", {}, (6.0, 8.0)),
+    ("1/0+x", {}, None),
+])
+def test_range_analysis(expression, bounds, expected):
+    from RangeAnalysis import analyze
+    interval = analyze(calculator.parser.parse_expression(expression), calculator.parser.operators, bounds)
+    if expected is None:
+        assert interval is None
+    else:
+        assert interval == pytest.approx(expected)
+
+
+@pytest.mark.parametrize("expression, variables", [
+    ("x*10^300", {"x": 0.5}),
+    ("x*10^300", {"x": 1e9}),          # Out of bounds: the checked path raises
+    ("x+x", {"x": 1e308}),            # Infinite final value: checked again
+    ("x/(y-1)", {"x": 1.0, "y": 1.0}),
+    ("(x@y)^x", {"x": 0.5, "y": 3.0}),
+])
+def test_unchecked_programs_match_checked(expression, variables):
+    bounds = {"x": (0.0, 1.0), "y": (2.0, 3.0)}
+    fast = Calculator(bounds=bounds, compile_threshold=1)
+    checked = Calculator(compile_threshold=0)
+    for _ in range(2):
+        a, b = fast.evaluate(expression, **variables), checked.evaluate(expression, **variables)
+        assert (a.ok, a.value, a.code, a.message) == (b.ok, b.value, b.code, b.message)
+
+
+# Test the numeric kernels against the definitions they replace
+@pytest.mark.parametrize("value", [
+    0.0, -0.0, 7.0, 12.5, 0.1, 1e-4, 9.999999999999999e-05, 9999999999999998.0, 1e16, 2.0 ** 53 + 2,
+    math.inf, math.nan, 5, 123456789012345678901234567890, math.factorial(170),
+])
+def test_digit_sum_kernel_matches_text_definition(value):
+    import kernels
+    text = str(value)
+    assert kernels.is_scientific(value) == ('e' in text.lower())
+    if not kernels.is_scientific(value):
+        assert kernels.digit_sum(value) == sum(int(digit) for digit in text if digit.isdigit())
+
+
+def test_factorial_kernel_and_benchmarks():
+    import kernels
+    from benchmarks.kernels import run
+    assert kernels.factorial(5.0) == 120 and kernels.factorial(170) == math.factorial(170)
+    assert kernels.factorial(5.5) is None and kernels.factorial(-1.0) is None and kernels.factorial(171.0) is None
+    assert all(metrics['kernel_ns'] > 0 for metrics in run(number=10).values())
+
+
+# Test the persistent program store
+def test_program_store_warm_start(tmp_path):
+    import subprocess
+    import sys
+    from ProgramStore import ProgramStore
+    path = str(tmp_path / "programs.db")
+    corpus = ["2+3*4", "x^2-~y", "5!", "(1+2", "", "3 $ 4 @ 2"]
+    with ProgramStore(path) as store:
+        assert Calculator(store=store).warm(corpus) == 4
+        assert len(store) == 4
+
+    # Another process parses nothing: every program comes from the store
+    code = ("from Calculator import Calculator; from ProgramStore import ProgramStore\n"
+            f"store = ProgramStore({path!r}); calculator = Calculator(store=store)\n"
+            "print(calculator.compute('2 + 3*4'), calculator.compute('x^2-~y', x=3, y=1), store.hits, store.misses)")
+    done = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    assert done.stdout.split() == ["14.0", "10.0", "2", "0"]
+
+    with ProgramStore(path) as store:
+        exact = Calculator(exact=True, store=store)
+        assert exact.compute("5!") == 120 and store.misses == 1
+        assert Calculator(exact=True, store=store).compute("5!") == 120 and store.hits == 1
+
+
+def test_program_store_invalidated_by_operator_changes(tmp_path, monkeypatch):
+    from Operators import OPERATORS
+    from ProgramStore import ProgramStore
+    path = str(tmp_path / "programs.db")
+    with ProgramStore(path) as store:
+        Calculator(store=store).warm(["2+3*4"])
+    with ProgramStore(path) as store:
+        assert len(store) == 1
+    monkeypatch.setattr(OPERATORS['+'], 'precedence', 9)
+    with ProgramStore(path) as store:
+        assert len(store) == 0
+
+
+# Test the static cost estimates and the admission budgets
+@pytest.mark.parametrize("expression, exact, tokens, depth, stack_depth, bounded", [
+    ("2+3*4", False, 5, 3, 3, True),
+    ("3!^3!", False, 5, 3, 2, True),
+    ("170!^170!", False, 5, 3, 2, False),
+    ("(x+1)!^(x+1)!", False, 9, 4, 3, False),
+    ("170!^170!", True, 5, 3, 2, True),  # Exact powers check their size first
+    ("x^y#", True, 4, 3, 2, True),
+])
+def test_cost_estimates(expression, exact, tokens, depth, stack_depth, bounded):
+    from CostAnalysis import estimate
+    parser = Calculator(exact=exact).parser
+    result = estimate(parser.parse_expression(expression), parser.operators, exact)
+    assert (result.tokens, result.depth, result.stack_depth) == (tokens, depth, stack_depth)
+    assert math.isfinite(result.cost) == bounded
+
+
+def test_budgets_reject_expressions_early():
+    from CostAnalysis import Budget
+    from exceptions import BudgetExceededException
+    budgeted = Calculator(budget=Budget(max_tokens=50, max_depth=10, max_cost=1e6, deadline=10.0))
+    assert budgeted.compute("2+3*x", x=2) == 8.0
+    for expression, limit in [("170!^170!", 'cost'), ("+".join(["1"] * 30), 'tokens'), ("-" * 12 + "1", 'depth')]:
+        with pytest.raises(BudgetExceededException) as info:
+            budgeted.compute(expression)
+        assert info.value.limit == limit and info.value.code == 13
+
+    long_expression = "+".join(["x"] * 2000)
+    with pytest.raises(BudgetExceededException, match="deadline"):
+        Calculator(budget=Budget(deadline=1e-9)).compute(long_expression, x=1.0)
+
+
+def test_explain_prints_every_subexpression(capsys):
+    subtrees = Calculator().explain("(1+x)!#")
+    assert [text for text, _ in subtrees] == ["1", "x", "(1 + x)", "(1 + x)!", "(1 + x)!#"]
+    assert "(1 + x)!#" in capsys.readouterr().out
+
+
+# Test the precedence-climbing parser against the shunting-yard
+def _generate_expression(rng, depth):
+    choice = rng.random()
+    if depth <= 0 or choice < 0.3:
+        text = rng.choice(["1", "2", "3.5", "0", "x", "y"])
+    elif choice < 0.45:
+        text = "(" + _generate_expression(rng, depth - 1) + ")"
+    elif choice < 0.55:
+        text = "-" * rng.randint(1, 3) + _generate_expression(rng, depth - 1)
+    elif choice < 0.62:
+        text = "~" + _generate_expression(rng, depth - 1)
+    elif choice < 0.72:
+        text = _generate_expression(rng, depth - 1) + rng.choice(["!", "#", "!!", "#!"])
+    else:
+        text = _generate_expression(rng, depth - 1) + rng.choice("+-*/^%$&@") + _generate_expression(rng, depth - 1)
+    if rng.random() < 0.05:
+        # Break some expressions, so that errors are compared too
+        middle = len(text) // 2
+        text = text[:middle] + rng.choice(["(", ")", "-", "~", "!", "*", " ", "?"]) + text[middle:]
+    return text
+
+
+@pytest.mark.parametrize("exact", [False, True])
+def test_pratt_parser_matches_shunting_yard(exact):
+    import random
+    from ExpressionParser import ExpressionParser
+    from PrattParser import PrattParser
+
+    def outcome(parser, expression):
+        try:
+            return parser.parse_expression(expression)
+        except Exception as e:
+            return type(e), str(e)
+
+    rng = random.Random(2024)
+    shunting_yard, pratt = ExpressionParser(exact), PrattParser(exact)
+    expressions = [_generate_expression(rng, rng.randint(1, 6)) for _ in range(3000)]
+    expressions += ["2*-(3+4)", "2^-2^2", "~5!", "-2^2", "~-3!", "2*-(~3!)", "(" * 2000 + "1" + ")" * 2000]
+    for expression in expressions:
+        assert outcome(pratt, expression) == outcome(shunting_yard, expression), expression
+
+
+def test_pratt_engine_and_benchmarks():
+    from benchmarks.parsers import run
+    pratt = Calculator(engine="pratt")
+    assert pratt.calculate("2*-(3+4)") == 2.0 and pratt.calculate("2^-2^2") == 16.0
+    assert pratt.calculate("-3!") == -6.0 and pratt.calculate("~5!") is None
+    with pytest.raises(ValueError):
+        Calculator(engine="recursive-descent")
+    assert all(metrics['pratt_ms'] > 0 for metrics in run({"sample": ["2+3", "-(4)!", "2*"]}, repeat=1).values())
+
+
+# Test the parallel evaluation of large expressions
+@pytest.mark.parametrize("expression, variables", [
+    ("(2000!#+1)*(2001!#) - 2002!#/3 + 2003!#", {}),
+    ("(1/0 + 2000!#) + (5.5! + 2001!#)", {}),        # The first error in source order wins
+    ("(5.5! + 2000!#) + (1/0 + 2001!#)", {}),
+    ("(2000!# + (0-1)!) $ (x + 2001!#)", {}),
+    ("(2000!#) & (x + 2001!#)", {"x": 2.5}),
+    ("(2000!#) & (y + 2001!#)", {"x": 2.5}),         # Undefined variable in a subtree
+    ("2000!^2000! + 2001!#", {}),
+])
+def test_parallel_evaluation_matches_sequential(expression, variables):
+    from concurrent.futures import ProcessPoolExecutor
+    from ParallelEvaluator import ParallelEvaluator
+    exact = Calculator(exact=True)
+    expected = Calculator(exact=True, compile_threshold=0).evaluate(expression, **variables)
+    with ProcessPoolExecutor(2) as pool:
+        evaluator = ParallelEvaluator(exact, executor=pool, min_cost=100)
+        assert len(evaluator.partition(exact.get_program(expression).postfix)) >= 2
+        try:
+            outcome = (True, exact.evaluate_parallel(expression, evaluator, **variables))
+        except Exception as e:
+            outcome = (False, type(e), str(e))
+    assert outcome == ((True, expected.value) if expected.ok else (False, expected.error_class, expected.message))
+
+
+@pytest.mark.parametrize("expression", ["1/0+", "(1/0)*", "3!!!!+", "2 3 x", "~", "5+*2"])
+def test_budgets_keep_the_errors_of_malformed_expressions(expression):
+    from CostAnalysis import Budget
+    for budget in (Budget(max_cost=1e9), Budget(max_cost=1e9, deadline=10.0)):
+        budgeted = Calculator(budget=budget).evaluate(expression)
+        plain = Calculator().evaluate(expression)
+        assert not plain.ok and budgeted.error_class is plain.error_class
+
+
+def test_budgets_charge_malformed_expressions_for_their_operands():
+    from CostAnalysis import Budget
+    from exceptions import BudgetExceededException
+    budgeted = Calculator(budget=Budget(max_cost=1e6))
+    for expression in ["170!^170!+", "(170!^170!)*", "2+170!^170!+"]:
+        with pytest.raises(BudgetExceededException):
+            budgeted.compute(expression)
+
+
+def test_budgets_apply_while_profiling():
+    from CostAnalysis import Budget
+    from exceptions import BudgetExceededException
+    budgeted = Calculator(budget=Budget(max_tokens=3))
+    with budgeted.profile() as profiler:
+        assert budgeted.compute("1+2") == 3.0
+        with pytest.raises(BudgetExceededException):
+            budgeted.compute("1+2+4")
+    assert profiler.exceptions["BudgetExceededException"] == 1
+    timed = Calculator(budget=Budget(deadline=1e-9))
+    with timed.profile():
+        with pytest.raises(BudgetExceededException, match="deadline"):
+            timed.compute("+".join(["x"] * 2000), x=1.0)
+
+
+def test_budgets_apply_before_constant_folding():
+    from CostAnalysis import Budget
+    from exceptions import BudgetExceededException
+    for budget in (Budget(max_cost=1e6), Budget(max_cost=1e6, deadline=10.0)):
+        budgeted = Calculator(budget=budget, optimize=True)
+        assert budgeted.compute("2*3+x", x=1) == 7.0
+        assert (budgeted.get_program("2*3+x").tree is None) == (budget.deadline is not None)
+        for expression in ["170!^170!", "1+170!^170!+"]:
+            with pytest.raises(BudgetExceededException):
+                budgeted.compute(expression)
+
+
+# Test that optimized trees keep the size limit of exact mode
+@pytest.mark.parametrize("expression", [
+    "2^1048575+2^1048575+2^1048575",
+    "2^1048575+(2^1048575+2^1048575)",
+    "2^1048575+2^1048575-1",
+    "2^700000*2^200000*2^200000",
+    "2^1048574+2^1048574+1",         # Just under the limit
+    "2^500000*2^500000*2^48575",     # Exactly at the limit
+])
+def test_exact_optimized_trees_keep_the_size_limit(expression):
+    optimized = Calculator(exact=True, optimize=True).evaluate(expression)
+    plain = Calculator(exact=True, compile_threshold=0).evaluate(expression)
+    assert (optimized.ok, optimized.error_class) == (plain.ok, plain.error_class)
+    if plain.ok:
+        assert optimized.value == plain.value